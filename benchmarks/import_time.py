@@ -0,0 +1,67 @@
+# Purpose: Measure the startup cost of importing the package in fresh interpreters
+# Author: Ian St. Laurent
+
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Statements timed on their own, each in a new interpreter
+IMPORT_STATEMENTS = {
+    'import_package': 'import river_change_analysis',
+    'import_river': 'from river_change_analysis import River',
+    'import_stack': 'from river_change_analysis import RiverStack',
+}
+# Heavy dependencies reported when an import statement loads them
+HEAVY_MODULES = ('ee', 'googleapiclient', 'matplotlib', 'skimage', 'scipy', 'cv2', 'shapely', 'rasterio')
+
+_PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+exec({statement!r})
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'modules': sorted(m for m in {heavy!r} if m in sys.modules)}}))
+'''
+
+
+def measure_import(statement, repeat=5):
+    """
+    Time an import statement in new interpreters, so nothing is cached in sys.modules.
+    Args:
+        statement (str): The import statement.
+        repeat (int): Number of interpreters; the fastest run is kept.
+    Returns:
+        dict: The best time in seconds and the heavy dependencies the statement loaded.
+    """
+    environment = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    best = None
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', _PROBE.format(statement=statement, heavy=HEAVY_MODULES)],
+                                capture_output=True, text=True, check=True, env=environment).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        if best is None or result['seconds'] < best['seconds']:
+            best = result
+    return best
+
+
+def run(repeat=5):
+    """
+    Time every import statement.
+    Args:
+        repeat (int): Number of interpreters per statement.
+    Returns:
+        list: One result dictionary per statement, in the format of run_benchmarks.
+    """
+    results = []
+    for name, statement in IMPORT_STATEMENTS.items():
+        result = measure_import(statement, repeat)
+        results.append({'dataset': 'import', 'stage': name, 'seconds': result['seconds'], 'cpu_seconds': None,
+                        'peak_bytes': None, 'output_bytes': 0, 'masks': 0, 'pixels': 0,
+                        'modules': result['modules']})
+        print(f"{'import':>22} {name:>20} {result['seconds']:10.3f} s   loads {', '.join(result['modules']) or 'nothing heavy'}")
+    return results
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,287 @@
+# Purpose: Time and measure the peak memory of every River pipeline stage
+# Author: Ian St. Laurent
+"""
+Run the benchmarks and store the results under benchmarks/results/<commit>.json:
+
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --quick --compare <commit>
+
+Each stage runs on the bundled Athabasca reaches and on synthetic meandering masks.
+Wall time is the best of --repeat runs; peak memory is measured with tracemalloc in
+a separate run, so its overhead does not distort the timings.
+"""
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from skimage.morphology import thin
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from river_change_analysis.river import River, MAX_DISTANCE_BRANCH_REMOVAL, WATER_MASK_MIN_SIZE  # noqa: E402
+from synthetic import write_masks  # noqa: E402
+import import_time  # noqa: E402
+
+RESULTS_FOLDER = os.path.join(ROOT, 'benchmarks', 'results')
+DATA_FOLDER = os.path.join(ROOT, 'benchmarks', '.data')
+REACH_FOLDERS = [os.path.join(ROOT, 'binary_river_masks', 'Athabasca_Reach_1'),
+                 os.path.join(ROOT, 'binary_river_masks', 'Athabasca_Reach_2')]
+SYNTHETIC_SIZES = (512, 1024, 2048, 4096, 8192, 16384)
+QUICK_SYNTHETIC_SIZES = (512, 1024, 2048)
+SYNTHETIC_YEARS = 3
+# A stage this much slower than the baseline is reported as a regression
+REGRESSION_RATIO = 1.2
+
+
+def _nbytes(value):
+    return int(getattr(value, 'nbytes', 0) or 0)
+
+
+def _load_mask(rivers):
+    for river in rivers:
+        river.load_mask()
+    return sum(_nbytes(river.mask) for river in rivers)
+
+
+def _water_mask_process(rivers):
+    River.water_mask_process(rivers, WATER_MASK_MIN_SIZE)
+    return sum(_nbytes(river.watermask) for river in rivers)
+
+
+def _process_centerline(rivers):
+    River.process_centerline(rivers, MAX_DISTANCE_BRANCH_REMOVAL)
+    return sum(_nbytes(river.centerline) for river in rivers)
+
+
+def _thin(rivers):
+    for river in rivers:
+        river.centerline = thin(np.asarray(river.watermask))
+
+
+def _prune_centerline(rivers):
+    for river in rivers:
+        river._prune_centerline(MAX_DISTANCE_BRANCH_REMOVAL)
+    return sum(_nbytes(river.centerline) for river in rivers)
+
+
+def _quantify_erosion(rivers):
+    River.quantify_erosion(rivers)
+    return 0
+
+
+def _render(rivers):
+    with tempfile.TemporaryDirectory() as folder:
+        River.plot_centerline(rivers, file_path=os.path.join(folder, 'centerline.png'))
+    return 0
+
+
+def _restore_centerlines(rivers):
+    # Later stages expect the processed centerline, not the bare skeleton
+    River.process_centerline(rivers, MAX_DISTANCE_BRANCH_REMOVAL)
+
+
+# (name, setup, stage, teardown), run in this order on the same River objects
+STAGES = [
+    ('load_mask', None, _load_mask, None),
+    ('water_mask_process', None, _water_mask_process, None),
+    ('process_centerline', None, _process_centerline, None),
+    ('_prune_centerline', _thin, _prune_centerline, _restore_centerlines),
+    ('quantify_erosion', None, _quantify_erosion, None),
+    ('render', None, _render, None),
+]
+
+
+def measure(rivers, setup, stage, repeat):
+    """
+    Measure one stage on a list of River objects.
+    Args:
+        rivers (list): The River objects.
+        setup (callable): Called before every run, outside the measurement, or None.
+        stage (callable): The stage. Returns the size in bytes of the arrays it produced.
+        repeat (int): Number of timed runs.
+    Returns:
+        dict: Best wall time, CPU time of that run, peak traced memory and output size.
+    """
+    best = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup(rivers)
+        wall, cpu = time.perf_counter(), time.process_time()
+        output_bytes = stage(rivers)
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        if best is None or wall < best[0]:
+            best = (wall, cpu)
+    if setup is not None:
+        setup(rivers)
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    stage(rivers)
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    return {'seconds': best[0], 'cpu_seconds': best[1], 'peak_bytes': int(peak), 'output_bytes': output_bytes}
+
+
+def datasets(sizes, reaches=True):
+    """
+    List the datasets to benchmark, generating the synthetic masks if needed.
+    Args:
+        sizes (list): Sizes of the synthetic masks in pixels.
+        reaches (bool): Include the bundled Athabasca reaches.
+    Returns:
+        list: (name, list of mask files) tuples.
+    """
+    found = []
+    if reaches:
+        for folder in REACH_FOLDERS:
+            file_paths = sorted(glob.glob(os.path.join(folder, '*river_mask*.tif')))
+            if file_paths:
+                found.append((os.path.basename(folder), file_paths))
+    for size in sizes:
+        found.append((f'synthetic_{size}', write_masks(DATA_FOLDER, size, SYNTHETIC_YEARS)))
+    return found
+
+
+def run(sizes, reaches=True, repeat=1, stages=None):
+    """
+    Run every stage on every dataset.
+    Args:
+        sizes (list): Sizes of the synthetic masks in pixels.
+        reaches (bool): Include the bundled Athabasca reaches.
+        repeat (int): Number of timed runs of each stage.
+        stages (list): Names of the stages to report. Defaults to all of them.
+    Returns:
+        list: One result dictionary per dataset and stage.
+    """
+    results = []
+    for name, file_paths in datasets(sizes, reaches):
+        rivers = [River(file_path) for file_path in file_paths]
+        for stage_name, setup, stage, teardown in STAGES:
+            # Every stage still runs so the next ones get their inputs
+            if stages is not None and stage_name not in stages:
+                if setup is None:
+                    stage(rivers)
+                continue
+            result = measure(rivers, setup, stage, repeat)
+            if teardown is not None:
+                teardown(rivers)
+            result.update(dataset=name, stage=stage_name, masks=len(rivers), pixels=int(np.asarray(rivers[0].mask).size))
+            results.append(result)
+            print(f"{name:>22} {stage_name:>20} {result['seconds']:10.3f} s {result['peak_bytes'] / 1024**2:10.1f} MiB")
+        River.cache.clear()
+    return results
+
+
+def commit():
+    """
+    Get the current git commit, marked dirty if the tree has uncommitted changes.
+    Returns:
+        str: The short commit hash, or 'unknown' outside a git repository.
+    """
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                  text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return revision + ('-dirty' if status else '')
+
+
+def save(results, folder=RESULTS_FOLDER):
+    """
+    Store the results of a run, keyed by commit.
+    Args:
+        results (list): The results of run.
+        folder (str): Folder of the result files.
+    Returns:
+        str: Path of the result file.
+    """
+    os.makedirs(folder, exist_ok=True)
+    revision = commit()
+    report = {
+        'commit': revision,
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.platform(),
+        'cpus': os.cpu_count(),
+        'results': results,
+    }
+    file_path = os.path.join(folder, revision + '.json')
+    with open(file_path, 'w') as file:
+        json.dump(report, file, indent=2)
+    return file_path
+
+
+def compare(results, baseline, ratio=REGRESSION_RATIO):
+    """
+    Print the timings next to a baseline result file and list the regressions.
+    Args:
+        results (list): The results of run.
+        baseline (str): A commit with a stored result file, or the path to one.
+        ratio (float): Slowdown above which a stage counts as a regression.
+    Returns:
+        list: (dataset, stage, slowdown) tuples of the regressions.
+    """
+    file_path = baseline if os.path.exists(baseline) else os.path.join(RESULTS_FOLDER, baseline + '.json')
+    with open(file_path) as file:
+        report = json.load(file)
+    previous = {(result['dataset'], result['stage']): result for result in report['results']}
+    regressions = []
+    print(f"\nCompared with {report['commit']}:")
+    for result in results:
+        old = previous.get((result['dataset'], result['stage']))
+        if old is None or old['seconds'] <= 0:
+            continue
+        slowdown = result['seconds'] / old['seconds']
+        flag = '  REGRESSION' if slowdown > ratio else ''
+        print(f"{result['dataset']:>22} {result['stage']:>20} {old['seconds']:10.3f} s -> "
+              f"{result['seconds']:10.3f} s ({slowdown:5.2f}x){flag}")
+        if slowdown > ratio:
+            regressions.append((result['dataset'], result['stage'], slowdown))
+    return regressions
+
+
+def main(args=None):
+    """
+    Command line entry point.
+    Args:
+        args (list): Command line arguments. Defaults to sys.argv.
+    Returns:
+        int: 1 if a regression was found, 0 otherwise.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the River Change Analysis pipeline.")
+    parser.add_argument('--sizes', type=int, nargs='*', help="Sizes of the synthetic masks in pixels.")
+    parser.add_argument('--quick', action='store_true', help="Only use synthetic masks up to 2048 pixels.")
+    parser.add_argument('--no-reaches', action='store_true', help="Skip the bundled Athabasca reaches.")
+    parser.add_argument('--stages', nargs='*', help="Only report these stages.")
+    parser.add_argument('--repeat', type=int, default=1, help="Number of timed runs of each stage.")
+    parser.add_argument('--compare', help="A commit or result file to compare with.")
+    parser.add_argument('--no-save', action='store_true', help="Do not store the results.")
+    options = parser.parse_args(args)
+    sizes = options.sizes if options.sizes is not None else (QUICK_SYNTHETIC_SIZES if options.quick else SYNTHETIC_SIZES)
+    results = []
+    if options.stages is None or set(options.stages) & set(import_time.IMPORT_STATEMENTS):
+        results.extend(result for result in import_time.run()
+                       if options.stages is None or result['stage'] in options.stages)
+    results.extend(run(sizes, not options.no_reaches, max(options.repeat, 1), options.stages))
+    if not options.no_save:
+        print(f"Results stored in {save(results)}")
+    if options.compare:
+        return 1 if compare(results, options.compare) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
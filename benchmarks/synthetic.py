@@ -0,0 +1,78 @@
+# Purpose: Generate synthetic meandering river masks of any size for the benchmarks
+# Author: Ian St. Laurent
+
+import os
+import numpy as np
+import rasterio
+from affine import Affine
+
+# Rows generated at a time, so a 16k x 16k mask never needs full size temporaries
+_BLOCK_ROWS = 1024
+
+
+def meander_mask(size, year=0, seed=0):
+    """
+    Draw a meandering channel flowing from the top to the bottom of a square mask,
+    with mid-channel islands and small ponds beside it. Increasing the year shifts and
+    grows the meanders, so consecutive years show erosion and accretion.
+    Args:
+        size (int): Width and height of the mask in pixels.
+        year (int): Offset of the year from the first year.
+        seed (int): Seed of the random islands and ponds.
+    Returns:
+        np.ndarray: A (size, size) uint8 mask with 1 for water.
+    """
+    rng = np.random.default_rng(seed)
+    width = max(size / 64, 6)
+    wavelength = size / 3
+    amplitude = size / 8 * (1 + 0.02 * year)
+    phase = 0.15 * year
+    rows = np.arange(size)
+    center = (size / 2 + amplitude * np.sin(2 * np.pi * rows / wavelength + phase)
+              + amplitude / 4 * np.sin(6 * np.pi * rows / wavelength + 2 * phase))
+    cols = np.arange(size, dtype=np.float32)
+    mask = np.empty((size, size), dtype=np.uint8)
+    for row in range(0, size, _BLOCK_ROWS):
+        block_center = center[row:row + _BLOCK_ROWS, None].astype(np.float32)
+        mask[row:row + _BLOCK_ROWS] = np.abs(cols - block_center) < width / 2
+    # Islands inside the channel and ponds beside it, both small enough to be cleaned up
+    n_features = max(size // 128, 4)
+    for row in rng.integers(0, size, n_features):
+        radius = int(max(width / 6, 1))
+        col = int(center[row])
+        mask[max(row - radius, 0):row + radius, max(col - radius, 0):col + radius] = 0
+    for row in rng.integers(0, size, n_features):
+        radius = int(max(width / 4, 2))
+        col = int(center[row] + 2 * width * rng.choice([-1, 1]))
+        if 0 <= col < size:
+            mask[max(row - radius, 0):row + radius, max(col - radius, 0):col + radius] = 1
+    return mask
+
+
+def write_masks(folder, size, years, seed=0, first_year=2000):
+    """
+    Write synthetic masks as GeoTIFF files named like the exported river masks.
+    Files that already exist are reused.
+    Args:
+        folder (str): Output folder.
+        size (int): Width and height of the masks in pixels.
+        years (int): Number of years to write.
+        seed (int): Seed of the random islands and ponds.
+        first_year (int): Year of the first mask.
+    Returns:
+        list: Paths of the mask files, sorted by year.
+    """
+    os.makedirs(folder, exist_ok=True)
+    file_paths = []
+    for offset in range(years):
+        file_path = os.path.join(folder, f'Synthetic_{size}_seed{seed}_river_mask{first_year + offset}.tif')
+        if not os.path.exists(file_path):
+            profile = dict(driver='GTiff', dtype='uint8', count=1, width=size, height=size, compress='deflate',
+                           tiled=True, blockxsize=256, blockysize=256, crs='EPSG:32612',
+                           transform=Affine(30, 0, 500000, 0, -30, 6500000))
+            temporary_path = file_path + '.tmp'
+            with rasterio.open(temporary_path, 'w', **profile) as dataset:
+                dataset.write(meander_mask(size, offset, seed), 1)
+            os.replace(temporary_path, file_path)
+        file_paths.append(file_path)
+    return file_paths
@@ -5,11 +5,55 @@ __author__ = """Ian St. Laurent"""
 __email__ = 'ianstlaurent7@gmail.com'
 __version__ = '0.3.0'
 
-from .mask import mask_import
-from .river import River
-from .gee_extraction import define_roi
-from .gee_extraction import process_images
-from .gee_extraction import import_dem
-from .google_drive_extraction import download_files_from_drive
+import importlib
 
+# Public names and the submodule defining each. Submodules, and their dependencies
+# such as Earth Engine, matplotlib or scikit-image, are only imported on first use.
+_LAZY_NAMES = {
+    'mask_import': 'mask',
+    'MaskCatalog': 'mask',
+    'River': 'river',
+    'SkeletonGraph': 'skeleton',
+    'define_roi': 'gee_extraction',
+    'process_images': 'gee_extraction',
+    'import_dem': 'gee_extraction',
+    'download_files_from_drive': 'google_drive_extraction',
+    'DriveSync': 'google_drive_extraction',
+    'process_rivers': 'batch',
+    'RiverStack': 'stack',
+    'load_multiband': 'stack',
+    'PackedMask': 'packed',
+    'stream_erosion': 'streaming',
+    'process_tiled': 'tiling',
+    'RasterCache': 'cache',
+    'DiskCache': 'disk_cache',
+    'render_many': 'render',
+    'encode_animation': 'animation',
+    'ExportManager': 'exports',
+    'compute_slope': 'terrain',
+    'stream_rivers': 'ingest',
+    'stream_from_drive': 'ingest',
+    'trace_centerline': 'vector',
+    'write_geojson': 'vector',
+    'centerline_migration': 'migration',
+    'channel_width': 'width',
+    'zonal_erosion': 'zonal',
+}
+_LAZY_MODULES = {'instrument'}
 
+__all__ = sorted(_LAZY_NAMES) + sorted(_LAZY_MODULES)
+
+
+def __getattr__(name):
+    if name in _LAZY_MODULES:
+        return importlib.import_module('.' + name, __name__)
+    if name not in _LAZY_NAMES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module('.' + _LAZY_NAMES[name], __name__), name)
+    # Later lookups find the name directly, without calling __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
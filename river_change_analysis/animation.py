@@ -0,0 +1,121 @@
+# Purpose: Encode centerline migration animations directly from the River arrays
+# Author: Ian St. Laurent
+
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+
+# Frame colors, in the BGR order used by OpenCV
+BACKGROUND_COLOR = (0, 0, 0)
+MASK_COLOR = (90, 40, 10)
+PREVIOUS_CENTERLINE_COLOR = (60, 60, 200)
+CENTERLINE_COLOR = (80, 230, 255)
+LABEL_COLOR = (255, 255, 255)
+
+
+def downsample(array, factor):
+    """
+    Shrink a binary array by an integer factor, keeping a pixel if any pixel of its
+    block is set so one pixel wide centerlines do not disappear.
+    Args:
+        array (np.ndarray): The binary array.
+        factor (int): The downsampling factor.
+    Returns:
+        np.ndarray: The downsampled boolean array.
+    """
+    array = np.asarray(array, dtype=bool)
+    if factor <= 1:
+        return array
+    rows = -(-array.shape[0] // factor) * factor
+    cols = -(-array.shape[1] // factor) * factor
+    padded = np.zeros((rows, cols), dtype=bool)
+    padded[:array.shape[0], :array.shape[1]] = array
+    return padded.reshape(rows // factor, factor, cols // factor, factor).any(axis=(1, 3))
+
+
+def build_frame(river, previous=None, factor=1, show_mask=True, label=True):
+    """
+    Build one animation frame from the arrays of a River object.
+    Args:
+        river (River): The year to draw.
+        previous (River): The year before, whose centerline is drawn underneath.
+        factor (int): The downsampling factor.
+        show_mask (bool): Draw the river mask under the centerlines.
+        label (bool): Write the year in the corner of the frame.
+    Returns:
+        np.ndarray: A (row, col, 3) uint8 BGR frame.
+    """
+    centerline = downsample(river.centerline, factor)
+    frame = np.empty(centerline.shape + (3,), dtype=np.uint8)
+    frame[:] = BACKGROUND_COLOR
+    if show_mask and river.mask is not None:
+        frame[downsample(river.mask, factor)] = MASK_COLOR
+    if previous is not None and previous.centerline is not None:
+        frame[downsample(previous.centerline, factor)] = PREVIOUS_CENTERLINE_COLOR
+    frame[centerline] = CENTERLINE_COLOR
+    if label:
+        scale = max(frame.shape[1] / 600, 0.5)
+        cv2.putText(frame, str(river.year), (int(10 * scale), int(35 * scale)), cv2.FONT_HERSHEY_SIMPLEX,
+                    scale, LABEL_COLOR, max(int(2 * scale), 1), cv2.LINE_AA)
+    return frame
+
+
+def _write_frame(writer, frame, file_path, fps, codec):
+    """
+    Write a frame, opening the video writer on the first frame.
+    Args:
+        writer (cv2.VideoWriter): The open writer, or None before the first frame.
+        frame (np.ndarray): The BGR frame.
+        file_path (str): Path of the video file.
+        fps (float): Frames per second.
+        codec (str): FourCC code of the video codec.
+    Returns:
+        cv2.VideoWriter: The open writer.
+    """
+    # Most codecs need even frame dimensions
+    frame = np.pad(frame, ((0, frame.shape[0] % 2), (0, frame.shape[1] % 2), (0, 0)))
+    if writer is None:
+        writer = cv2.VideoWriter(file_path, cv2.VideoWriter_fourcc(*codec), fps, (frame.shape[1], frame.shape[0]))
+        if not writer.isOpened():
+            raise ValueError(f"Could not open a {codec} video writer for {file_path}.")
+    writer.write(frame)
+    return writer
+
+
+def encode_animation(annual_data, file_path, fps=2, factor=1, show_mask=True, label=True, workers=None,
+                     codec='mp4v'):
+    """
+    Encode a centerline migration video. Frames are built in parallel threads and
+    streamed to the encoder in order, so only a few frames are held in memory at once.
+    Args:
+        annual_data (list): A list of River objects representing the river at different points in time.
+        file_path (str): Path of the video file.
+        fps (float): Frames, that is years, per second.
+        factor (int): The downsampling factor.
+        show_mask (bool): Draw the river mask under the centerlines.
+        label (bool): Write the year in the corner of every frame.
+        workers (int): Number of threads building frames. Defaults to all cores.
+        codec (str): FourCC code of the video codec.
+    Returns:
+        str: The path of the video file.
+    """
+    if workers is None or workers <= 0:
+        workers = os.cpu_count() or 1
+    writer = None
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # Keep a bounded window of frames in flight and write them in order
+            pending = deque()
+            for i, river in enumerate(annual_data):
+                previous = annual_data[i - 1] if i > 0 else None
+                pending.append(executor.submit(build_frame, river, previous, factor, show_mask, label))
+                if len(pending) > 2 * workers:
+                    writer = _write_frame(writer, pending.popleft().result(), file_path, fps, codec)
+            while pending:
+                writer = _write_frame(writer, pending.popleft().result(), file_path, fps, codec)
+    finally:
+        if writer is not None:
+            writer.release()
+    return file_path
@@ -0,0 +1,77 @@
+# Purpose: Process the annual river masks of many River objects in parallel
+# Author: Ian St. Laurent
+
+import numpy as np
+from rasterio.transform import Affine
+from .river import River
+from .packed import PackedMask
+from .parallel import parallel_map
+
+
+def _pack(array):
+    """
+    Pack a binary array eight pixels per byte so it is cheap to send between processes.
+    Args:
+        array (np.ndarray): The array to pack.
+    Returns:
+        PackedMask or np.ndarray: The packed array, or the array itself if it is not binary.
+    """
+    if isinstance(array, PackedMask) or (array.dtype != bool and array.size and array.max() > 1):
+        return array
+    return PackedMask.from_array(array)
+
+
+def _process_file(args):
+    """
+    Load, fill and thin a single year in a worker process.
+    Args:
+        args (tuple): The mask file path, min_size and max_distance_branch_removal.
+    Returns:
+        tuple: The year, the transform coefficients, the crs and the packed mask, watermask and centerline.
+    """
+    file_path, min_size, max_distance_branch_removal = args
+    river = River(file_path)
+    river.load_mask()
+    river.water_mask_process(min_size)
+    River.process_centerline([river], max_distance_branch_removal)
+    # Sent as plain coefficients, which pickle with every version of affine
+    transform = river.transform
+    coefficients = (transform.a, transform.b, transform.c, transform.d, transform.e, transform.f)
+    return (river.year, coefficients, river.crs, _pack(river.mask), _pack(river.watermask),
+            _pack(river.centerline))
+
+
+def process_rivers(annual_data, min_size=None, max_distance_branch_removal=None, workers=None, chunksize=1,
+                   packed=False):
+    """
+    Run load_mask, water_mask_process and process_centerline for many River objects
+    across a pool of worker processes. Every year is processed independently, so the
+    results do not depend on the number of workers.
+    Args:
+        annual_data (list): A list of River objects, from any number of reaches.
+        min_size (int): Minimum size of a bar to be removed.
+        max_distance_branch_removal (int): The maximum distance to remove branches.
+        workers (int): Number of worker processes. Defaults to all cores.
+        chunksize (int): Number of years sent to a worker at a time.
+        packed (bool): Keep the mask and watermask bit-packed instead of unpacking them.
+            Masks that are not binary are always kept unpacked.
+    Returns:
+        list: The same River objects with their year, transform, crs, mask, watermask
+            and centerline set.
+    """
+    jobs = [(river.file_path, min_size, max_distance_branch_removal) for river in annual_data]
+    results = parallel_map(_process_file, jobs, workers, chunksize)
+    for river, (year, coefficients, crs, mask, watermask, centerline) in zip(annual_data, results):
+        river.year = year
+        river.transform = Affine(*coefficients)
+        river.crs = crs
+        # _pack leaves masks that are not binary unpacked, and the source must record
+        # that so an evicted mask is reloaded the same way
+        packed_mask = packed and isinstance(mask, PackedMask)
+        # Store the results so they can be evicted and rebuilt like rasters computed in place
+        river._set_raster('mask', mask if packed_mask else np.asarray(mask), ('load_mask', (packed_mask,)))
+        river._set_raster('watermask', watermask if packed_mask else np.asarray(watermask),
+                          ('water_mask_process', (min_size,)))
+        river._set_raster('centerline', np.asarray(centerline),
+                          ('process_centerline', (max_distance_branch_removal,)))
+    return annual_data
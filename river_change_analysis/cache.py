@@ -0,0 +1,109 @@
+# Purpose: Memory-budgeted LRU cache shared by the rasters of every River object
+# Author: Ian St. Laurent
+
+import threading
+from collections import OrderedDict
+
+DEFAULT_CACHE_BYTES = 2 * 1024**3
+
+
+class RasterCache:
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        """
+        Initialize a RasterCache object.
+        Args:
+            max_bytes (int): Memory budget of the cached arrays in bytes.
+        """
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.max_bytes = max_bytes
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, max_bytes):
+        self._max_bytes = max_bytes
+        with self._lock:
+            self._evict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """
+        Get a cached array and mark it as recently used.
+        Args:
+            key (tuple): The key of the array.
+        Returns:
+            np.ndarray: The array, or None if it is not cached.
+        """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        """
+        Cache an array, evicting the least recently used arrays beyond the budget.
+        The newest array is always kept, even if it alone exceeds the budget.
+        Args:
+            key (tuple): The key of the array.
+            value (np.ndarray): The array to cache.
+        Returns:
+            None.
+        """
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = value
+            self.nbytes += value.nbytes
+            self._evict()
+
+    def discard(self, key):
+        """
+        Remove an array from the cache if it is there.
+        Args:
+            key (tuple): The key of the array.
+        Returns:
+            None.
+        """
+        with self._lock:
+            self._remove(key)
+
+    def discard_owner(self, owner):
+        """
+        Remove every array belonging to one owner, the first element of their keys.
+        Args:
+            owner (int): The owner of the arrays.
+        Returns:
+            None.
+        """
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == owner]:
+                self._remove(key)
+
+    def clear(self):
+        """
+        Remove every array from the cache.
+        Returns:
+            None.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def _remove(self, key):
+        value = self._entries.pop(key, None)
+        if value is not None:
+            self.nbytes -= value.nbytes
+
+    def _evict(self):
+        while self.nbytes > self._max_bytes and len(self._entries) > 1:
+            _, value = self._entries.popitem(last=False)
+            self.nbytes -= value.nbytes
@@ -0,0 +1,218 @@
+# Purpose: Persistent on-disk cache of derived River rasters
+# Author: Ian St. Laurent
+
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+try:
+    from importlib import metadata
+except ImportError:
+    # Python 3.7 gets the backport
+    import importlib_metadata as metadata
+from . import __version__
+
+DEFAULT_DISK_CACHE_BYTES = 10 * 1024**3
+# Share of the size limit kept after an eviction, so the folder is not scanned on every write
+EVICTION_TARGET = 0.9
+# Bump when the water mask or centerline algorithms, or the stored format, change
+CACHE_FORMAT_VERSION = 2
+# Distributions whose algorithms the cached rasters depend on
+CACHE_DEPENDENCIES = ('numpy', 'scipy', 'scikit-image', 'opencv-python', 'opencv-python-headless')
+
+_dependency_versions = None
+
+
+def dependency_versions():
+    """
+    Get the installed versions of the libraries computing the cached rasters, read from
+    the package metadata so the libraries themselves are not imported.
+    Returns:
+        dict: The version of each distribution, None if it is not installed.
+    """
+    global _dependency_versions
+    if _dependency_versions is None:
+        versions = {}
+        for name in CACHE_DEPENDENCIES:
+            try:
+                versions[name] = metadata.version(name)
+            except metadata.PackageNotFoundError:
+                versions[name] = None
+        _dependency_versions = versions
+    return _dependency_versions
+
+
+class DiskCache:
+    def __init__(self, folder, max_bytes=DEFAULT_DISK_CACHE_BYTES):
+        """
+        Initialize a DiskCache object.
+        Args:
+            folder (str): Folder where the cached arrays are stored. Created if needed.
+            max_bytes (int): Size limit of the folder in bytes. The least recently used
+                arrays are removed when it is exceeded.
+        """
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._checksums = {}
+        # Size of the folder, counted on the first write and then kept up to date
+        self._nbytes = None
+        os.makedirs(folder, exist_ok=True)
+
+    def checksum(self, file_path):
+        """
+        Compute the SHA-256 checksum of a file, remembered until the file changes.
+        Args:
+            file_path (str): Path to the file.
+        Returns:
+            str: The hex digest of the file content.
+        """
+        stat = os.stat(file_path)
+        signature = (os.path.realpath(file_path), stat.st_size, stat.st_mtime_ns)
+        if signature not in self._checksums:
+            digest = hashlib.sha256()
+            with open(file_path, 'rb') as file:
+                for chunk in iter(lambda: file.read(1024 * 1024), b''):
+                    digest.update(chunk)
+            self._checksums[signature] = digest.hexdigest()
+        return self._checksums[signature]
+
+    def key(self, file_path, name, **params):
+        """
+        Build the key of a derived raster from its input file, name and parameters, the
+        cache format and the versions of the package and of the libraries computing it.
+        Args:
+            file_path (str): Path to the mask file the raster is derived from.
+            name (str): Name of the raster, such as 'watermask'.
+            **params: The parameter values used to compute the raster.
+        Returns:
+            str: The key.
+        """
+        description = json.dumps([self.checksum(file_path), name, params, __version__, CACHE_FORMAT_VERSION,
+                                  dependency_versions()], sort_keys=True)
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.folder, key[:2], key + '.npz')
+
+    def get(self, key):
+        """
+        Load a cached array.
+        Args:
+            key (str): The key of the array.
+        Returns:
+            np.ndarray: The array, or None if it is not cached.
+        """
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                array = data['array']
+        except (OSError, KeyError, ValueError):
+            return None
+        try:
+            # The modification time records the last use for eviction
+            os.utime(path)
+        except OSError:
+            # A read-only or shared cache still serves its arrays
+            pass
+        return array
+
+    def put(self, key, array):
+        """
+        Store an array compressed, then evict old arrays if the cache is over its size limit.
+        Args:
+            key (str): The key of the array.
+            array (np.ndarray): The array to store.
+        Returns:
+            None.
+        """
+        path = self._path(key)
+        if self._nbytes is None:
+            self._nbytes = self.nbytes
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so a crash never leaves a partial entry
+        handle, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as file:
+                np.savez_compressed(file, array=array)
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+        self._nbytes += os.path.getsize(path) - replaced
+        if self._nbytes > self.max_bytes:
+            self.evict(int(self.max_bytes * EVICTION_TARGET))
+
+    def _entries(self):
+        entries = []
+        for root, _, files in os.walk(self.folder):
+            for file_name in files:
+                if file_name.endswith('.npz'):
+                    path = os.path.join(root, file_name)
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    @property
+    def nbytes(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self, max_bytes=None):
+        """
+        Remove the least recently used arrays until the cache fits in max_bytes.
+        Args:
+            max_bytes (int): Size limit in bytes. Defaults to the limit of the cache.
+        Returns:
+            int: The number of arrays removed.
+        """
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in entries:
+            if total <= max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            removed += 1
+        self._nbytes = total
+        return removed
+
+    def clear(self):
+        """
+        Remove every cached array.
+        Returns:
+            int: The number of arrays removed.
+        """
+        return self.evict(0)
+
+
+def main(args=None):
+    """
+    Command line entry point to inspect, evict or clear a cache folder.
+    Args:
+        args (list): Command line arguments. Defaults to sys.argv.
+    Returns:
+        None.
+    """
+    parser = argparse.ArgumentParser(description="Manage the River Change Analysis disk cache.")
+    parser.add_argument('folder', help="The cache folder.")
+    parser.add_argument('--max-bytes', type=int, help="Evict the least recently used arrays down to this size.")
+    parser.add_argument('--clear', action='store_true', help="Remove every cached array.")
+    options = parser.parse_args(args)
+    cache = DiskCache(options.folder)
+    if options.clear:
+        print(f"Removed {cache.clear()} cached arrays")
+    elif options.max_bytes is not None:
+        print(f"Removed {cache.evict(options.max_bytes)} cached arrays")
+    print(f"Cache size: {cache.nbytes} bytes")
+
+
+if __name__ == '__main__':
+    main()
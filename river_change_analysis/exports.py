@@ -0,0 +1,263 @@
+# Purpose: Submit and supervise many Earth Engine exports as one throughput-bounded job
+# Author: Ian St. Laurent
+
+import time
+
+# Earth Engine task states
+PENDING = 'PENDING'
+READY = 'READY'
+RUNNING = 'RUNNING'
+COMPLETED = 'COMPLETED'
+FAILED = 'FAILED'
+CANCELLED = 'CANCELLED'
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+MAX_ACTIVE_EXPORTS = 10
+EXPORT_RETRIES = 3
+POLL_INTERVAL = 5
+MAX_POLL_INTERVAL = 60
+EXPORT_SCALE = 30
+EXPORT_MAX_PIXELS = 1e12
+
+
+class ExportJob:
+    def __init__(self, image, file_name_prefix, folder_name, region, description=None, scale=EXPORT_SCALE,
+                 max_pixels=EXPORT_MAX_PIXELS):
+        """
+        Initialize an ExportJob object, one GeoTIFF export to Google Drive.
+        Args:
+            image (ee.Image): The image to export.
+            file_name_prefix (str): Name of the GeoTIFF file, without extension.
+            folder_name (str): Google Drive folder of the file.
+            region (list): Coordinates of the export region, already resolved.
+            description (str): Name of the task in the task manager. Defaults to the file name.
+            scale (float): Pixel size in meters.
+            max_pixels (float): Maximum number of pixels of the export.
+        """
+        self.image = image
+        self.file_name_prefix = file_name_prefix
+        self.folder_name = folder_name
+        self.region = region
+        self.description = description if description is not None else file_name_prefix
+        self.scale = scale
+        self.max_pixels = max_pixels
+        self.state = PENDING
+        self.task = None
+        self.attempts = 0
+        # Status checks failed in a row, such as transient HTTP errors
+        self.poll_errors = 0
+        self.error = None
+        self.retry_at = 0
+
+    @property
+    def finished(self):
+        return self.state in FINISHED_STATES
+
+    @property
+    def active(self):
+        # Submitted and not finished, whatever the exact Earth Engine state
+        return self.task is not None and self.state != PENDING and not self.finished
+
+    def __repr__(self):
+        return f"ExportJob({self.description!r}, state={self.state!r}, attempts={self.attempts})"
+
+
+class ExportManager:
+    def __init__(self, folder_name, max_active=MAX_ACTIVE_EXPORTS, retries=EXPORT_RETRIES,
+                 poll_interval=POLL_INTERVAL, max_poll_interval=MAX_POLL_INTERVAL, progress=None, ee_module=None,
+                 sleep=time.sleep, clock=time.monotonic):
+        """
+        Initialize an ExportManager object. Exports are queued with add and run together,
+        at most max_active at a time.
+        Args:
+            folder_name (str): Default Google Drive folder of the exports.
+            max_active (int): Maximum number of submitted exports that are not finished.
+            retries (int): Number of times a failed export is submitted again, after a
+                delay that doubles with every attempt.
+            poll_interval (float): First delay in seconds between two status checks.
+            max_poll_interval (float): Longest delay between two status checks. The delay
+                doubles every check without news and is reset when a task changes state.
+            progress (callable): Called with the manager and the job whose state changed.
+                Defaults to printing a progress line.
+            ee_module (module): The Earth Engine module, or a stand-in with the same
+                batch.Export.image.toDrive API for offline use. Defaults to ee.
+            sleep (callable): Function used to wait between status checks.
+            clock (callable): Function returning the current time in seconds.
+        """
+        if max_active < 1:
+            raise ValueError("max_active must be at least 1.")
+        if ee_module is None:
+            import ee as ee_module
+        self.ee = ee_module
+        self.folder_name = folder_name
+        self.max_active = max_active
+        self.retries = retries
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.progress = progress if progress is not None else _print_progress
+        self.sleep = sleep
+        self.clock = clock
+        self.jobs = []
+        self._regions = {}
+
+    def region(self, roi):
+        """
+        Resolve the coordinates of a region of interest, with a single server round trip
+        per region however many exports use it.
+        Args:
+            roi (ee.Geometry): The region of interest.
+        Returns:
+            list: The coordinates of the region.
+        """
+        key = id(roi)
+        if key not in self._regions:
+            # Keep the geometry alive so its id is not reused by another object
+            self._regions[key] = (roi, roi.getInfo()['coordinates'])
+        return self._regions[key][1]
+
+    def add(self, image, file_name_prefix, roi, description=None, scale=EXPORT_SCALE, max_pixels=EXPORT_MAX_PIXELS,
+            folder_name=None):
+        """
+        Queue an image export.
+        Args:
+            image (ee.Image): The image to export.
+            file_name_prefix (str): Name of the GeoTIFF file, without extension.
+            roi (ee.Geometry): The region to export.
+            description (str): Name of the task in the task manager. Defaults to the file name.
+            scale (float): Pixel size in meters.
+            max_pixels (float): Maximum number of pixels of the export.
+            folder_name (str): Google Drive folder of the file. Defaults to the folder of the manager.
+        Returns:
+            ExportJob: The queued export.
+        """
+        if folder_name is None:
+            folder_name = self.folder_name
+        job = ExportJob(image, file_name_prefix, folder_name, self.region(roi), description, scale, max_pixels)
+        self.jobs.append(job)
+        return job
+
+    def counts(self):
+        """
+        Count the exports in each state.
+        Returns:
+            dict: The number of exports per state.
+        """
+        counts = {}
+        for job in self.jobs:
+            counts[job.state] = counts.get(job.state, 0) + 1
+        return counts
+
+    def _submit(self, job):
+        job.attempts += 1
+        try:
+            job.task = self.ee.batch.Export.image.toDrive(
+                image=job.image,
+                description=job.description,
+                fileNamePrefix=job.file_name_prefix,
+                region=job.region,
+                scale=job.scale,
+                fileFormat='GeoTIFF',
+                folder=job.folder_name,
+                maxPixels=job.max_pixels
+            )
+            job.task.start()
+        except Exception as error:
+            # Submission errors, such as a full task queue, are retried like failed tasks
+            job.task = None
+            self._fail(job, str(error))
+            return
+        job.state = READY
+        job.error = None
+        job.poll_errors = 0
+        self.progress(self, job)
+
+    def _fail(self, job, message):
+        job.error = message
+        if job.attempts <= self.retries:
+            job.state = PENDING
+            job.retry_at = self.clock() + self.poll_interval * 2**(job.attempts - 1)
+        else:
+            job.state = FAILED
+            self.progress(self, job)
+
+    def _poll(self, job):
+        """
+        Update the state of a submitted export.
+        Args:
+            job (ExportJob): The export.
+        Returns:
+            bool: True if the state changed.
+        """
+        try:
+            status = job.task.status()
+        except Exception as error:
+            # The task may still be running, so it is checked again rather than submitted
+            # again, until more checks in a row failed than there are retries
+            job.poll_errors += 1
+            job.error = str(error)
+            if job.poll_errors <= self.retries:
+                return False
+            job.state = FAILED
+            self.progress(self, job)
+            return True
+        job.poll_errors = 0
+        state = status.get('state', job.state)
+        if state == job.state:
+            return False
+        if state == FAILED:
+            self._fail(job, status.get('error_message', 'Export failed'))
+        else:
+            job.state = state
+            self.progress(self, job)
+        return True
+
+    def start(self):
+        """
+        Submit queued exports and return without supervising them, keeping at most
+        max_active exports active. The other exports stay queued until run is called.
+        Returns:
+            list: The ExportJob objects. Rejected or queued submissions are left PENDING.
+        """
+        active = sum(job.active for job in self.jobs)
+        for job in self.jobs:
+            if active >= self.max_active:
+                break
+            if job.state == PENDING:
+                self._submit(job)
+                active += job.state == READY
+        return self.jobs
+
+    def run(self):
+        """
+        Submit the queued exports and supervise them until every one is finished.
+        Returns:
+            list: The ExportJob objects. Exports that still failed after the retries are
+                left in the FAILED state with their error message.
+        """
+        interval = self.poll_interval
+        while True:
+            active = [job for job in self.jobs if job.active]
+            changed = False
+            for job in active:
+                changed = self._poll(job) or changed
+            active = [job for job in self.jobs if job.active]
+            now = self.clock()
+            for job in self.jobs:
+                if len(active) >= self.max_active:
+                    break
+                if job.state == PENDING and job.retry_at <= now:
+                    self._submit(job)
+                    changed = True
+                    if job.state == READY:
+                        active.append(job)
+            if all(job.finished for job in self.jobs):
+                return self.jobs
+            # Back off while nothing happens, check again quickly after any news
+            interval = self.poll_interval if changed else min(interval * 2, self.max_poll_interval)
+            self.sleep(interval)
+
+
+def _print_progress(manager, job):
+    counts = manager.counts()
+    print(f"{job.description}: {job.state} ({counts.get(COMPLETED, 0)}/{len(manager.jobs)} exports completed, "
+          f"{counts.get(FAILED, 0)} failed)")
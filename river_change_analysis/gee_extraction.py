@@ -1,14 +1,36 @@
 # GEE River Binary Mask Extraction
 
-import ee
+import threading
+from .instrument import stage
+from .exports import ExportManager
 
 CLOUD_SHADOW_BIT_MASK = 1 << 3
 CLOUDS_BIT_MASK = 1 << 5
 
-ee.Authenticate()
-ee.Initialize()
+_ee = None
+_ee_lock = threading.Lock()
+
+def _ensure_initialized():
+    """
+    Import and initialize Earth Engine on the first GEE call instead of at import time,
+    authenticating only when there are no stored credentials.
+    Returns:
+        module: The initialized ee module.
+    """
+    global _ee
+    with _ee_lock:
+        if _ee is None:
+            import ee
+            try:
+                ee.Initialize()
+            except Exception:
+                ee.Authenticate()
+                ee.Initialize()
+            _ee = ee
+    return _ee
 
 def define_roi(polygon):
+    ee = _ensure_initialized()
     if polygon:  # This will be False if polygon is an empty list
         roi = ee.Geometry.Polygon(polygon)
     else:
@@ -40,48 +62,57 @@ def Evi(image):
     return evi.rename(['evi'])
 
 """Import a Digital Elevation Model (DEM) from Google Earth Engine."""
-def import_dem(roi, file_name_prefix, folder_name):
-    dem = ee.Image('USGS/SRTMGL1_003').clip(roi)
-    elevation = dem.select('elevation')
-    slope = ee.Terrain.slope(elevation)
-    task = ee.batch.Export.image.toDrive(
-            image = dem,
-            description = file_name_prefix + '_dem',
-            fileNamePrefix = file_name_prefix + '_dem',
-            region = roi.getInfo()['coordinates'],
-            scale = 30,
-            fileFormat = 'GeoTIFF',
-            folder = folder_name,
-            maxPixels = 1e12
-    )
-    task.start()
-
-    task1 = ee.batch.Export.image.toDrive(
-            image = elevation,
-            description = file_name_prefix + '_elevation',
-            fileNamePrefix = file_name_prefix + '_elevation',
-            region = roi.getInfo()['coordinates'],
-            scale = 30,
-            fileFormat = 'GeoTIFF',
-            folder = folder_name,
-            maxPixels = 1e12
-    )
-    task1.start()
-
-    task2 = ee.batch.Export.image.toDrive(
-            image = slope,
-            description = file_name_prefix + '_slope',
-            fileNamePrefix = file_name_prefix + '_slope',
-            region = roi.getInfo()['coordinates'],
-            scale = 30,
-            fileFormat = 'GeoTIFF',
-            folder = folder_name,
-            maxPixels = 1e12
-    )
-    task2.start()
-
-
-def process_images(start_year, end_year, month_day_start, month_day_end, roi, folder_name, file_name):
+def import_dem(roi, file_name_prefix, folder_name, manager=None, wait=True):
+    """
+    Export the SRTM elevation of a region to Google Drive, as <file_name_prefix>_elevation.
+    The slope is derived from it locally by River.load_dem instead of being exported.
+    Args:
+        roi (ee.Geometry): The region of interest.
+        file_name_prefix (str): Prefix of the elevation file.
+        folder_name (str): Google Drive folder of the file.
+        manager (ExportManager): Queue the export on this manager instead of starting it.
+        wait (bool): Without a manager, supervise the export until it is finished. With
+            False, the export is only started.
+    Returns:
+        list: The ExportJob of the elevation.
+    """
+    ee = _ensure_initialized()
+    with stage('import_dem'):
+        elevation = ee.Image('USGS/SRTMGL1_003').clip(roi).select('elevation')
+        own = manager is None
+        if own:
+            manager = ExportManager(folder_name, ee_module=ee)
+        jobs = [manager.add(elevation, file_name_prefix + '_elevation', roi, folder_name=folder_name)]
+        if own and wait:
+            manager.run()
+        elif own:
+            manager.start()
+        return jobs
+
+
+def process_images(start_year, end_year, month_day_start, month_day_end, roi, folder_name, file_name, manager=None,
+                   multiband=False, wait=True):
+    """
+    Build the yearly river masks server-side and export them to Google Drive.
+    Args:
+        start_year (int): First year.
+        end_year (int): Last year.
+        month_day_start (str): Start of the season of every year, such as '-06-01'.
+        month_day_end (str): End of the season of every year, such as '-10-01'.
+        roi (ee.Geometry): The region of interest.
+        folder_name (str): Google Drive folder of the masks.
+        file_name (str): Prefix of the mask files.
+        manager (ExportManager): Queue the exports on this manager instead of starting
+            them, to supervise the exports of many reaches as one job with manager.run().
+        multiband (bool): Export every year as one band of a single uint8 GeoTIFF named
+            <file_name>river_masks<start_year>_<end_year>, with bands named river_mask_<year>.
+            Load it with load_multiband.
+        wait (bool): Without a manager, supervise the exports until they are finished,
+            at most MAX_ACTIVE_EXPORTS at a time and with retries. With False, only the
+            first MAX_ACTIVE_EXPORTS exports are started, pass a manager to run the rest.
+    Returns:
+        list: The ExportJob objects of the masks.
+    """
 
     if (start_year == None) | (end_year == None):
         raise ValueError("Please provide a start year and end year.")
@@ -108,63 +139,71 @@ def process_images(start_year, end_year, month_day_start, month_day_end, roi, fo
     bn5 = ['B1', 'B1', 'B2', 'B3', 'B5', 'pixel_qa', 'B4', 'B7']
     bns = ['uBlue', 'Blue', 'Green', 'Red', 'Swir1', 'BQA', 'Nir', 'Swir2']
 
+    ee = _ensure_initialized()
     # Image collections for different Landsat sensors
     ls5 = ee.ImageCollection("LANDSAT/LT05/C01/T1_SR").filterDate('1985-04-01', '1999-04-15').select(bn5, bns)
     ls7 = ee.ImageCollection("LANDSAT/LE07/C01/T1_SR").select(bn7, bns)
     ls8 = ee.ImageCollection("LANDSAT/LC08/C01/T1_SR").select(bn8, bns)
     merged = ls5.merge(ls7).merge(ls8)  # Merge all collections into one
 
-    for year in range(start_year, end_year+1):
-        sDate_T1 = str(year) + month_day_start  # Start date for filtering
-        eDate_T1 = str(year) + month_day_end  # End date for filtering
-
-        # Filter date range, roi and apply simple cloud processing:
-        def mask_clouds(image):
-            """Mask clouds and cloud shadows in an image."""
-            cloudShadowBitMask = 1 << 3
-            cloudsBitMask = 1 << 5
-            qa = image.select('BQA')
-            mask = qa.bitwiseAnd(cloudShadowBitMask).eq(0).And(qa.bitwiseAnd(cloudsBitMask).eq(0))
-            return image.updateMask(mask).multiply(0.0001).clip(roi)
-
-        imgCol = merged.filterDate(sDate_T1, eDate_T1).filterBounds(roi).map(mask_clouds)
-
-        # Define and rename quantiles of interest:
-        bnp50 = ['uBlue_p50', 'Blue_p50', 'Green_p50', 'Red_p50', 'Swir1_p50', 'BQA_p50', 'Nir_p50', 'Swir2_p50']
-        p50 = imgCol.reduce(ee.Reducer.percentile([50])).select(bnp50, bns)
-
-        # Apply to each percentile:
-        mndwi_p50 = Mndwi(p50)
-        ndvi_p50 = Ndvi(p50)
-        evi_p50 = Evi(p50)
-
-        # Water classification from (Zou 2018):
-        water_p50 = mndwi_p50.gt(ndvi_p50).Or(mndwi_p50.gt(evi_p50)).And(evi_p50.lt(0.1))
-        waterMasked_p50 = water_p50.updateMask(water_p50.gt(0))
-
-        # Active river belt classification:
-        activebelt_p50 = mndwi_p50.gte(mndwi_param).And(ndvi_p50.lte(ndvi_param))
-        activebeltMasked_p50 = activebelt_p50.updateMask(activebelt_p50.gt(0))
-        active_p50 = water_p50.Or(activebelt_p50)
-
-        # Clean binary active channel:
-        smooth_map_p50 = active_p50.focal_mode(radius=10, kernelType='octagon', units='pixels', iterations=1).mask(active_p50.gte(1))
-        noise_removal_p50 = active_p50.updateMask(active_p50.connectedPixelCount(cleaning_pixels, False).gte(cleaning_pixels)).unmask(smooth_map_p50)
-        noise_removal_p50_Masked = noise_removal_p50.updateMask(noise_removal_p50.gt(0))
-        river_mask = noise_removal_p50_Masked
-
-        filename = file_name + '_river_mask_' + str(year)
-        task = ee.batch.Export.image.toDrive(
-            image = river_mask,
-            description = filename,
-            fileNamePrefix = file_name + 'river_mask' + str(year),
-            region = roi.getInfo()['coordinates'],
-            scale = 30,
-            fileFormat = 'GeoTIFF',
-            folder = folder_name,
-            maxPixels = 1e12
-        )
-        task.start()
-
-
+    own = manager is None
+    if own:
+        manager = ExportManager(folder_name, ee_module=ee)
+    jobs = []
+    bands = []
 
+    for year in range(start_year, end_year+1):
+        with stage('build_river_mask', year=str(year)):
+            sDate_T1 = str(year) + month_day_start  # Start date for filtering
+            eDate_T1 = str(year) + month_day_end  # End date for filtering
+
+            # Filter date range, roi and apply simple cloud processing:
+            def mask_clouds(image):
+                """Mask clouds and cloud shadows in an image."""
+                cloudShadowBitMask = 1 << 3
+                cloudsBitMask = 1 << 5
+                qa = image.select('BQA')
+                mask = qa.bitwiseAnd(cloudShadowBitMask).eq(0).And(qa.bitwiseAnd(cloudsBitMask).eq(0))
+                return image.updateMask(mask).multiply(0.0001).clip(roi)
+
+            imgCol = merged.filterDate(sDate_T1, eDate_T1).filterBounds(roi).map(mask_clouds)
+
+            # Define and rename quantiles of interest:
+            bnp50 = ['uBlue_p50', 'Blue_p50', 'Green_p50', 'Red_p50', 'Swir1_p50', 'BQA_p50', 'Nir_p50', 'Swir2_p50']
+            p50 = imgCol.reduce(ee.Reducer.percentile([50])).select(bnp50, bns)
+
+            # Apply to each percentile:
+            mndwi_p50 = Mndwi(p50)
+            ndvi_p50 = Ndvi(p50)
+            evi_p50 = Evi(p50)
+
+            # Water classification from (Zou 2018):
+            water_p50 = mndwi_p50.gt(ndvi_p50).Or(mndwi_p50.gt(evi_p50)).And(evi_p50.lt(0.1))
+            waterMasked_p50 = water_p50.updateMask(water_p50.gt(0))
+
+            # Active river belt classification:
+            activebelt_p50 = mndwi_p50.gte(mndwi_param).And(ndvi_p50.lte(ndvi_param))
+            activebeltMasked_p50 = activebelt_p50.updateMask(activebelt_p50.gt(0))
+            active_p50 = water_p50.Or(activebelt_p50)
+
+            # Clean binary active channel:
+            smooth_map_p50 = active_p50.focal_mode(radius=10, kernelType='octagon', units='pixels', iterations=1).mask(active_p50.gte(1))
+            noise_removal_p50 = active_p50.updateMask(active_p50.connectedPixelCount(cleaning_pixels, False).gte(cleaning_pixels)).unmask(smooth_map_p50)
+            noise_removal_p50_Masked = noise_removal_p50.updateMask(noise_removal_p50.gt(0))
+            river_mask = noise_removal_p50_Masked
+
+            if multiband:
+                # Bands of one image share a type and need a value everywhere
+                bands.append(river_mask.unmask(0).uint8().rename('river_mask_' + str(year)))
+                continue
+            filename = file_name + '_river_mask_' + str(year)
+            jobs.append(manager.add(river_mask, file_name + 'river_mask' + str(year), roi, description=filename,
+                                    folder_name=folder_name))
+    if multiband:
+        filename = file_name + 'river_masks' + str(start_year) + '_' + str(end_year)
+        jobs.append(manager.add(ee.Image.cat(bands), filename, roi, folder_name=folder_name))
+    if own and wait:
+        manager.run()
+    elif own:
+        manager.start()
+    return jobs
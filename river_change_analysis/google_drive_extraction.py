@@ -1,48 +1,271 @@
 # Purpose: Download binary river masks from Google Drive folder when used outside of Google Colab
 # Author: Ian St. Laurent
 
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
-from google_auth_oauthlib.flow import InstalledAppFlow
+import hashlib
 import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-def download_files_from_drive(secret_path, FilePattern, OutputDir):
+# Define the scopes for Google Drive API
+SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
+DOWNLOAD_WORKERS = 4
+# Bytes requested per ranged download request
+CHUNK_SIZE = 8 * 1024 * 1024
+DOWNLOAD_RETRIES = 2
+PAGE_SIZE = 1000
+PARTIAL_SUFFIX = '.part'
 
-    # Define the scopes for Google Drive API
-    SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
 
-    if not SecretsFile:
-        SecretsFile = input("Enter path to client secrets file: ")
-        secret_path = '/Users/ian/Desktop/School/Fall 2023/CSC 497/Python_Library/River_Analysis/client_secret_61071723423-qdtatourf8qp1s40hai3m0i9jb893752.apps.googleusercontent.com.json'
-    if not FolderName:
-        FolderName = input("Enter folder name: ")
-    if not FilePattern:
-        FilePattern = input("Enter file pattern: ")
-    if not OutputDir:
-        OutputDir = input("Enter output directory: ")
-        OutputDir= '/Users/ian/Desktop/School/Fall 2023/CSC 497/Python_Library/River_Analysis/binary_river_masks/'
+def authenticate(secret_path):
+    """
+    Run the OAuth 2.0 flow and return a function building a Drive service. Services
+    are not thread safe, so every download thread builds its own from the credentials.
+    Args:
+        secret_path (str): Path to the client secrets file.
+    Returns:
+        callable: A function returning a new Drive v3 service.
+    """
+    from googleapiclient.discovery import build
+    from google_auth_oauthlib.flow import InstalledAppFlow
 
     # Run the OAuth 2.0 flow to get an access token
     flow = InstalledAppFlow.from_client_secrets_file(secret_path, SCOPES)
     creds = flow.run_local_server(port=0)
+    return lambda: build('drive', 'v3', credentials=creds, cache_discovery=False)
 
-    # Build the Drive service
-    drive_service = build('drive', 'v3', credentials=creds)
 
-    # Query to find the files in Google Drive
-    query = f"name contains '{FilePattern}' and mimeType='image/tiff'"
+def file_md5(file_path):
+    """
+    Compute the MD5 checksum of a file, as reported by Drive in md5Checksum.
+    Args:
+        file_path (str): Path to the file.
+    Returns:
+        str: The hex digest of the file content.
+    """
+    digest = hashlib.md5()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-    # Get the list of files that match the query
-    results = drive_service.files().list(q=query, fields="files(id, name)").execute()
-    items = results.get('files', [])
 
-    # Download each file
+def latest_by_name(items):
+    """
+    Keep a single Drive file per name. Drive names are not unique, and exporting a
+    mask again creates another file with the same name, so only the most recently
+    modified one is kept.
+    Args:
+        items (list): The Drive files, as returned by list_files.
+    Returns:
+        list: The files with unique names, in their original order.
+    """
+    latest = {}
     for item in items:
-        print('Downloading file {0} ({1})'.format(item['name'], item['id']))
-        request = drive_service.files().get_media(fileId=item['id'])
-        fh = io.FileIO(OutputDir + item['name'], 'wb')
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-        while done is False:
-            status, done = downloader.next_chunk()
-            print("Download %d%%." % int(status.progress() * 100))
+        kept = latest.get(item['name'])
+        if kept is None or item.get('modifiedTime', '') >= kept.get('modifiedTime', ''):
+            latest[item['name']] = item
+    kept_ids = {id(item) for item in latest.values()}
+    return [item for item in items if id(item) in kept_ids]
+
+
+class DriveSync:
+    def __init__(self, service_factory, output_dir, workers=DOWNLOAD_WORKERS, chunk_size=CHUNK_SIZE,
+                 retries=DOWNLOAD_RETRIES):
+        """
+        Initialize a DriveSync object, which mirrors Drive files into a local folder.
+        Args:
+            service_factory (callable): Function returning a Drive v3 service, such as the
+                result of authenticate. Called once per thread.
+            output_dir (str): Local folder of the files. Created if needed.
+            workers (int): Number of files downloaded at once.
+            chunk_size (int): Bytes requested per ranged request.
+            retries (int): Number of times an interrupted download is resumed before the
+                file is reported as failed. The partial file is kept for the next sync.
+        """
+        self.service_factory = service_factory
+        self.output_dir = output_dir
+        self.workers = max(workers, 1)
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self._local = threading.local()
+        os.makedirs(output_dir, exist_ok=True)
+
+    @property
+    def service(self):
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            service = self._local.service = self.service_factory()
+        return service
+
+    def list_files(self, file_pattern):
+        """
+        List every GeoTIFF whose name contains a pattern, following all result pages.
+        Files sharing a name are reduced to the most recently modified one.
+        Args:
+            file_pattern (str): Part of the file names.
+        Returns:
+            list: Dictionaries with the id, name, md5Checksum, size and modifiedTime of each file.
+        """
+        # Query to find the files in Google Drive
+        pattern = file_pattern.replace('\\', '\\\\').replace("'", "\\'")
+        query = f"name contains '{pattern}' and mimeType='image/tiff' and trashed=false"
+        items = []
+        page_token = None
+        while True:
+            results = self.service.files().list(q=query, pageSize=PAGE_SIZE, pageToken=page_token,
+                                                fields="nextPageToken, files(id, name, md5Checksum, size, modifiedTime)").execute()
+            items.extend(results.get('files', []))
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                return latest_by_name(items)
+
+    def is_current(self, item):
+        """
+        Check whether the local copy of a Drive file has the same size and checksum.
+        Args:
+            item (dict): The Drive file, as returned by list_files.
+        Returns:
+            bool: True if the file does not need to be downloaded.
+        """
+        path = os.path.join(self.output_dir, item['name'])
+        if not os.path.exists(path):
+            return False
+        if 'size' in item and os.path.getsize(path) != int(item['size']):
+            return False
+        return 'md5Checksum' not in item or file_md5(path) == item['md5Checksum']
+
+    def _fetch(self, item, file, offset):
+        """
+        Append the content of a Drive file from an offset to an open file, with ranged requests.
+        Args:
+            item (dict): The Drive file, as returned by list_files.
+            file (file object): The file to append to.
+            offset (int): Number of bytes already in the file.
+        Returns:
+            None.
+        """
+        size = int(item['size']) if 'size' in item else None
+        while size is None or offset < size:
+            request = self.service.files().get_media(fileId=item['id'])
+            end = offset + self.chunk_size - 1
+            if size is not None:
+                end = min(end, size - 1)
+            request.headers['Range'] = f'bytes={offset}-{end}'
+            content = request.execute()
+            if not content:
+                break
+            file.write(content)
+            offset += len(content)
+            if size is None and len(content) < self.chunk_size:
+                break
+
+    def _fetch_with_retries(self, item, file, tell):
+        for attempt in range(self.retries + 1):
+            try:
+                # Continue from the bytes already received
+                self._fetch(item, file, tell())
+                return
+            except Exception:
+                # The service may be left in a bad state by a dropped connection
+                self._local.service = None
+                if attempt == self.retries:
+                    raise
+
+    def fetch(self, item):
+        """
+        Download a Drive file into memory, resuming within the call if the connection drops.
+        Args:
+            item (dict): The Drive file, as returned by list_files.
+        Returns:
+            bytes: The verified content of the file.
+        """
+        buffer = io.BytesIO()
+        self._fetch_with_retries(item, buffer, buffer.tell)
+        content = buffer.getvalue()
+        if 'md5Checksum' in item and hashlib.md5(content).hexdigest() != item['md5Checksum']:
+            raise ValueError(f"Checksum mismatch for {item['name']}.")
+        return content
+
+    def download(self, item):
+        """
+        Download a Drive file, resuming a partial download left by an earlier run.
+        The file only gets its final name once its checksum is verified.
+        Args:
+            item (dict): The Drive file, as returned by list_files.
+        Returns:
+            str: The path of the local file.
+        """
+        path = os.path.join(self.output_dir, item['name'])
+        partial_path = path + PARTIAL_SUFFIX
+        resumed = os.path.exists(partial_path)
+        while True:
+            with open(partial_path, 'ab') as file:
+                self._fetch_with_retries(item, file, file.tell)
+            if 'md5Checksum' not in item or file_md5(partial_path) == item['md5Checksum']:
+                break
+            os.remove(partial_path)
+            if not resumed:
+                raise ValueError(f"Checksum mismatch for {item['name']}.")
+            # The partial file may come from an older version of the file, start over
+            resumed = False
+        os.replace(partial_path, path)
+        return path
+
+    def sync(self, file_pattern, items=None):
+        """
+        Download the files that are missing or changed, several at a time. Only the
+        most recently modified file of each name is downloaded, since files with the
+        same name would be written to the same local path.
+        Args:
+            file_pattern (str): Part of the file names.
+            items (list): The Drive files to sync. Defaults to listing file_pattern.
+        Returns:
+            dict: The local paths of the 'downloaded' and 'skipped' files, and the errors
+                of the 'failed' ones by file name.
+        """
+        if items is None:
+            items = self.list_files(file_pattern)
+        items = latest_by_name(items)
+        report = {'downloaded': [], 'skipped': [], 'failed': {}}
+        pending = []
+        for item in items:
+            if self.is_current(item):
+                report['skipped'].append(os.path.join(self.output_dir, item['name']))
+            else:
+                pending.append(item)
+        print(f"{len(items)} files found, {len(report['skipped'])} up to date, {len(pending)} to download")
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [(item, executor.submit(self.download, item)) for item in pending]
+            for item, future in futures:
+                try:
+                    report['downloaded'].append(future.result())
+                    print(f"Downloaded {item['name']}")
+                except Exception as error:
+                    report['failed'][item['name']] = str(error)
+                    print(f"Failed to download {item['name']}: {error}")
+        return report
+
+
+def download_files_from_drive(secret_path, FilePattern, OutputDir, workers=DOWNLOAD_WORKERS):
+    """
+    Download the river masks matching a pattern from Google Drive. Files already
+    downloaded and unchanged are skipped, and interrupted downloads are resumed.
+    Args:
+        secret_path (str): Path to the client secrets file.
+        FilePattern (str): Part of the file names.
+        OutputDir (str): Local folder of the files.
+        workers (int): Number of files downloaded at once.
+    Returns:
+        list: The paths of the up to date local files.
+    """
+    if not secret_path:
+        secret_path = input("Enter path to client secrets file: ")
+    if not FilePattern:
+        FilePattern = input("Enter file pattern: ")
+    if not OutputDir:
+        OutputDir = input("Enter output directory: ")
+
+    drive_sync = DriveSync(authenticate(secret_path), OutputDir, workers)
+    report = drive_sync.sync(FilePattern)
+    return report['skipped'] + report['downloaded']
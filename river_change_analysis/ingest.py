@@ -0,0 +1,117 @@
+# Purpose: Decode downloaded river masks in memory and hand them to processing as they arrive
+# Author: Ian St. Laurent
+
+import os
+import tempfile
+from operator import itemgetter
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from rasterio.io import MemoryFile
+from .river import River
+from .packed import PackedMask
+from .mask import mask_year
+from .google_drive_extraction import DOWNLOAD_WORKERS
+
+
+def decode_mask(content, name, write_through=None, packed=False):
+    """
+    Decode GeoTIFF bytes into a River object without touching the disk.
+    Args:
+        content (bytes): The content of the mask file.
+        name (str): Name of the mask file, used for the year.
+        write_through (str): If given, the bytes are also saved in this folder and the
+            River object reloads its mask from there when it is evicted from the cache.
+        packed (bool): Store the mask bit-packed, eight pixels per byte.
+    Returns:
+        River: The River object with its mask and year set.
+    """
+    with MemoryFile(content) as memory_file, memory_file.open() as dataset:
+        mask = dataset.read(1)
+        transform, crs = dataset.transform, dataset.crs
+    if packed:
+        mask = PackedMask.from_array(mask)
+    if write_through is None:
+        # There is no file to reload the mask from, so file_path stays None and the
+        # mask is kept with the River object
+        river = River(None)
+        river.file_name = name
+        river.mask = mask
+    else:
+        file_path = os.path.join(write_through, name)
+        # Write to a temporary file first so a crash never leaves a partial mask
+        handle, temporary_path = tempfile.mkstemp(dir=write_through, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as file:
+            file.write(content)
+        os.replace(temporary_path, file_path)
+        river = River(file_path)
+        river._set_raster('mask', mask, ('load_mask', (packed,)))
+    river.year = mask_year(name)
+    river.transform = transform
+    river.crs = crs
+    return river
+
+
+def stream_rivers(items, fetch, name=None, process=None, write_through=None, packed=False,
+                  workers=DOWNLOAD_WORKERS):
+    """
+    Fetch and decode masks in parallel threads, yielding every River object as soon
+    as it is ready, so downloading the next years overlaps with the work on this one.
+    At most twice as many masks as workers are in flight, which bounds memory use.
+    Args:
+        items (list): The masks to fetch, in any form fetch accepts.
+        fetch (callable): Function returning the GeoTIFF bytes of an item.
+        name (callable): Function returning the file name of an item. Defaults to item['name'].
+        process (callable): Called with each River object in its worker thread right
+            after decoding, for example to compute its water mask.
+        write_through (str): If given, the masks are also saved in this folder.
+        packed (bool): Store the masks bit-packed, eight pixels per byte.
+        workers (int): Number of masks fetched at once.
+    Returns:
+        generator: River objects in the order they finish, not sorted by year.
+    """
+    if name is None:
+        name = itemgetter('name')
+    if write_through is not None:
+        os.makedirs(write_through, exist_ok=True)
+    workers = max(workers or 1, 1)
+
+    def ingest(item):
+        river = decode_mask(fetch(item), name(item), write_through, packed)
+        if process is not None:
+            process(river)
+        return river
+
+    queue = deque(items)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        running = set()
+        while queue or running:
+            while queue and len(running) < 2 * workers:
+                running.add(executor.submit(ingest, queue.popleft()))
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def stream_from_drive(drive_sync, file_pattern, process=None, write_through=False, packed=False):
+    """
+    Stream the masks matching a pattern from Google Drive straight into River objects.
+    Args:
+        drive_sync (DriveSync): The Drive connection.
+        file_pattern (str): Part of the file names.
+        process (callable): Called with each River object in its worker thread right after decoding.
+        write_through (bool): Also save the masks in the output folder of drive_sync.
+            Masks already there and unchanged are read from disk instead of downloaded.
+        packed (bool): Store the masks bit-packed, eight pixels per byte.
+    Returns:
+        generator: River objects in the order they finish, not sorted by year.
+    """
+    folder = drive_sync.output_dir if write_through else None
+
+    def fetch(item):
+        if folder is not None and drive_sync.is_current(item):
+            with open(os.path.join(folder, item['name']), 'rb') as file:
+                return file.read()
+        return drive_sync.fetch(item)
+
+    return stream_rivers(drive_sync.list_files(file_pattern), fetch, process=process, write_through=folder,
+                         packed=packed, workers=drive_sync.workers)
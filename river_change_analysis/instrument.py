@@ -0,0 +1,266 @@
+# Purpose: Opt-in timing and memory instrumentation of the River workflow stages
+# Author: Ian St. Laurent
+
+import threading
+import time
+import tracemalloc
+
+_enabled = False
+_track_memory = False
+_keep_records = True
+_started_tracing = False
+_records = []
+_callbacks = []
+_lock = threading.Lock()
+_local = threading.local()
+
+
+class StageRecord:
+    def __init__(self, stage, year=None, file_path=None, parent=None):
+        """
+        Initialize a StageRecord object, the measurements of one run of one stage.
+        Args:
+            stage (str): Name of the stage, such as 'close_mask'.
+            year (str): Year of the river the stage ran on, if any.
+            file_path (str): Mask file of the river the stage ran on, if any.
+            parent (str): Name of the enclosing stage, if any.
+        """
+        self.stage = stage
+        self.year = year
+        self.file_path = file_path
+        self.parent = parent
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.peak_bytes = None
+        self.arrays = {}
+        self.error = None
+
+    def array(self, name, value):
+        """
+        Record the size of an array the stage produced.
+        Args:
+            name (str): Name of the array, such as 'watermask'.
+            value (np.ndarray): The array, or any object with an nbytes attribute.
+        Returns:
+            None.
+        """
+        self.arrays[name] = int(getattr(value, 'nbytes', 0) or 0)
+
+    def to_dict(self):
+        return {
+            'stage': self.stage,
+            'year': self.year,
+            'file_path': self.file_path,
+            'parent': self.parent,
+            'wall_seconds': self.wall_seconds,
+            'cpu_seconds': self.cpu_seconds,
+            'peak_bytes': self.peak_bytes,
+            'arrays': dict(self.arrays),
+            'error': self.error,
+        }
+
+    def __repr__(self):
+        return (f"StageRecord({self.stage!r}, year={self.year!r}, wall_seconds={self.wall_seconds:.4f}, "
+                f"peak_bytes={self.peak_bytes})")
+
+
+class _NullStage:
+    # Shared by every stage while instrumentation is disabled, so a disabled stage
+    # costs one function call and one attribute check
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def array(self, name, value):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    def __init__(self, name, river, year):
+        self.name = name
+        self.river = river
+        self.year = year
+        self.record = None
+        self._start = None
+        self._peak = 0
+
+    def __enter__(self):
+        stack = _stack()
+        parent = stack[-1] if stack else None
+        year = self.year
+        file_path = None
+        if self.river is not None:
+            file_path = self.river.file_path
+            if year is None:
+                year = self.river.year
+        elif parent is not None:
+            # Inner stages belong to the river of the enclosing stage
+            self.river = parent.river
+            file_path = parent.record.file_path
+            if year is None:
+                year = parent.record.year
+        self.record = StageRecord(self.name, year, file_path, parent.name if parent is not None else None)
+        if _track_memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            if parent is not None:
+                parent._peak = max(parent._peak, peak)
+            _reset_peak()
+            self._start = self._peak = current
+        stack.append(self)
+        self._cpu = time.process_time()
+        self._wall = time.perf_counter()
+        return self.record
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        record = self.record
+        record.wall_seconds = time.perf_counter() - self._wall
+        record.cpu_seconds = time.process_time() - self._cpu
+        stack = _stack()
+        stack.pop()
+        if self._start is not None and tracemalloc.is_tracing():
+            self._peak = max(self._peak, tracemalloc.get_traced_memory()[1])
+            record.peak_bytes = self._peak - self._start
+            _reset_peak()
+            if stack:
+                stack[-1]._peak = max(stack[-1]._peak, self._peak)
+        if record.year is None and self.river is not None and self.river.year is not None:
+            # load_mask only knows the year once it has run
+            record.year = self.river.year
+        if exc_type is not None:
+            record.error = exc_type.__name__
+        _emit(record)
+        return False
+
+
+def _reset_peak():
+    # Before Python 3.9 the peak can not be reset, so it covers everything since enable()
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _emit(record):
+    with _lock:
+        if _keep_records:
+            _records.append(record)
+        callbacks = list(_callbacks)
+    for callback in callbacks:
+        callback(record)
+
+
+def stage(name, river=None, year=None):
+    """
+    Measure a block of code as one stage, for use in a with statement:
+
+        with stage('close_mask', river) as record:
+            closed = close_mask(mask)
+            record.array('closed', closed)
+
+    Stages nested in another stage inherit its river and year.
+    Args:
+        name (str): Name of the stage.
+        river (River): The River object the stage runs on, if any.
+        year (str): The year the stage runs on, if there is no River object.
+    Returns:
+        A context manager whose value records array sizes. It does nothing while
+        instrumentation is disabled.
+    """
+    if not _enabled:
+        return _NULL_STAGE
+    return _Stage(name, river, year)
+
+
+def enable(memory=False, keep_records=True, callback=None):
+    """
+    Start recording stages.
+    Args:
+        memory (bool): Also record the peak memory allocated by each stage with
+            tracemalloc. This slows down code that allocates many small Python objects.
+            Peaks of stages running in several threads at once include each other.
+        keep_records (bool): Keep the records in memory for records(). Turn off when
+            the callbacks are enough, for long running jobs.
+        callback (callable): Called with every StageRecord when its stage ends.
+    Returns:
+        None.
+    """
+    global _enabled, _track_memory, _keep_records, _started_tracing
+    if callback is not None:
+        add_callback(callback)
+    _keep_records = keep_records
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _started_tracing = True
+    _track_memory = memory
+    _enabled = True
+
+
+def disable():
+    """
+    Stop recording stages. The records and callbacks are kept.
+    Returns:
+        None.
+    """
+    global _enabled, _track_memory, _started_tracing
+    if _started_tracing:
+        tracemalloc.stop()
+        _started_tracing = False
+    _enabled = False
+    _track_memory = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def add_callback(callback):
+    """
+    Register a function called with every StageRecord when its stage ends, for
+    example to send the measurements to a monitoring system.
+    Args:
+        callback (callable): The function.
+    Returns:
+        None.
+    """
+    with _lock:
+        _callbacks.append(callback)
+
+
+def remove_callback(callback):
+    with _lock:
+        _callbacks.remove(callback)
+
+
+def records(stage=None, year=None):
+    """
+    Get the recorded stages.
+    Args:
+        stage (str): Only return the records of this stage.
+        year (str): Only return the records of this year.
+    Returns:
+        list: The StageRecord objects in the order their stages ended.
+    """
+    with _lock:
+        found = list(_records)
+    return [record for record in found
+            if (stage is None or record.stage == stage) and (year is None or str(record.year) == str(year))]
+
+
+def clear():
+    """
+    Forget the recorded stages.
+    Returns:
+        None.
+    """
+    with _lock:
+        del _records[:]
@@ -2,6 +2,59 @@
 # Author: Ian St. Laurent
 
 import os
+import re
+import json
+import rasterio
+
+# A standalone four digit year, as in Reach_1_river_mask1986.tif or Reach_1_river_mask_1986-0000000000-0000000000.tif
+YEAR_PATTERN = re.compile(r'(?<!\d)((?:19|20)\d{2})(?!\d)')
+# The name of the product between the reach and the year
+MASK_SUFFIX_PATTERN = re.compile(r'[_\-\s]*(?:river[_\-\s]*)?mask[_\-\s]*$', re.IGNORECASE)
+CATALOG_FILE_NAME = '.river_mask_catalog.json'
+# Suffixes of the rasters derived from masks, streaming.CHANGE_SUFFIX and terrain.SLOPE_SUFFIX
+DERIVED_SUFFIXES = ('_change', '_slope')
+
+def parse_mask_name(file_path):
+    """
+    Parse the reach name and year of a river mask file.
+    Args:
+        file_path (str): Path or name of the mask file.
+    Returns:
+        tuple: The reach name and the year, or None if the name has no year.
+    """
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    matches = list(YEAR_PATTERN.finditer(name))
+    if not matches:
+        return None
+    year = matches[-1]
+    reach = MASK_SUFFIX_PATTERN.sub('', name[:year.start()])
+    return reach.strip('_- '), int(year.group(1))
+
+def is_derived(file_path):
+    """
+    Check whether a raster was derived from a mask, such as the change raster of
+    stream_erosion, rather than being a mask itself.
+    Args:
+        file_path (str): Path or name of the file.
+    Returns:
+        bool: True for derived rasters.
+    """
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    return name.lower().endswith(DERIVED_SUFFIXES)
+
+def mask_year(file_path):
+    """
+    Get the year of a river mask file.
+    Args:
+        file_path (str): Path or name of the mask file.
+    Returns:
+        str: The year, as stored in River.year.
+    """
+    parsed = parse_mask_name(file_path)
+    if parsed is None:
+        return file_path[-8:-4]
+    return str(parsed[1])
+
 def mask_import(folder_path, file_pattern):
 
     # If no folder_path is provided, prompt the user to enter one
@@ -18,11 +71,186 @@ def mask_import(folder_path, file_pattern):
     # Loop through all files in the directory
     for file_name in os.listdir(folder_path):
         # If the file name starts with the file pattern and ends with ".tif"
-        if file_name.startswith(file_pattern) and file_name.endswith(".tif"):
+        if file_name.startswith(file_pattern) and file_name.endswith(".tif") and not is_derived(file_name):
             # Construct the full file path
             file_path = os.path.join(folder_path, file_name)
             # Add the file path to the list
             file_paths.append(file_path)
 
-    # Return the list of file paths
-    return file_paths
+    # Return the list of file paths, sorted by year
+    return sorted(file_paths, key=lambda path: (mask_year(path), path))
+
+
+class MaskCatalog:
+    def __init__(self, root, entries):
+        """
+        Initialize a MaskCatalog object.
+        Args:
+            root (str): The folder that was scanned.
+            entries (list): One dictionary per mask file with its path, reach, year and header.
+        """
+        self.root = root
+        self.entries = sorted(entries, key=lambda entry: (entry['reach'], entry['year'], entry['path']))
+
+    @classmethod
+    def scan(cls, root, refresh=False):
+        """
+        Scan a folder tree for river masks, reading only the GeoTIFF headers. Rasters
+        derived from masks and multi-band files holding several years are left out.
+        The result is stored in a sidecar index in the folder, and files whose size and
+        modification time have not changed are not opened again on later scans.
+        Args:
+            root (str): The folder to scan.
+            refresh (bool): Ignore the sidecar index and read every header again.
+        Returns:
+            MaskCatalog: The catalog of the masks in the folder.
+        """
+        index_path = os.path.join(root, CATALOG_FILE_NAME)
+        known = {}
+        if not refresh and os.path.exists(index_path):
+            try:
+                with open(index_path) as index:
+                    known = {entry['path']: entry for entry in json.load(index)['entries']}
+            except (OSError, ValueError, KeyError):
+                known = {}
+
+        entries = []
+        changed = False
+        folders = [root]
+        while folders:
+            with os.scandir(folders.pop()) as scan:
+                for item in scan:
+                    if item.is_dir():
+                        folders.append(item.path)
+                        continue
+                    if not item.name.lower().endswith(('.tif', '.tiff')):
+                        continue
+                    parsed = parse_mask_name(item.name)
+                    if parsed is None or is_derived(item.name):
+                        continue
+                    path = os.path.relpath(item.path, root)
+                    stat = item.stat()
+                    entry = known.get(path)
+                    if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime_ns:
+                        entry = cls._read_header(item.path)
+                        entry.update(path=path, reach=parsed[0], year=parsed[1],
+                                     size=stat.st_size, mtime=stat.st_mtime_ns)
+                        changed = True
+                    entries.append(entry)
+
+        if changed or len(entries) != len(known):
+            try:
+                with open(index_path, 'w') as index:
+                    json.dump({'entries': entries}, index)
+            except OSError:
+                # A read-only folder still gets a catalog, just not a persistent one
+                pass
+        # Multi-band files stay in the index so their headers are not read again
+        return cls(root, [entry for entry in entries if entry['count'] == 1])
+
+    @staticmethod
+    def _read_header(file_path):
+        """
+        Read the header of a GeoTIFF without decoding its pixels.
+        Args:
+            file_path (str): Path to the GeoTIFF.
+        Returns:
+            dict: The shape, dtype, transform, CRS and nodata value of the file.
+        """
+        with rasterio.open(file_path) as dataset:
+            transform = dataset.transform
+            return {
+                'width': dataset.width,
+                'height': dataset.height,
+                'count': dataset.count,
+                'dtype': dataset.dtypes[0],
+                'transform': [transform.a, transform.b, transform.c, transform.d, transform.e, transform.f],
+                'crs': dataset.crs.to_string() if dataset.crs else None,
+                'nodata': dataset.nodata,
+            }
+
+    def __len__(self):
+        return len(self.entries)
+
+    def reaches(self):
+        """
+        List the reaches in the catalog.
+        Returns:
+            list: The sorted reach names.
+        """
+        return sorted({entry['reach'] for entry in self.entries})
+
+    def select(self, reach=None, start_year=None, end_year=None):
+        """
+        Select the entries of one reach and range of years.
+        Args:
+            reach (str): The reach name. All reaches if None.
+            start_year (int): First year to include.
+            end_year (int): Last year to include.
+        Returns:
+            list: The matching entries, sorted by reach and year.
+        """
+        return [entry for entry in self.entries
+                if (reach is None or entry['reach'] == reach)
+                and (start_year is None or entry['year'] >= start_year)
+                and (end_year is None or entry['year'] <= end_year)]
+
+    def years(self, reach=None):
+        """
+        List the years of a reach.
+        Args:
+            reach (str): The reach name. All reaches if None.
+        Returns:
+            list: The years in increasing order.
+        """
+        return [entry['year'] for entry in self.select(reach)]
+
+    def paths(self, reach=None, start_year=None, end_year=None):
+        """
+        List the mask files of a reach, sorted by year, like mask_import.
+        Args:
+            reach (str): The reach name. All reaches if None.
+            start_year (int): First year to include.
+            end_year (int): Last year to include.
+        Returns:
+            list: The full paths of the mask files.
+        """
+        return [os.path.join(self.root, entry['path']) for entry in self.select(reach, start_year, end_year)]
+
+    def rivers(self, reach, start_year=None, end_year=None):
+        """
+        Create a River object for every year of a reach, with its year already set.
+        Args:
+            reach (str): The reach name.
+            start_year (int): First year to include.
+            end_year (int): Last year to include.
+        Returns:
+            list: A list of River objects sorted by year.
+        """
+        from .river import River
+        rivers = []
+        for entry in self.select(reach, start_year, end_year):
+            river = River(os.path.join(self.root, entry['path']))
+            river.year = str(entry['year'])
+            rivers.append(river)
+        return rivers
+
+    def validate(self, reach):
+        """
+        Check that the masks of a reach can be compared with each other.
+        Args:
+            reach (str): The reach name.
+        Returns:
+            None. Raises ValueError if years are duplicated or the grids differ.
+        """
+        entries = self.select(reach)
+        if not entries:
+            raise ValueError(f"No masks found for reach {reach}.")
+        years = [entry['year'] for entry in entries]
+        if len(set(years)) != len(years):
+            raise ValueError(f"Reach {reach} has more than one mask for the same year.")
+        first = entries[0]
+        for entry in entries[1:]:
+            for field in ('width', 'height', 'transform', 'crs'):
+                if entry[field] != first[field]:
+                    raise ValueError(f"{entry['path']} does not have the same {field} as {first['path']}.")
@@ -0,0 +1,141 @@
+# Purpose: Measure how far the centerline moves between years with distance transforms
+# Author: Ian St. Laurent
+
+import numpy as np
+from .river import distance_to_pixels
+from .packed import PackedMask
+from .parallel import parallel_map
+from .instrument import stage
+
+# Percentile of the migration distances reported next to the mean, median and maximum
+MIGRATION_PERCENTILE = 90
+
+
+def migration_pairs(years, pairs=None):
+    """
+    Resolve the pairs of years to compare into positions in a list sorted by year.
+    Args:
+        years (list): The year of every River object, sorted.
+        pairs (list): (earlier, later) year tuples. Defaults to every consecutive pair.
+    Returns:
+        list: (earlier, later) position tuples.
+    """
+    if pairs is None:
+        return [(i - 1, i) for i in range(1, len(years))]
+    positions = {int(year): i for i, year in enumerate(years)}
+    resolved = []
+    for earlier, later in pairs:
+        if int(earlier) not in positions or int(later) not in positions:
+            raise ValueError(f"No centerline for the pair {earlier}-{later}.")
+        if int(earlier) >= int(later):
+            raise ValueError(f"The pair {earlier}-{later} is not in increasing order.")
+        resolved.append((positions[int(earlier)], positions[int(later)]))
+    return resolved
+
+
+def _migration_job(args):
+    """
+    Compute the distance transform of an earlier centerline in a worker process and
+    sample it at the pixels of every later centerline compared with it.
+    Args:
+        args (tuple): The packed earlier centerline, its pixel sampling and the flat
+            pixel indices of each later centerline.
+    Returns:
+        list: The migration distances of each later centerline.
+    """
+    centerline, sampling, later_pixels = args
+    distance = distance_to_pixels(np.asarray(centerline), sampling).ravel()
+    return [distance[pixels] for pixels in later_pixels]
+
+
+def summarize(distances, percentile=MIGRATION_PERCENTILE):
+    """
+    Summarize the migration distances of several pairs of years as arrays.
+    Args:
+        distances (list of np.ndarray): The distances of each pair.
+        percentile (float): Percentile reported as 'p<percentile>'.
+    Returns:
+        dict: 'count', 'mean', 'median', 'p<percentile>' and 'max' arrays, one value per
+            pair, NaN for pairs without centerline pixels.
+    """
+    n_pairs = len(distances)
+    summary = {'count': np.array([len(values) for values in distances], dtype=np.int64)}
+    for key in ('mean', 'median', f'p{percentile:g}', 'max'):
+        summary[key] = np.full(n_pairs, np.nan)
+    for i, values in enumerate(distances):
+        values = values[np.isfinite(values)]
+        if not len(values):
+            continue
+        summary['mean'][i] = values.mean()
+        summary['median'][i] = np.median(values)
+        summary[f'p{percentile:g}'][i] = np.percentile(values, percentile)
+        summary['max'][i] = values.max()
+    return summary
+
+
+def centerline_migration(annual_data, pairs=None, workers=None, maps=False):
+    """
+    Measure the migration of the centerline between pairs of years. Every pixel of the
+    later centerline gets its distance to the nearest pixel of the earlier one, read
+    from the distance transform of the earlier centerline. Each earlier year gets a
+    single transform, shared by all the pairs it starts.
+    Args:
+        annual_data (list): A list of River objects with processed centerlines.
+        pairs (list): (earlier, later) year tuples. Defaults to every consecutive pair.
+        workers (int): Number of worker processes, each computing the transforms of
+            some earlier years. With 1, the transforms are computed in this process
+            and kept in the raster cache of the River objects for later calls.
+        maps (bool): Also return a raster per pair with the distances on the later
+            centerline and NaN elsewhere.
+    Returns:
+        dict: The (earlier, later) 'years' of each pair, the per-pixel 'distances' in
+            meters in row-major order of the later centerline, their 'pixels' as flat
+            indices, the summary arrays of summarize, the mean 'rate' in meters per
+            year and, if requested, the 'maps'.
+    """
+    annual_data = sorted(annual_data, key=lambda river: int(river.year))
+    years = [int(river.year) for river in annual_data]
+    positions = migration_pairs(years, pairs)
+    shapes = {np.asarray(river.centerline).shape for river in annual_data}
+    if len(shapes) > 1:
+        raise ValueError("The centerlines do not all have the same shape.")
+
+    # Group the pairs by earlier year so every transform is computed once
+    later_of = {}
+    for earlier, later in positions:
+        later_of.setdefault(earlier, []).append(later)
+    pixels = {i: np.flatnonzero(np.asarray(annual_data[i].centerline))
+              for i in sorted({later for _, later in positions})}
+    results = {}
+    with stage('centerline_migration'):
+        if workers == 1 or len(later_of) <= 1:
+            for earlier, laters in later_of.items():
+                distance = annual_data[earlier].centerline_distance
+                if distance is None:
+                    distance = annual_data[earlier].centerline_distance_transform()
+                distance = distance.ravel()
+                for later in laters:
+                    results[earlier, later] = distance[pixels[later]]
+        else:
+            jobs = []
+            for earlier, laters in later_of.items():
+                centerline = np.asarray(annual_data[earlier].centerline)
+                jobs.append((PackedMask.from_array(centerline), annual_data[earlier].pixel_sampling(centerline.shape),
+                             [pixels[later] for later in laters]))
+            for (earlier, laters), distances in zip(later_of.items(), parallel_map(_migration_job, jobs, workers)):
+                for later, values in zip(laters, distances):
+                    results[earlier, later] = values
+
+    distances = [results[pair] for pair in positions]
+    migration = summarize(distances)
+    pair_years = np.array([(years[earlier], years[later]) for earlier, later in positions], dtype=int).reshape(-1, 2)
+    migration.update(years=pair_years, distances=distances, pixels=[pixels[later] for _, later in positions],
+                     rate=migration['mean'] / (pair_years[:, 1] - pair_years[:, 0]))
+    if maps:
+        shape = shapes.pop()
+        migration['maps'] = []
+        for (_, later), values in zip(positions, distances):
+            raster = np.full(shape, np.nan, dtype=np.float32)
+            raster.ravel()[pixels[later]] = values
+            migration['maps'].append(raster)
+    return migration
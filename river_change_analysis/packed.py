@@ -0,0 +1,97 @@
+# Purpose: Bit-packed binary masks, eight pixels per byte
+# Author: Ian St. Laurent
+
+import numpy as np
+
+# Number of set bits in every possible byte, used when numpy has no bitwise_count
+_POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+
+def popcount(bits):
+    """
+    Count the set bits of a uint8 array.
+    Args:
+        bits (np.ndarray): The packed bytes.
+    Returns:
+        int: The number of set bits.
+    """
+    if hasattr(np, 'bitwise_count'):
+        return int(np.bitwise_count(bits).sum(dtype=np.int64))
+    return int(_POPCOUNT[bits].sum(dtype=np.int64))
+
+
+class PackedMask:
+    def __init__(self, bits, shape, dtype=np.uint8):
+        """
+        Initialize a PackedMask object.
+        Args:
+            bits (np.ndarray): The mask packed row by row with np.packbits, so every
+                row starts on a new byte and the padding bits at the end are zero.
+            shape (tuple): The (row, col) shape of the unpacked mask.
+            dtype (np.dtype): The dtype to restore when the mask is unpacked.
+        """
+        self.bits = bits
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+
+    @classmethod
+    def from_array(cls, array):
+        """
+        Pack a binary mask. Every non-zero pixel is stored as a one.
+        Args:
+            array (np.ndarray): A 2-D binary mask.
+        Returns:
+            PackedMask: The packed mask.
+        """
+        return cls(np.packbits(array != 0, axis=-1), array.shape, array.dtype)
+
+    def to_array(self, dtype=None):
+        """
+        Unpack the mask.
+        Args:
+            dtype (np.dtype): The dtype of the returned array. Defaults to the dtype
+                of the mask that was packed.
+        Returns:
+            np.ndarray: The unpacked mask.
+        """
+        array = np.unpackbits(self.bits, axis=-1, count=self.shape[-1])
+        return array.astype(dtype or self.dtype, copy=False)
+
+    def __array__(self, dtype=None, copy=None):
+        return self.to_array(dtype)
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes
+
+    def count(self):
+        """
+        Count the pixels that are set.
+        Returns:
+            int: The number of ones in the mask.
+        """
+        return popcount(self.bits)
+
+    def _check(self, other):
+        if self.shape != other.shape:
+            raise ValueError("Packed masks must have the same shape.")
+
+    def __and__(self, other):
+        self._check(other)
+        return PackedMask(self.bits & other.bits, self.shape, self.dtype)
+
+    def __or__(self, other):
+        self._check(other)
+        return PackedMask(self.bits | other.bits, self.shape, self.dtype)
+
+    def and_not(self, other):
+        """
+        Pixels set in this mask but not in the other one, such as the accretion
+        between two years. The padding bits stay zero because they are zero here.
+        Args:
+            other (PackedMask): The mask to subtract.
+        Returns:
+            PackedMask: The difference of the two masks.
+        """
+        self._check(other)
+        return PackedMask(self.bits & ~other.bits, self.shape, self.dtype)
@@ -0,0 +1,27 @@
+# Purpose: Run independent jobs across a pool of worker processes
+# Author: Ian St. Laurent
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+
+def parallel_map(function, jobs, workers=None, chunksize=1):
+    """
+    Apply a function to every job across a pool of worker processes, in order.
+    Args:
+        function (callable): A module level function taking a single job.
+        jobs (list): The jobs to run.
+        workers (int): Number of worker processes. Defaults to all cores.
+        chunksize (int): Number of jobs sent to a worker at a time.
+    Returns:
+        generator: The results, in the same order as the jobs.
+    """
+    if workers is None or workers <= 0:
+        workers = os.cpu_count() or 1
+    if workers == 1 or len(jobs) <= 1:
+        for job in jobs:
+            yield function(job)
+        return
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+        for result in executor.map(function, jobs, chunksize=chunksize):
+            yield result
@@ -0,0 +1,240 @@
+# Purpose: Raster-composited, headless-friendly rendering of River plots
+# Author: Ian St. Laurent
+
+import os
+import numpy as np
+import cv2
+import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.lines import Line2D
+from .parallel import parallel_map
+
+# Share of the figure taken by the axes of a single plot, used to scale line widths
+AXES_FRACTION = 0.75
+
+
+def new_figure(figsize, dpi=100, file_path=None):
+    """
+    Create a figure. Figures saved to a file are drawn with the Agg canvas directly,
+    so they need no display and never touch the pyplot state.
+    Args:
+        figsize (tuple): Figure size in inches.
+        dpi (int): Resolution of the figure.
+        file_path (str): The file the figure will be saved to, or None to show it.
+    Returns:
+        tuple: The figure and its axes.
+    """
+    if file_path is None:
+        return plt.subplots(figsize=figsize, dpi=dpi)
+    fig = Figure(figsize=figsize, dpi=dpi)
+    FigureCanvasAgg(fig)
+    return fig, fig.add_subplot()
+
+
+def finish_figure(fig, file_path=None):
+    """
+    Show a figure, or save it to a file.
+    Args:
+        fig (matplotlib.figure.Figure): The figure.
+        file_path (str): The file to save the figure to, or None to show it.
+    Returns:
+        None.
+    """
+    if file_path is None:
+        plt.show()
+    else:
+        fig.savefig(file_path, bbox_inches='tight')
+
+
+def suffixed_path(file_path, suffix):
+    """
+    Get the file of another figure saved next to a figure, such as Reach_1_filled.png
+    next to Reach_1.png.
+    Args:
+        file_path (str): The file of the first figure, or None to show the figures.
+        suffix (str): The suffix of the other figure.
+    Returns:
+        str: The file of the other figure, or None.
+    """
+    if file_path is None:
+        return None
+    root, extension = os.path.splitext(file_path)
+    return root + suffix + extension
+
+
+def composite_layers(layers, colors, alpha=1.0, shape=None):
+    """
+    Composite binary layers into one RGBA image, later layers drawn over earlier ones.
+    The colors are not premultiplied by the alpha, as imshow expects, so drawing the
+    image matches drawing every layer on its own.
+    Args:
+        layers (list of np.ndarray): Binary masks of the same shape.
+        colors (np.ndarray): One RGBA color per layer, with values between 0 and 1.
+        alpha (float): Opacity of every layer.
+        shape (tuple): Shape of the image, needed when there are no layers.
+    Returns:
+        np.ndarray: A (row, col, 4) float32 RGBA image, transparent where no layer is set.
+    """
+    if shape is None:
+        shape = np.shape(layers[0])
+    image = np.zeros(tuple(shape) + (4,), dtype=np.float32)
+    for layer, color in zip(layers, colors):
+        pixels = np.asarray(layer, dtype=bool)
+        opacity = color[3] * alpha
+        # Standard "over" compositing with straight alpha, only on the pixels of the layer
+        covered = image[pixels]
+        below = covered[:, 3:] * (1 - opacity)
+        total = opacity + below
+        covered[:, :3] = (np.asarray(color[:3], dtype=np.float32) * opacity + covered[:, :3] * below) / total
+        covered[:, 3:] = total
+        image[pixels] = covered
+    return image
+
+
+def line_width_for(shape, figsize, dpi):
+    """
+    Get the line width keeping one pixel lines visible once a raster is scaled down to a figure.
+    Args:
+        shape (tuple): Shape of the raster.
+        figsize (tuple): Figure size in inches.
+        dpi (int): Resolution of the figure.
+    Returns:
+        int: The line width in raster pixels, at least 1.
+    """
+    # The axes take about this share of the figure
+    scale = max(shape[1] / (figsize[0] * dpi * AXES_FRACTION), shape[0] / (figsize[1] * dpi * AXES_FRACTION))
+    return max(int(np.ceil(scale)), 1)
+
+
+def _thicken(layer, line_width):
+    """
+    Widen a one pixel line so it stays visible once the image is scaled down.
+    Args:
+        layer (np.ndarray): Binary mask of the line.
+        line_width (int): Width of the line in pixels.
+    Returns:
+        np.ndarray: The widened mask.
+    """
+    layer = np.asarray(layer, dtype=np.uint8)
+    if line_width > 1:
+        layer = cv2.dilate(layer, np.ones((line_width, line_width), np.uint8))
+    return layer
+
+
+def _legend(colors, labels):
+    return [Line2D([0], [0], marker='o', color='w', label=label, markerfacecolor=color, markersize=10)
+            for color, label in zip(colors, labels)]
+
+
+def render_centerline(annual_data, file_path=None, step=5, line_width=None, figsize=(15, 10), dpi=100):
+    """
+    Draw the centerline of every step-th year as one composited image.
+    Args:
+        annual_data (list): A list of River objects representing the river at different points in time.
+        file_path (str): Save the figure to this file instead of showing it.
+        step (int): Plot every step-th year.
+        line_width (int): Width of the centerlines in pixels. Defaults to the width
+            keeping them visible at the size of the figure.
+        figsize (tuple): Figure size in inches.
+        dpi (int): Resolution of the figure.
+    Returns:
+        np.ndarray: The composited RGBA image.
+    """
+    rivers = [annual_data[i] for i in range(0, len(annual_data), step)]
+    colors = plt.cm.Spectral(np.linspace(0, 1, len(rivers)))
+    if line_width is None:
+        line_width = line_width_for(np.shape(rivers[0].centerline), figsize, dpi)
+    image = composite_layers([_thicken(river.centerline, line_width) for river in rivers], colors, alpha=0.9)
+    fig, ax = new_figure(figsize, dpi, file_path)
+    ax.set_facecolor('black')
+    ax.imshow(image, interpolation='nearest')
+    ax.set_title('River Centerline Evolution Over Time')
+    ax.legend(handles=_legend(colors, [str(river.year) for river in rivers]), loc='best')
+    ax.set_xlabel('X Coordinate')
+    ax.set_ylabel('Y Coordinate')
+    ax.set_aspect('equal')
+    finish_figure(fig, file_path)
+    return image
+
+
+def render_river_edges(annual_data, file_path=None, step=5, line_width=None, figsize=(20, 15), dpi=100):
+    """
+    Draw the river edges of every step-th year as one composited image.
+    Args:
+        annual_data (list): A list of River objects representing the river at different points in time.
+        file_path (str): Save the figure to this file instead of showing it.
+        step (int): Plot every step-th year.
+        line_width (int): Width of the edges in pixels. Defaults to the width
+            keeping them visible at the size of the figure.
+        figsize (tuple): Figure size in inches.
+        dpi (int): Resolution of the figure.
+    Returns:
+        np.ndarray: The composited RGBA image.
+    """
+    annual_data = sorted(annual_data, key=lambda river: river.year)
+    rivers = [annual_data[i] for i in range(0, len(annual_data), step)]
+    colors = plt.cm.Spectral(np.linspace(0, 1, len(rivers)))
+    edges = [river._extract_river_edges() for river in rivers]
+    if line_width is None:
+        line_width = line_width_for(edges[0].shape, figsize, dpi)
+    layers = [_thicken(layer, line_width) for layer in edges]
+    image = composite_layers(layers, colors, alpha=0.6)
+    fig, ax = new_figure(figsize, dpi, file_path)
+    ax.imshow(image, interpolation='nearest')
+    ax.set_title('River Edge Evolution')
+    ax.legend(handles=_legend(colors, [str(river.year) for river in rivers]), bbox_to_anchor=(1.05, 1),
+              loc='upper left')
+    ax.set_xlabel('X Coordinate')
+    ax.set_ylabel('Y Coordinate')
+    ax.set_aspect('equal')
+    finish_figure(fig, file_path)
+    return image
+
+
+def render_mask(mask, title, file_path=None, figsize=(15, 10), dpi=100):
+    """
+    Draw a single binary mask.
+    Args:
+        mask (np.ndarray): The mask to draw.
+        title (str): Title of the figure.
+        file_path (str): Save the figure to this file instead of showing it.
+        figsize (tuple): Figure size in inches.
+        dpi (int): Resolution of the figure.
+    Returns:
+        None.
+    """
+    fig, ax = new_figure(figsize, dpi, file_path)
+    ax.imshow(np.asarray(mask), cmap='Blues', interpolation='none', alpha=0.7)
+    ax.set_title(title)
+    finish_figure(fig, file_path)
+
+
+def _render_task(task):
+    """
+    Run one rendering task in a worker process.
+    Args:
+        task (tuple): The render function, its River objects and the output file.
+    Returns:
+        str: The output file.
+    """
+    function, annual_data, file_path = task
+    function(annual_data, file_path=file_path)
+    return file_path
+
+
+def render_many(tasks, workers=None):
+    """
+    Render many figures to files in parallel, for example every reach of a study.
+    Args:
+        tasks (list): (render function, list of River objects, output file) tuples,
+            such as (render_centerline, rivers, 'reach_1_centerline.png').
+        workers (int): Number of worker processes. Defaults to all cores.
+    Returns:
+        list: The output files.
+    """
+    for _, _, file_path in tasks:
+        folder = os.path.dirname(file_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+    return list(parallel_map(_render_task, tasks, workers))
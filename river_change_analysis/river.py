@@ -1,87 +1,358 @@
 # This script defines a River class for analyzing and visualizing river data.
 # Author: Ian St. Laurent
 import os
+import itertools
+import weakref
 import numpy as np
 import rasterio
-import cv2
-import matplotlib.pyplot as plt
-from matplotlib.lines import Line2D
-from shapely.geometry import LineString
-from scipy.ndimage import distance_transform_edt, gaussian_gradient_magnitude, binary_erosion
-from skimage.morphology import skeletonize, thin, remove_small_objects
-from skimage.filters import sobel, threshold_otsu
-from skimage import measure, morphology
-from matplotlib.animation import FuncAnimation
-from mpl_toolkits.axes_grid1 import make_axes_locatable
+from rasterio.transform import Affine
+from .packed import PackedMask
+from .cache import RasterCache
+from .mask import mask_year
+from .instrument import stage
+from .terrain import load_slope, pixel_spacing
 
 MAX_DISTANCE_BRANCH_REMOVAL = 100
 WATER_MASK_MIN_SIZE = 1000
+PIXEL_SIZE = 30
+
+# Row and column offsets of the 8-connected neighbors of a pixel
+_NEIGHBOR_OFFSETS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+def _count_neighbors(padded):
+    """
+    Count the 8-connected neighbors of every pixel in a zero-padded binary image.
+    Args:
+        padded (np.ndarray): Binary image padded with a one pixel border of zeros.
+    Returns:
+        np.ndarray: Neighbor count of every pixel (the border is always zero).
+    """
+    padded = padded.astype(np.uint8)
+    counts = np.zeros(padded.shape, dtype=np.uint8)
+    core = counts[1:-1, 1:-1]
+    rows, cols = padded.shape
+    for dy, dx in _NEIGHBOR_OFFSETS:
+        core += padded[1 + dy:rows - 1 + dy, 1 + dx:cols - 1 + dx]
+    return counts
+
+def prune_skeleton(skeleton, max_distance):
+    """
+    Remove the end points of a skeleton max_distance times, shortening every branch.
+    All end points present at the start of an iteration are removed together, as if
+    the whole raster were rescanned each time, but only the neighbors of the removed
+    pixels are revisited, so the cost is linear in the image size plus the number of
+    removed pixels.
+    Args:
+        skeleton (np.ndarray): Binary mask of the centerline.
+        max_distance (int): The maximum distance to remove branches.
+    Returns:
+        np.ndarray: The pruned boolean skeleton.
+    """
+    padded = np.pad(skeleton.astype(bool), 1, mode='constant', constant_values=False)
+    width = padded.shape[1]
+    counts = _count_neighbors(padded).ravel()
+    pixels = padded.ravel()
+    offsets = np.array([dy * width + dx for dy, dx in _NEIGHBOR_OFFSETS])
+    end_points = np.flatnonzero(pixels & (counts == 1))
+    for _ in range(max_distance):
+        if end_points.size == 0:
+            break
+        pixels[end_points] = False
+        # Only the neighbors of removed end points can become new end points
+        neighbors = (end_points[:, None] + offsets).ravel()
+        np.subtract.at(counts, neighbors, 1)
+        neighbors = np.unique(neighbors)
+        end_points = neighbors[pixels[neighbors] & (counts[neighbors] == 1)]
+    return padded[1:-1, 1:-1].copy()
+
+def close_mask(mask):
+    """
+    Close small gaps in a binary river mask.
+    Args:
+        mask (np.ndarray): Binary mask of the river.
+    Returns:
+        np.ndarray: The closed mask.
+    """
+    import cv2
+    # Fill small holes in binary mask
+    kernel = np.ones((5,5),np.uint8)
+    return cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+
+def fill_water_mask(mask, min_size):
+    """
+    Close small gaps in a binary river mask and fill in holes smaller than min_size.
+    Args:
+        mask (np.ndarray): Binary mask of the river.
+        min_size (int): Minimum size of a bar to be kept.
+    Returns:
+        np.ndarray: The filled water mask.
+    """
+    from skimage import measure
+    with stage('close_mask'):
+        watermask = close_mask(mask)
+    if min_size is None or min_size <= 0:
+        min_size = WATER_MASK_MIN_SIZE
+    with stage('fill_holes'):
+        # Identify small bars and fill them in with a single lookup of every region's area
+        labels = measure.label(watermask == 0)
+        fill = np.bincount(labels.ravel()) < min_size
+        fill[0] = False
+        watermask[fill[labels]] = 1
+    return watermask
+
+def distance_to_pixels(raster, sampling):
+    """
+    Compute the distance from every pixel to the nearest set pixel of a binary raster.
+    Args:
+        raster (np.ndarray): Binary raster, such as a centerline.
+        sampling (tuple): The row and column spacing of the pixels.
+    Returns:
+        np.ndarray: The float32 distances, infinite everywhere if no pixel is set.
+    """
+    from scipy.ndimage import distance_transform_edt
+    raster = np.asarray(raster, dtype=bool)
+    if not raster.any():
+        return np.full(raster.shape, np.inf, dtype=np.float32)
+    return distance_transform_edt(~raster, sampling=sampling).astype(np.float32)
+
+# Unique owner id of each River object in the raster cache
+_river_ids = itertools.count()
+
+def _release(river_id):
+    """
+    Drop the cached rasters of a River object once it is garbage collected.
+    Args:
+        river_id (int): The owner id of the River object.
+    Returns:
+        None.
+    """
+    River.cache.discard_owner(river_id)
+
+def _raster_property(name):
+    """
+    Build a property that stores a raster in the shared cache and regenerates it on demand.
+    Args:
+        name (str): Name of the raster, such as 'mask'.
+    Returns:
+        property: The property.
+    """
+    def getter(self):
+        return self._get_raster(name)
+    def setter(self, value):
+        self._set_raster(name, value)
+    return property(getter, setter)
 
 class River:
     DEM = None
     SLOPE = None
+    # Shared by every River object; set cache.max_bytes to change the memory budget
+    cache = RasterCache()
+    # Set to a DiskCache to reuse water masks and centerlines across sessions
+    disk_cache = None
+
+    mask = _raster_property('mask')
+    watermask = _raster_property('watermask')
+    centerline = _raster_property('centerline')
+    # Distance in meters from every pixel to the nearest centerline pixel
+    centerline_distance = _raster_property('centerline_distance')
+    # Distance in meters from every water pixel to the nearest bank
+    watermask_distance = _raster_property('watermask_distance')
+    # Rasters computed from another one, dropped when it changes
+    DERIVED_RASTERS = {'centerline': ('centerline_distance',), 'watermask': ('watermask_distance',)}
+
     def __init__(self, mask_file_path):
         """
-        Initialize a River object.
+        Initialize a River object. The mask is loaded from the file on first access.
         Args:
             mask_file_path (str): Path to the mask file.
         """
+        self._id = next(_river_ids)
+        self._pinned = {}
+        self._sources = {}
+        weakref.finalize(self, _release, self._id)
         self.file_path = mask_file_path
+        # Name of the mask file, also set for masks that were never saved to disk
+        self.file_name = os.path.basename(mask_file_path) if mask_file_path is not None else None
         self.year = None
-        self.mask = None
-        self.watermask = None
-        self.centerline = None
+        self.graph = None
+        self.vector = None
+        self.transform = None
+        self.crs = None
         self.erosion = None
         self.accretion = None
+        self.migration = None
+        self.width = None
+        if mask_file_path is not None:
+            self._sources['mask'] = ('load_mask', (False,))
+
+    def __getstate__(self):
+        """
+        Pickle a River object, such as when it is sent to a worker process. Cached
+        rasters are sent along with the pinned ones.
+        """
+        state = self.__dict__.copy()
+        state['_cached'] = {name: River.cache.get((self._id, name)) for name in self._sources}
+        if self.transform is not None:
+            # Sent as plain coefficients, which pickle with every version of affine
+            transform = self.transform
+            state['transform'] = (transform.a, transform.b, transform.c, transform.d, transform.e, transform.f)
+        return state
+
+    def __setstate__(self, state):
+        cached = state.pop('_cached')
+        self.__dict__.update(state)
+        if self.transform is not None:
+            self.transform = Affine(*self.transform)
+        # Owner ids are only unique within a process
+        self._id = next(_river_ids)
+        weakref.finalize(self, _release, self._id)
+        for name, value in cached.items():
+            if value is not None:
+                River.cache.put((self._id, name), value)
+
+    def _get_raster(self, name):
+        """
+        Get a raster, reloading or regenerating it if it was evicted from the cache.
+        Args:
+            name (str): Name of the raster.
+        Returns:
+            np.ndarray: The raster, or None if it was never set.
+        """
+        value = self._pinned.get(name)
+        if value is None:
+            value = River.cache.get((self._id, name))
+        if value is None and name in self._sources:
+            method, args = self._sources[name]
+            getattr(self, method)(*args)
+            value = River.cache.get((self._id, name))
+        return value
+
+    def _set_raster(self, name, value, source=None):
+        """
+        Store a raster. Rasters with a source are kept in the shared cache and can be
+        evicted, since calling the source method again rebuilds them. Rasters without
+        a source, such as arrays assigned by the user, are kept with the River object.
+        Args:
+            name (str): Name of the raster.
+            value (np.ndarray): The raster.
+            source (tuple): The River method name and arguments that produce the raster.
+        Returns:
+            None.
+        """
+        self._pinned.pop(name, None)
+        River.cache.discard((self._id, name))
+        if name == 'centerline':
+            self.graph = None
+            self.vector = None
+        for derived in River.DERIVED_RASTERS.get(name, ()):
+            self._set_raster(derived, None)
+        if value is None:
+            self._sources.pop(name, None)
+        elif source is None:
+            self._pinned[name] = value
+            self._sources.pop(name, None)
+        else:
+            River.cache.put((self._id, name), value)
+            self._sources[name] = source
 
-    def load_mask(self):
+    def _is_packed(self):
+        """
+        Check whether the mask is bit-packed, without loading it if it comes from a file.
+        Returns:
+            bool: True if the mask is a PackedMask.
+        """
+        source = self._sources.get('mask')
+        if source is not None:
+            return source[1][0]
+        return isinstance(self.mask, PackedMask)
+
+    def _cached(self, name, compute, **params):
+        """
+        Look up a derived raster in the disk cache, computing and storing it on a miss.
+        Args:
+            name (str): Name of the raster.
+            compute (callable): Function computing the raster.
+            **params: The parameter values used to compute the raster.
+        Returns:
+            np.ndarray: The raster.
+        """
+        if River.disk_cache is None or self.file_path is None or 'mask' not in self._sources:
+            return compute()
+        key = River.disk_cache.key(self.file_path, name, **params)
+        value = River.disk_cache.get(key)
+        if value is None:
+            value = compute()
+            River.disk_cache.put(key, np.asarray(value))
+        elif self._is_packed() and name == 'watermask':
+            value = PackedMask.from_array(value)
+        return value
+
+    def load_mask(self, packed=False):
         """
         Process the river mask geotiff file and store it as a mask in the River object and stores the year.
         Args:
             self (River): A River object.
+            packed (bool): Store the mask bit-packed, eight pixels per byte.
         Returns:
             None. Modifies the River object mask and year.
         """
-        with rasterio.open(self.file_path) as dataset:
-            self.mask = dataset.read(1)
-            self.year = self.file_path[-8:-4]
+        with stage('load_mask', self) as record, rasterio.open(self.file_path) as dataset:
+            mask = dataset.read(1)
+            if packed:
+                mask = PackedMask.from_array(mask)
+            self._set_raster('mask', mask, ('load_mask', (packed,)))
+            self.year = mask_year(self.file_path)
+            self.transform = dataset.transform
+            self.crs = dataset.crs
+            record.array('mask', mask)
 
     @classmethod
     def load_dem(cls, dem_files):
         """
-        Process the dem geotiff file and store the dem and slope
+        Process the dem geotiff file and store the dem and slope. Without a slope file,
+        the slope is computed from the dem and cached next to it.
         Args:
-            dem_files (list): A list of dem files.
+            dem_files (list): A list of dem files, or the path of the dem file.
         Returns:
             None. Modifies the dem and slope.
         """
         if dem_files is None:
-            print("No files provided")
+            raise ValueError("No files provided")
+        if isinstance(dem_files, str):
+            dem_files = [dem_files]
+        dem = None
+        slope = None
         for file in dem_files:
-            if 'slope' in file or 'SLOPE' in file or 'Slope' in file:
+            name = os.path.basename(file).lower()
+            if 'slope' in name:
                 slope = file
-            elif 'dem' in file or 'Dem' in file or 'DEM' in file:
+            elif 'dem' in name or 'elevation' in name:
                 dem = file
+        if dem is None:
+            raise ValueError("No dem or elevation file provided")
+        with rasterio.open(dem) as src:
+            DEM = src.read(1)
         if slope is not None:
             with rasterio.open(slope) as src:
                 SLOPE = src.read(1)
-        if dem is not None:
-            with rasterio.open(dem) as src:
-                DEM  = src.read(1)
+        else:
+            SLOPE = load_slope(dem)
         # Cut out the non-river areas
         mask = DEM != 0
         cls.DEM = np.where(mask, DEM, np.nan)
         cls.SLOPE = np.where(mask, SLOPE, np.nan)
 
     @classmethod
-    def plot_dem(cls):
+    def plot_dem(cls, file_path=None):
         """
         Plot the dem and slope.
         Args:
-            None
+            file_path (str): Save the figures to this file instead of showing them. The
+                slope is saved next to it with a _slope suffix.
         Returns:
             Plotted dem and slope.
         """
+        from .render import new_figure, finish_figure, suffixed_path
         if cls.DEM is None:
             print("No DEM")
         if cls.SLOPE is None:
@@ -91,18 +362,19 @@ class River:
         aspect_ratio = cls.DEM.shape[1] / cls.DEM.shape[0]
 
         # Plot DEM
-        plt.figure(figsize=(10*aspect_ratio, 10))
-        img = plt.imshow(cls.DEM, cmap='terrain', interpolation='nearest', aspect='auto')
-        plt.colorbar(img, label='Elevation (meters)')
-        plt.title('SRTM 30m DEM')
-        plt.show()
+        fig, ax = new_figure((10*aspect_ratio, 10), file_path=file_path)
+        img = ax.imshow(cls.DEM, cmap='terrain', interpolation='nearest', aspect='auto')
+        fig.colorbar(img, ax=ax, label='Elevation (meters)')
+        ax.set_title('SRTM 30m DEM')
+        finish_figure(fig, file_path)
 
         # Plot Slope
-        plt.figure(figsize=(10*aspect_ratio, 10))
-        img = plt.imshow(cls.SLOPE, cmap='terrain', interpolation='nearest', aspect='auto')
-        plt.colorbar(img, label='Slope (Degrees)')
-        plt.title('SRTM 30m Slope')
-        plt.show()
+        slope_file_path = suffixed_path(file_path, '_slope')
+        fig, ax = new_figure((10*aspect_ratio, 10), file_path=slope_file_path)
+        img = ax.imshow(cls.SLOPE, cmap='terrain', interpolation='nearest', aspect='auto')
+        fig.colorbar(img, ax=ax, label='Slope (Degrees)')
+        ax.set_title('SRTM 30m Slope')
+        finish_figure(fig, slope_file_path)
 
     def water_mask_process(annual_data, min_size):
         """
@@ -113,32 +385,22 @@ class River:
         Returns:
             None. Modifies the River objects in place.
         """
-        if isinstance(annual_data, list):
-            for river_mask in annual_data:
-                # Fill small holes in binary mask
-                kernel = np.ones((5,5),np.uint8)
-                watermask = cv2.morphologyEx(river_mask.mask, cv2.MORPH_CLOSE, kernel)
-                if min_size is None or min_size <= 0:
-                    min_size = WATER_MASK_MIN_SIZE
-                # Identify small bars and fill them in to create a filled water mask.
-                labels = measure.label(watermask == 0)
-                for region in measure.regionprops(labels):
-                    if region.area < min_size:
-                        watermask[labels == region.label] = 1
-                river_mask.watermask = watermask
-        else:
-            river_mask = annual_data
-            # Fill small holes in binary mask
-            kernel = np.ones((5,5),np.uint8)
-            watermask = cv2.morphologyEx(river_mask.mask, cv2.MORPH_CLOSE, kernel)
-            if min_size is None or min_size <= 0:
-                min_size = WATER_MASK_MIN_SIZE
-            # Identify small bars and fill them in to create a filled water mask.
-            labels = measure.label(watermask == 0)
-            for region in measure.regionprops(labels):
-                if region.area < min_size:
-                    watermask[labels == region.label] = 1
-            river_mask.watermask = watermask
+        if not isinstance(annual_data, list):
+            annual_data = [annual_data]
+        if min_size is None or min_size <= 0:
+            min_size = WATER_MASK_MIN_SIZE
+        for river_mask in annual_data:
+            def compute():
+                mask = river_mask.mask
+                watermask = fill_water_mask(np.asarray(mask), min_size)
+                # A packed mask gets a packed water mask
+                if isinstance(mask, PackedMask):
+                    watermask = PackedMask.from_array(watermask)
+                return watermask
+            with stage('water_mask_process', river_mask) as record:
+                watermask = river_mask._cached('watermask', compute, min_size=min_size)
+                river_mask._set_raster('watermask', watermask, ('water_mask_process', (min_size,)))
+                record.array('watermask', watermask)
 
     def _find_end_points(self):
         '''
@@ -148,20 +410,11 @@ class River:
         Returns:
             list: A list of tuples containing the coordinates of the end points.
         '''
-        # Create a padded version of the centerline to handle edge cases
-        padded_centerline = np.pad(self.centerline, 1, mode='constant', constant_values=0)
-        end_points = []
-        # Iterate through centerline
-        for y in range(1, padded_centerline.shape[0] - 1):
-            for x in range(1, padded_centerline.shape[1] - 1):
-                if padded_centerline[y, x]:
-                    # Count the number of 8-connected neighbors
-                    neighborhood = padded_centerline[y-1:y+2, x-1:x+2]
-                    num_neighbors = np.sum(neighborhood) - 1
-                    if num_neighbors == 1:
-                        # If only one neighbor, it's an end point
-                        end_points.append((y-1, x-1))
-        return end_points
+        # Count the 8-connected neighbors of every pixel at once
+        centerline = self.centerline.astype(bool)
+        neighbors = _count_neighbors(np.pad(centerline, 1, mode='constant', constant_values=0))[1:-1, 1:-1]
+        y, x = np.nonzero(centerline & (neighbors == 1))
+        return list(zip(y.tolist(), x.tolist()))
 
     def _prune_centerline(self, max_distance):
         '''
@@ -172,60 +425,233 @@ class River:
         Returns:
             Prunes centerline and adds it to River object.
         '''
-        for _ in range(max_distance):
-            # Find end points in the current centerline
-            end_points = self._find_end_points()
-            # If there are no end points, stop the loop
-            if not end_points:
-                break
-            for end_point in end_points:
-                # Set end point to 0 in the centerline
-                self.centerline[end_point] = False
+        with stage('prune', self):
+            self.centerline = prune_skeleton(self.centerline, max_distance)
+
+    def build_graph(self):
+        '''
+        Build the graph of the centerline once and store it in the River object.
+        Args:
+            self (River): A River object with a processed centerline.
+        Returns:
+            SkeletonGraph: The junctions, end points and branches of the centerline.
+        '''
+        from .skeleton import SkeletonGraph
+        if self.graph is None:
+            with stage('build_graph', self):
+                self.graph = SkeletonGraph.from_raster(self.centerline)
+        return self.graph
+
+    def prune_branches(self, min_length):
+        '''
+        Remove every branch shorter than min_length using the centerline graph.
+        Args:
+            min_length (float): Minimum branch length to keep, in pixels.
+        Returns:
+            Prunes centerline and graph and adds them to River object.
+        '''
+        graph = self.build_graph()
+        with stage('prune_branches', self):
+            graph = graph.prune(min_length)
+            self.centerline = graph.to_raster()
+        self.graph = graph
 
     def process_centerline(annual_data, max_distance_branch_removal):
         '''
         Process the centerline to remove branches.
         Args:
-            centerline (np.ndarray): Binary mask of the centerline.
+            annual_data (River or list of River): The river data to process.
             max_distance_branch_removal (int): The maximum distance to remove branches.
         Returns:
             Prunes centerline and adds it to River object.
         '''
+        from skimage.morphology import thin
+        if not isinstance(annual_data, list):
+            annual_data = [annual_data]
         for i, data in enumerate(annual_data):
             river_mask = annual_data[i]
             if river_mask.watermask is None:
                 river_mask.water_mask_process(WATER_MASK_MIN_SIZE)
-            river_mask.centerline = thin(river_mask.watermask)
             if max_distance_branch_removal is None or max_distance_branch_removal <= 0:
                 max_distance_branch_removal = MAX_DISTANCE_BRANCH_REMOVAL
-            river_mask._prune_centerline(max_distance_branch_removal)
+            def compute():
+                with stage('thin'):
+                    centerline = thin(np.asarray(river_mask.watermask))
+                with stage('prune'):
+                    return prune_skeleton(centerline, max_distance_branch_removal)
+            with stage('process_centerline', river_mask) as record:
+                watermask_source = river_mask._sources.get('watermask')
+                if watermask_source is None:
+                    # A water mask assigned by hand can not be identified in the disk cache
+                    centerline = compute()
+                else:
+                    centerline = river_mask._cached('centerline', compute, min_size=watermask_source[1][0],
+                                                    max_distance_branch_removal=max_distance_branch_removal)
+                river_mask._set_raster('centerline', centerline,
+                                       ('process_centerline', (max_distance_branch_removal,)))
+                record.array('centerline', centerline)
+
+    def _georeference(self):
+        '''
+        Get the affine transform of the mask, reading only the header of the mask file
+        if the mask itself was never loaded, such as when the centerline came from the disk cache.
+        Returns:
+            Affine: The transform, or PIXEL_SIZE pixels from the top left corner if the mask has none.
+        '''
+        if self.transform is None and self.file_path is not None and os.path.exists(self.file_path):
+            with rasterio.open(self.file_path) as dataset:
+                self.transform = dataset.transform
+                self.crs = dataset.crs
+        if self.transform is None:
+            return Affine(PIXEL_SIZE, 0, 0, 0, PIXEL_SIZE, 0)
+        return self.transform
+
+    def pixel_sampling(self, shape):
+        '''
+        Get the size of the pixels in meters, for distance transforms.
+        Args:
+            shape (tuple): Shape of the raster.
+        Returns:
+            tuple: The row and column spacing in meters. Geographic masks use the average
+                column spacing over their rows.
+        '''
+        transform = self._georeference()
+        dx, dy = pixel_spacing(transform, self.crs, shape[0])
+        return float(dy), float(np.mean(dx))
 
-    def plot_centerline(annual_data):
+    def centerline_distance_transform(self):
+        '''
+        Compute the distance in meters from every pixel to the nearest centerline pixel
+        and keep it in the raster cache, where it is shared by every comparison with this year.
+        Args:
+            self (River): A River object with a processed centerline.
+        Returns:
+            np.ndarray: The float32 distance raster.
+        '''
+        if self.centerline is None:
+            self.process_centerline(MAX_DISTANCE_BRANCH_REMOVAL)
+        centerline = np.asarray(self.centerline)
+        with stage('centerline_distance_transform', self) as record:
+            distance = distance_to_pixels(centerline, self.pixel_sampling(centerline.shape))
+            self._set_raster('centerline_distance', distance, ('centerline_distance_transform', ()))
+            record.array('centerline_distance', distance)
+        return distance
+
+    def watermask_distance_transform(self):
+        '''
+        Compute the distance in meters from every water pixel to the nearest bank and
+        keep it in the raster cache, where it is shared by every width measurement of this year.
+        Args:
+            self (River): A River object with a processed water mask.
+        Returns:
+            np.ndarray: The float32 distance raster, 0 outside the water.
+        '''
+        if self.watermask is None:
+            self.water_mask_process(WATER_MASK_MIN_SIZE)
+        watermask = np.asarray(self.watermask)
+        with stage('watermask_distance_transform', self) as record:
+            distance = distance_to_pixels(watermask == 0, self.pixel_sampling(watermask.shape))
+            self._set_raster('watermask_distance', distance, ('watermask_distance_transform', ()))
+            record.array('watermask_distance', distance)
+        return distance
+
+    def vectorize_centerline(self, tolerance=0, upstream=None):
+        '''
+        Trace the main channel of the centerline into an ordered, georeferenced line.
+        The full resolution line is kept in the River object until the centerline changes.
+        Args:
+            self (River): A River object with a processed centerline.
+            tolerance (float): Simplify the line so it stays within this distance of the
+                traced one, in map units. 0 keeps every pixel.
+            upstream (tuple): (x, y) map coordinates of a point upstream, where the line
+                starts. Defaults to the higher end on River.DEM, or the topmost end.
+        Returns:
+            LineString: The centerline, running downstream.
+        '''
+        from .vector import trace_centerline, orient
+        if self.vector is None:
+            if self.centerline is None:
+                self.process_centerline(MAX_DISTANCE_BRANCH_REMOVAL)
+            graph = self.build_graph()
+            with stage('vectorize_centerline', self):
+                self.vector = trace_centerline(graph, self._georeference(), River.DEM)
+        line = self.vector
+        if upstream is not None:
+            line = orient(line, upstream)
+        if tolerance:
+            line = line.simplify(tolerance)
+        return line
+
+    def centerline_length(self, tolerance=0):
+        '''
+        Length of the main channel of the centerline.
+        Args:
+            tolerance (float): Simplification tolerance of the line, in map units.
+        Returns:
+            float: The length in map units, meters for projected masks.
+        '''
+        return self.vectorize_centerline(tolerance).length
+
+    def sinuosity(self, tolerance=0):
+        '''
+        Sinuosity of the main channel, its length over the straight distance between its ends.
+        Args:
+            tolerance (float): Simplification tolerance of the line, in map units.
+        Returns:
+            float: The sinuosity.
+        '''
+        from .vector import sinuosity
+        return sinuosity(self.vectorize_centerline(tolerance))
+
+    def downstream_distance(self, points, upstream=None):
+        '''
+        Distance along the main channel from its upstream end to each point.
+        Args:
+            points (np.ndarray): An (n, 2) array of (x, y) map coordinates.
+            upstream (tuple): (x, y) map coordinates of a point upstream.
+        Returns:
+            np.ndarray: The distance of each point along the centerline.
+        '''
+        from .vector import downstream_distance
+        return downstream_distance(self.vectorize_centerline(upstream=upstream), points)
+
+    def export_centerlines(annual_data, file_path, tolerance=0, upstream=None):
+        '''
+        Write the centerline of every year to a single GeoJSON file.
+        Args:
+            annual_data (list): A list of River objects representing the river at different points in time.
+            file_path (str): Path of the GeoJSON file.
+            tolerance (float): Simplification tolerance of the lines, in map units.
+            upstream (tuple): (x, y) map coordinates of a point upstream.
+        Returns:
+            str: Path of the GeoJSON file.
+        '''
+        from .vector import write_geojson, sinuosity
+        if not isinstance(annual_data, list):
+            annual_data = [annual_data]
+        lines = [river.vectorize_centerline(tolerance, upstream) for river in annual_data]
+        properties = []
+        for river, line in zip(annual_data, lines):
+            value = sinuosity(line)
+            # NaN is not valid JSON
+            properties.append({'year': river.year, 'length': line.length,
+                               'sinuosity': value if np.isfinite(value) else None})
+        crs = next((river.crs for river in annual_data if river.crs is not None), None)
+        with stage('export_centerlines'):
+            return write_geojson(lines, file_path, properties, crs.to_string() if crs is not None else None)
+
+    def plot_centerline(annual_data, file_path=None):
         """
         Plot the centerline over time.
         Args:
             data (list): A list of River objects representing the river at different points in time.
+            file_path (str): Save the figure to this file instead of showing it.
         Returns:
             Plotted centerline of the river over time.
         """
-        fig, ax = plt.subplots(figsize=(30, 20), dpi=500)
-        ax.set_facecolor('black')
-        years_to_plot = range(0, len(annual_data), 5)
-        colors = plt.cm.Spectral(np.linspace(0, 1, len(years_to_plot)))
-        legend_elements = []
-        for i, year in enumerate(years_to_plot):
-            river = annual_data[year]
-            y, x = np.where(river.centerline)
-            ax.scatter(x, y, color=colors[i], alpha=0.9, s=1.5, edgecolors='none')
-            legend_elements.append(Line2D([0], [0], marker='o', color='w', label=str(river.year),
-                                            markerfacecolor=colors[i], markersize=10))
-        ax.set_ylim(ax.get_ylim()[::-1])
-        ax.set_title('River Centerline Evolution Over Time')
-        ax.legend(handles=legend_elements, loc='best')
-        ax.set_xlabel('X Coordinate')
-        ax.set_ylabel('Y Coordinate')
-        ax.set_aspect('equal')
-        plt.show()
+        from .render import render_centerline
+        with stage('plot_centerline'):
+            render_centerline(annual_data, file_path)
 
     def _extract_river_edges(self):
         """
@@ -235,120 +661,90 @@ class River:
         Returns:
             np.ndarray: Binary mask of the river edges.
         """
-        eroded_mask = binary_erosion(self.mask)
-        edges = self.mask & ~eroded_mask
+        from scipy.ndimage import binary_erosion
+        mask = np.asarray(self.mask)
+        eroded_mask = binary_erosion(mask)
+        edges = mask & ~eroded_mask
         return edges
 
-    def _plot_edges(self, ax, edges, color, alpha, label):
-        """
-        Plot the edges of the river, islands, and sandbars.
-        Args:
-            ax (matplotlib.axes.Axes): The axes on which to plot the edges.
-            edges (np.ndarray): Binary mask of the river edges.
-            color (str): The color to use for the edges.
-            alpha (float): The transparency level of the edges.
-            label (str): The label for the edges in the legend.
-        Returns:
-            Plot of the edges of the river
-        """
-        y, x = np.where(edges)
-        ax.scatter(x, y, color=color, alpha=alpha, s=6, label=label, edgecolors='none')
-
-    def plot_river_edges(annual_data):
+    def plot_river_edges(annual_data, file_path=None):
         """
         Plot the edges of the river over time.
         Args:
             annual_data (list): A list of River objects representing the river at different points in time.
+            file_path (str): Save the figure to this file instead of showing it.
         Returns:
             Plotted edges of the river over time.
         """
-        # Sort the annual_data by year
-        annual_data = sorted(annual_data, key=lambda river: river.year)
-        years_to_plot = range(0, len(annual_data), 5)
-        fig, ax = plt.subplots(figsize=(20, 15))
-        colors = plt.cm.Spectral(np.linspace(0, 1, len(years_to_plot)))
-
-        # Plot each year's river edges
-        for i, year in enumerate(years_to_plot):
-            river_mask = annual_data[year]
-            edges = river_mask._extract_river_edges()
-            river_mask._plot_edges(ax, edges, colors[i], 0.6, str(river_mask.year))
+        from .render import render_river_edges
+        with stage('plot_river_edges'):
+            render_river_edges(annual_data, file_path)
 
-        ax.set_ylim(ax.get_ylim()[::-1])
-        ax.set_title('River Edge Evolution')
-        ax.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
-        ax.set_xlabel('X Coordinate')
-        ax.set_ylabel('Y Coordinate')
-        ax.set_aspect('equal')
-        plt.show()
-
-    def plot_self(self):
+    def plot_self(self, file_path=None):
         """
         Plot the river mask and edges.
         Args:
             self (River): A River object.
+            file_path (str): Save the figures to this file instead of showing them. The
+                filled mask is saved next to it with a _filled suffix.
         Returns:
             Plotted river mask.
         """
-        # Plot the mask
-        fig, ax = plt.subplots(figsize=(30, 20), dpi=500)
-        ax.imshow(self.mask, cmap='Blues', interpolation='none', alpha=0.7)
-        plt.title('Athabasca River Mask ' + str(self.year))
-        plt.show()
-        if self.watermask is None:
-            self.water_mask_process(WATER_MASK_MIN_SIZE)
-        fig, ax = plt.subplots(figsize=(30, 20), dpi=500)
-        ax.imshow(self.watermask, cmap='Blues', interpolation='none', alpha=0.7)
-        plt.title('Athabasca Filled River Mask ' + str(self.year))
-        plt.show()
-
-    def plot_river_migration(self, other):
+        from .render import render_mask, suffixed_path
+        with stage('plot_self', self):
+            # Plot the mask
+            render_mask(self.mask, 'Athabasca River Mask ' + str(self.year), file_path)
+            if self.watermask is None:
+                self.water_mask_process(WATER_MASK_MIN_SIZE)
+            render_mask(self.watermask, 'Athabasca Filled River Mask ' + str(self.year),
+                        suffixed_path(file_path, '_filled'))
+
+    def plot_river_migration(self, other, file_path=None):
         """
         Plot the migration of the river.
         Args:
             self (River): A River object.
             other (River): Another River object to compare with.
+            file_path (str): Save the figure to this file instead of showing it.
         Returns:
             Plotted river migration.
         """
+        from .render import new_figure, finish_figure
         # Calculate the migration
-        migration = self.mask.astype(int) - other.mask.astype(int)
+        migration = np.asarray(self.mask, dtype=np.int8) - np.asarray(other.mask, dtype=np.int8)
         # Plot the migration
         # Positive values (areas that are only in the current year's mask) in red
         # Negative values (areas that are only in the other year's mask) in blue
         aspect_ratio = self.mask.shape[1] / self.mask.shape[0]
-        fig, ax = plt.subplots(figsize=(10*aspect_ratio, 10))
-        cmap = plt.get_cmap('bwr')
-        im = ax.imshow(migration, cmap=cmap, vmin=-1, vmax=1)
+        fig, ax = new_figure((10*aspect_ratio, 10), file_path=file_path)
+        im = ax.imshow(migration, cmap='bwr', vmin=-1, vmax=1)
         cax = fig.add_axes([ax.get_position().x1 + 0.01, ax.get_position().y0, 0.02, ax.get_position().height])
-        colorbar = plt.colorbar(im, cax=cax)
+        colorbar = fig.colorbar(im, cax=cax)
         colorbar.set_label('Erosion (Red) and Accretion (Blue)', rotation=270, labelpad=15)
         ax.set_title(f'River Migration: {self.year} Compared to {other.year}', pad=20, ha='center')
-        plt.show()
+        finish_figure(fig, file_path)
 
-    def animate_centerline_migration(annual_data, folder_file_path):
+    def animate_centerline_migration(annual_data, folder_file_path=None, fps=2, factor=1, show_mask=True,
+                                     workers=None):
         '''
-        Animate the centerline migration over time.
+        Animate the centerline migration over time. Frames are drawn straight from the
+        centerline and mask arrays and encoded without going through matplotlib.
         Args:
             data (list): A list of River objects representing the river at different points in time.
             folder_file_path (str): Path to the folder where the animation will be stored with name of file and .mp4.
+            fps (float): Frames, that is years, per second.
+            factor (int): Downsampling factor of the frames.
+            show_mask (bool): Draw the river mask under the centerlines.
+            workers (int): Number of threads building frames. Defaults to all cores.
         Returns:
-            Animated centerline migration over time.
-        '''
-        fig, ax = plt.subplots(figsize=(15, 10))
-        ax.set_title('Centerline Migration Animation')
-        im = ax.imshow(annual_data[0].centerline, cmap='gray')
-        def init():
-            return [im]
-        def animate(i):
-            im.set_data(annual_data[i].centerline)
-            return [im]
-        anim = FuncAnimation(fig, animate, init_func=init, frames=len(annual_data), interval=600)
-        plt.show()
+            str: Path of the animation.
+        '''
+        from .animation import encode_animation
         if folder_file_path is None:
-            folder_file_path = os.getcwd()
-            folder_file_path = folder_file_path + 'river_centerline_evolution.mp4'
-        anim.save(folder_file_path, writer='ffmpeg')
+            folder_file_path = os.path.join(os.getcwd(), 'river_centerline_evolution.mp4')
+        with stage('animate_centerline_migration'):
+            return encode_animation(annual_data, folder_file_path, fps=fps, factor=factor, show_mask=show_mask,
+                                    workers=workers)
 
     def quantify_erosion(annual_data):
         """
@@ -361,22 +757,74 @@ class River:
         for i in range(1, len(annual_data)):
             #if annual_data[i].watermask is None:
             #    annual_data[i].water_mask_process(WATER_MASK_MIN_SIZE)
-            accretion = (annual_data[i].mask.astype(int) - annual_data[i-1].mask.astype(int)) > 0
-            erosion = (annual_data[i-1].mask.astype(int) - annual_data[i].mask.astype(int)) > 0
-            # Calculate the area of erosion and accretion
-            annual_data[i].erosion = np.sum(erosion * (30**2)) / 1000000
-            annual_data[i].accretion = np.sum(accretion * (30**2)) / 1000000
+            with stage('quantify_erosion', annual_data[i]):
+                previous = annual_data[i-1].mask
+                current = annual_data[i].mask
+                if isinstance(previous, PackedMask) and isinstance(current, PackedMask):
+                    # Count changed pixels directly on the packed bytes
+                    accretion = current.and_not(previous).count()
+                    erosion = previous.and_not(current).count()
+                else:
+                    previous = np.asarray(previous)
+                    current = np.asarray(current)
+                    accretion = np.count_nonzero(current > previous)
+                    erosion = np.count_nonzero(previous > current)
+                # Calculate the area of erosion and accretion
+                annual_data[i].erosion = erosion * (PIXEL_SIZE**2) / 1000000
+                annual_data[i].accretion = accretion * (PIXEL_SIZE**2) / 1000000
+
+    def quantify_migration(annual_data, pairs=None, workers=None):
+        '''
+        Quantify the migration of the centerline between years with distance transforms.
+        Args:
+            annual_data (list): A list of River objects representing the river at different points in time.
+            pairs (list): (earlier, later) year tuples. Defaults to every consecutive pair.
+            workers (int): Number of worker processes. Defaults to all cores.
+        Returns:
+            dict: The per-pixel distances in meters and their summary for every pair, see
+                centerline_migration. With consecutive pairs, the mean migration in meters
+                is also stored in the migration of the later River object.
+        '''
+        from .migration import centerline_migration
+        migration = centerline_migration(annual_data, pairs, workers)
+        if pairs is None:
+            rivers = {int(river.year): river for river in annual_data}
+            for (_, later), mean in zip(migration['years'], migration['mean']):
+                rivers[int(later)].migration = float(mean)
+        return migration
+
+    def quantify_width(annual_data, workers=None):
+        '''
+        Quantify the channel width along the centerline of every year.
+        Args:
+            annual_data (list): A list of River objects representing the river at different points in time.
+            workers (int): Number of worker processes. Defaults to all cores.
+        Returns:
+            dict: The per-pixel widths in meters and their summary for every year, see
+                channel_width. The mean width is also stored in the width of each River object.
+        '''
+        from .width import channel_width
+        widths = channel_width(annual_data, workers)
+        rivers = {int(river.year): river for river in annual_data}
+        for year, mean in zip(widths['years'], widths['mean']):
+            rivers[int(year)].width = float(mean)
+        return widths
 
     @classmethod
-    def plot_erosion(cls, annual_data):
+    def plot_erosion(cls, annual_data, file_path=None):
         """
         Plot erosion over time and accumulated erosion over time.
         Args:
             Annual Data (list): A list of River objects representing the river at different points in time.
+            file_path (str): Save the figures to this file instead of showing them. The
+                accretion and the map of changes over the DEM are saved next to it with
+                _accretion and _dem suffixes.
         Returns:
             Plotted erosion over time and accumulated erosion over time.
         """
-        annual_data.sort(key=lambda river: int(river.year))
+        from mpl_toolkits.axes_grid1 import make_axes_locatable
+        from .render import new_figure, finish_figure, suffixed_path
+        annual_data = sorted(annual_data, key=lambda river: int(river.year))
         erosion_data = []
         accretion_data = []
         accumulated_erosion_data = []
@@ -397,35 +845,37 @@ class River:
         average_erosion = accumulated_erosion_sum / (len(annual_data) - 1)
         print(f"Total Accumulated Erosion: {accumulated_erosion_sum} km2/year")
         print(f"Average Accumulated Erosion: {average_erosion} km2/year")
-        plt.figure(figsize=(15, 10))
-        plt.plot(years[1:], erosion_data, marker='o', linestyle='-', color='red', label='Yearly Erosion (km2)')
-        plt.plot(years[1:], accumulated_erosion_data, marker='o', linestyle='-', color='blue', label='Accumulated Erosion (km2)')
-        plt.title('Annual and Accumulated Erosion Over Time')
-        plt.xlabel('Year')
-        plt.ylabel('Erosion (km2)')
-        plt.grid(True)
-        plt.legend()
-        plt.show()
+        fig, ax = new_figure((15, 10), file_path=file_path)
+        ax.plot(years[1:], erosion_data, marker='o', linestyle='-', color='red', label='Yearly Erosion (km2)')
+        ax.plot(years[1:], accumulated_erosion_data, marker='o', linestyle='-', color='blue', label='Accumulated Erosion (km2)')
+        ax.set_title('Annual and Accumulated Erosion Over Time')
+        ax.set_xlabel('Year')
+        ax.set_ylabel('Erosion (km2)')
+        ax.grid(True)
+        ax.legend()
+        finish_figure(fig, file_path)
 
         # Plot the accretion data over time
         average_accretion = accumulated_accretion_sum / (len(annual_data) - 1)
         print(f"Total Accumulated Accretion: {accumulated_accretion_sum} km2/year")
         print(f"Average Accumulated Accretion: {average_accretion} km2/year")
-        plt.figure(figsize=(15, 10))
-        plt.plot(years[1:], accretion_data, marker='o', linestyle='-', color='red', label='Yearly Accretion (km2)')
-        plt.plot(years[1:], accumulated_accretion_data, marker='o', linestyle='-', color='blue', label='Accumulated Accretion (km2)')
-        plt.title('Annual and Accumulated Accretion Over Time')
-        plt.xlabel('Year')
-        plt.ylabel('Accretion (km2)')
-        plt.grid(True)
-        plt.legend()
-        plt.show()
+        accretion_file_path = suffixed_path(file_path, '_accretion')
+        fig, ax = new_figure((15, 10), file_path=accretion_file_path)
+        ax.plot(years[1:], accretion_data, marker='o', linestyle='-', color='red', label='Yearly Accretion (km2)')
+        ax.plot(years[1:], accumulated_accretion_data, marker='o', linestyle='-', color='blue', label='Accumulated Accretion (km2)')
+        ax.set_title('Annual and Accumulated Accretion Over Time')
+        ax.set_xlabel('Year')
+        ax.set_ylabel('Accretion (km2)')
+        ax.grid(True)
+        ax.legend()
+        finish_figure(fig, accretion_file_path)
 
         # Plot the erosion/accretion on dem
-        erosion = (annual_data[0].mask.astype(int) < annual_data[-1].mask.astype(int))
-        accretion = (annual_data[0].mask.astype(int) > annual_data[-1].mask.astype(int))
+        erosion = np.asarray(annual_data[0].mask) < np.asarray(annual_data[-1].mask)
+        accretion = np.asarray(annual_data[0].mask) > np.asarray(annual_data[-1].mask)
         if cls.DEM is not None:
-            fig, ax = plt.subplots(figsize=(30, 20), dpi=500)
+            dem_file_path = suffixed_path(file_path, '_dem')
+            fig, ax = new_figure((15, 10), file_path=dem_file_path)
             dem_image = ax.imshow(cls.DEM, cmap='Greys', interpolation='nearest', aspect='auto')
             erosion_image = ax.imshow(erosion, cmap='Reds', alpha=0.6)
             accretion_image = ax.imshow(accretion, cmap='Blues', alpha=0.6)
@@ -437,24 +887,26 @@ class River:
             fig.colorbar(dem_image, cax=cax_dem, label='Elevation')
             fig.colorbar(erosion_image, cax=cax_erosion, label='Erosion')
             fig.colorbar(accretion_image, cax=cax_accretion, label='Accretion')
-            plt.show()
+            finish_figure(fig, dem_file_path)
 
-    def plot_discharge_erosion(annual_data, discharge):
+    def plot_discharge_erosion(annual_data, discharge, file_path=None):
         """
         Plot discharge and erosion.
         Args:
             discharge (list): A list of peak discharge values.
             annual_data (list): A list of River objects representing the river at different points in time.
+            file_path (str): Save the figure to this file instead of showing it.
         Returns:
             Plot Peak discharge and erosion.
         """
-        annual_data.sort(key=lambda river: int(river.year))
+        from .render import new_figure, finish_figure
+        annual_data = sorted(annual_data, key=lambda river: int(river.year))
         erosion_data = []
         years = [int(river.year) for river in annual_data]
         for i in range(1, len(annual_data)):
             erosion_data.append(annual_data[i].erosion)
 
-        fig, ax1 = plt.subplots(figsize=(15, 10))
+        fig, ax1 = new_figure((15, 10), file_path=file_path)
 
         color = 'tab:red'
         ax1.set_xlabel('Year')
@@ -469,6 +921,6 @@ class River:
         ax2.tick_params(axis='y', labelcolor=color)
 
         fig.tight_layout()
-        plt.title('Annual Erosion and Peak Discharge Over Time')
-        plt.grid(True)
-        plt.show()
+        ax2.set_title('Annual Erosion and Peak Discharge Over Time')
+        ax2.grid(True)
+        finish_figure(fig, file_path)
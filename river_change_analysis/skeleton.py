@@ -0,0 +1,319 @@
+# Purpose: Graph representation of a river centerline skeleton
+# Author: Ian St. Laurent
+
+import heapq
+import numpy as np
+from scipy import ndimage
+# Shared with prune_skeleton, so both agree on what an end point or junction is
+from .river import _NEIGHBOR_OFFSETS, _count_neighbors
+
+END = 'end'
+JUNCTION = 'junction'
+ISOLATED = 'isolated'
+
+
+class SkeletonEdge:
+    def __init__(self, start, end, pixels):
+        """
+        Initialize a SkeletonEdge object.
+        Args:
+            start (int): Index of the node the edge starts at.
+            end (int): Index of the node the edge ends at.
+            pixels (np.ndarray): Ordered (row, col) coordinates of the edge, including
+                the node pixels it attaches to.
+        """
+        self.start = start
+        self.end = end
+        self.pixels = pixels
+        steps = np.abs(np.diff(pixels, axis=0))
+        # Diagonal steps count as sqrt(2) pixels
+        self.length = float(np.sum(np.hypot(steps[:, 0], steps[:, 1])))
+
+
+class SkeletonGraph:
+    def __init__(self, shape, node_pixels, edges):
+        """
+        Initialize a SkeletonGraph object.
+        Args:
+            shape (tuple): Shape of the raster the skeleton was built from.
+            node_pixels (list of np.ndarray): (row, col) coordinates of the pixels of each node.
+            edges (list of SkeletonEdge): The edges connecting the nodes.
+        """
+        self.shape = tuple(shape)
+        self.node_pixels = node_pixels
+        self.edges = edges
+        self.degree = np.zeros(len(node_pixels), dtype=int)
+        for edge in edges:
+            self.degree[edge.start] += 1
+            self.degree[edge.end] += 1
+
+    @property
+    def nodes(self):
+        """
+        Coordinates of each node, taken as the centroid of its pixels.
+        Returns:
+            np.ndarray: An (n_nodes, 2) array of (row, col) coordinates.
+        """
+        if not self.node_pixels:
+            return np.zeros((0, 2))
+        return np.array([pixels.mean(axis=0) for pixels in self.node_pixels])
+
+    @property
+    def node_kinds(self):
+        """
+        Classify each node as an end point, a junction or an isolated pixel cluster.
+        Returns:
+            list: The kind of every node.
+        """
+        kinds = []
+        for degree in self.degree:
+            if degree == 0:
+                kinds.append(ISOLATED)
+            elif degree == 1:
+                kinds.append(END)
+            else:
+                kinds.append(JUNCTION)
+        return kinds
+
+    @classmethod
+    def from_raster(cls, skeleton):
+        """
+        Build the graph of a binary skeleton. Pixels with exactly two neighbors are
+        chained into edges, every other pixel belongs to a node, and touching node
+        pixels are merged into a single node.
+        Args:
+            skeleton (np.ndarray): Binary mask of the centerline.
+        Returns:
+            SkeletonGraph: The graph of the skeleton.
+        """
+        padded = np.pad(skeleton.astype(bool), 1, mode='constant', constant_values=False)
+        width = padded.shape[1]
+        offsets = [dy * width + dx for dy, dx in _NEIGHBOR_OFFSETS]
+        pixels = padded.ravel()
+        counts = _count_neighbors(padded).ravel()
+
+        # Label clusters of touching node pixels, one label per node
+        node_mask = padded & (counts.reshape(padded.shape) != 2)
+        node_labels, n_nodes = ndimage.label(node_mask, structure=np.ones((3, 3)))
+        node_labels = node_labels.ravel() - 1
+        node_flat = np.flatnonzero(node_mask)
+        node_pixels = [[] for _ in range(n_nodes)]
+        for index in node_flat.tolist():
+            node_pixels[node_labels[index]].append(index)
+
+        visited = np.zeros(pixels.size, dtype=bool)
+        edge_paths = []
+
+        def walk(previous, current):
+            # Follow a chain of two-neighbor pixels until it reaches a node
+            path = [previous, current]
+            while node_labels[current] < 0 and not visited[current]:
+                visited[current] = True
+                steps = [current + offset for offset in offsets
+                         if pixels[current + offset] and current + offset != previous]
+                if not steps:
+                    break
+                previous, current = current, steps[0]
+                path.append(current)
+            return path
+
+        for index in node_flat.tolist():
+            for offset in offsets:
+                neighbor = index + offset
+                # Touching node pixels belong to the same node, and traced chains are skipped
+                if pixels[neighbor] and node_labels[neighbor] < 0 and not visited[neighbor]:
+                    edge_paths.append(walk(index, neighbor))
+
+        # Closed loops without any node get a node at their first pixel
+        for index in np.flatnonzero(pixels & ~visited & (node_labels < 0)).tolist():
+            if visited[index]:
+                continue
+            node_labels[index] = len(node_pixels)
+            node_pixels.append([index])
+            for offset in offsets:
+                if pixels[index + offset]:
+                    edge_paths.append(walk(index, index + offset))
+                    break
+
+        edges = []
+        for path in edge_paths:
+            start = node_labels[path[0]]
+            end = node_labels[path[-1]]
+            if end < 0:
+                # The chain ran into a pixel that was already traced
+                end = start
+            coords = np.column_stack(np.unravel_index(np.array(path), padded.shape)) - 1
+            edges.append(SkeletonEdge(int(start), int(end), coords))
+
+        node_coords = [np.column_stack(np.unravel_index(np.array(pixels_), padded.shape)) - 1
+                       for pixels_ in node_pixels]
+        return cls(skeleton.shape, node_coords, edges)
+
+    def to_raster(self, edges=None):
+        """
+        Convert the graph back into a binary skeleton raster.
+        Args:
+            edges (list of int): Indices of the edges to draw. All edges and nodes are
+                drawn if None.
+        Returns:
+            np.ndarray: Boolean raster of the skeleton.
+        """
+        raster = np.zeros(self.shape, dtype=bool)
+        if edges is None:
+            selected = self.edges
+            for pixels in self.node_pixels:
+                raster[pixels[:, 0], pixels[:, 1]] = True
+        else:
+            selected = [self.edges[i] for i in edges]
+        for edge in selected:
+            raster[edge.pixels[:, 0], edge.pixels[:, 1]] = True
+        return raster
+
+    def _adjacency(self):
+        adjacency = [[] for _ in self.node_pixels]
+        for i, edge in enumerate(self.edges):
+            adjacency[edge.start].append((edge.end, i))
+            adjacency[edge.end].append((edge.start, i))
+        return adjacency
+
+    def terminal_branches(self):
+        """
+        Find the branches that end at an end point. A branch follows the edges from the
+        end point through every node joining exactly two edges, until it reaches a
+        junction or another end point.
+        Returns:
+            list: The edge indices, the nodes only used by the branch and the length of every branch.
+        """
+        adjacency = self._adjacency()
+        branches = []
+        seen = set()
+        for node in np.flatnonzero(self.degree == 1).tolist():
+            edges, nodes, length = [], [node], 0.0
+            previous, current = None, node
+            while True:
+                i = next(i for _, i in adjacency[current] if i != previous)
+                edge = self.edges[i]
+                edges.append(i)
+                length += edge.length
+                current = edge.start if edge.end == current else edge.end
+                if self.degree[current] == 2 and current not in nodes and edge.start != edge.end:
+                    nodes.append(current)
+                    previous = i
+                    continue
+                if self.degree[current] == 1:
+                    nodes.append(current)
+                break
+            # A line between two end points is found from both of its ends
+            if edges[0] not in seen:
+                seen.update(edges)
+                branches.append((edges, nodes, length))
+        return branches
+
+    def prune(self, min_length):
+        """
+        Remove every branch that ends at an end point and is shorter than min_length,
+        until none is left. A branch runs from its end point to the next junction, so
+        it is not split where thinning left a node joining only two edges. Removing
+        the spurs of a junction can leave the branch it was on as a new short terminal
+        branch, which is removed in the next pass.
+        Unlike prune_skeleton, which erodes max_distance pixels from every end point,
+        branches at least min_length long are kept whole. In particular, the two ends
+        of the main channel keep their full length here, while prune_skeleton shortens
+        them too. Shorter branches are removed entirely, including edges between two
+        end points such as short isolated lines.
+        Args:
+            min_length (float): Minimum branch length to keep, in pixels.
+        Returns:
+            SkeletonGraph: A new graph without the short branches.
+        """
+        graph = self
+        while True:
+            remove, removed_nodes = set(), set()
+            for edges, nodes, length in graph.terminal_branches():
+                if length < min_length:
+                    remove.update(edges)
+                    removed_nodes.update(nodes)
+            if not remove:
+                return graph
+            kept_nodes = np.ones(len(graph.node_pixels), dtype=bool)
+            kept_nodes[list(removed_nodes)] = False
+            new_index = np.cumsum(kept_nodes) - 1
+            node_pixels = [pixels for pixels, kept in zip(graph.node_pixels, kept_nodes) if kept]
+            edges = [SkeletonEdge(int(new_index[edge.start]), int(new_index[edge.end]), edge.pixels)
+                     for i, edge in enumerate(graph.edges) if i not in remove]
+            graph = SkeletonGraph(graph.shape, node_pixels, edges)
+
+    def _shortest_paths(self, source):
+        """
+        Dijkstra shortest path lengths along the edges from one node.
+        Args:
+            source (int): Index of the starting node.
+        Returns:
+            tuple: Distance to every node and the edge used to reach it.
+        """
+        adjacency = self._adjacency()
+        distance = np.full(len(self.node_pixels), np.inf)
+        via = np.full(len(self.node_pixels), -1)
+        distance[source] = 0
+        queue = [(0.0, source)]
+        while queue:
+            dist, node = heapq.heappop(queue)
+            if dist > distance[node]:
+                continue
+            for neighbor, i in adjacency[node]:
+                candidate = dist + self.edges[i].length
+                if candidate < distance[neighbor]:
+                    distance[neighbor] = candidate
+                    via[neighbor] = i
+                    heapq.heappush(queue, (candidate, neighbor))
+        return distance, via
+
+    def main_channel(self):
+        """
+        Find the main channel, the longest of the shortest paths between two end points.
+        When small loops left by thinning leave fewer than two end points, the path may
+        end at any node instead.
+        Returns:
+            list: Indices of the edges forming the main channel, ordered from one end to the other.
+        """
+        ends = [i for i, degree in enumerate(self.degree) if degree == 1]
+        targets = ends
+        if len(ends) < 2:
+            targets = [i for i, degree in enumerate(self.degree) if degree > 0]
+            if not ends:
+                ends = targets
+        best_length, best_path = -1, []
+        for source in ends:
+            distance, via = self._shortest_paths(source)
+            for target in targets:
+                if target == source or not np.isfinite(distance[target]) or distance[target] <= best_length:
+                    continue
+                path = []
+                node = target
+                while node != source:
+                    edge = self.edges[via[node]]
+                    path.append(int(via[node]))
+                    node = edge.start if edge.end == node else edge.end
+                best_length, best_path = distance[target], path[::-1]
+        return best_path
+
+    def side_channels(self):
+        """
+        Find the edges that are not part of the main channel.
+        Returns:
+            list: Indices of the side channel edges.
+        """
+        main = set(self.main_channel())
+        return [i for i in range(len(self.edges)) if i not in main]
+
+    def length(self, edges=None):
+        """
+        Total length of the skeleton.
+        Args:
+            edges (list of int): Indices of the edges to measure. All edges if None.
+        Returns:
+            float: The length in pixels.
+        """
+        if edges is None:
+            edges = range(len(self.edges))
+        return float(sum(self.edges[i].length for i in edges))
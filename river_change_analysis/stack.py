@@ -0,0 +1,220 @@
+# Purpose: Store every year of a river reach as a single (year, row, col) array
+# Author: Ian St. Laurent
+
+import numpy as np
+import rasterio
+from .river import River, PIXEL_SIZE
+from .mask import mask_year, YEAR_PATTERN
+
+# Number of rows compared at a time when computing erosion, to bound temporary memory
+_BLOCK_ROWS = 512
+
+
+class RiverStack:
+    def __init__(self, cube, years, file_paths=None):
+        """
+        Initialize a RiverStack object.
+        Args:
+            cube (np.ndarray): A (year, row, col) uint8 array of river masks.
+            years (list): The year of each mask in the cube, in increasing order.
+            file_paths (list): The mask file of each year, if any.
+        """
+        self.cube = cube
+        self.years = np.asarray(years, dtype=int)
+        self.file_paths = list(file_paths) if file_paths is not None else [None] * len(self.years)
+        self.erosion = None
+        self.accretion = None
+        if len(self.years) != cube.shape[0]:
+            raise ValueError("The number of years does not match the number of masks.")
+        if np.any(np.diff(self.years) <= 0):
+            raise ValueError("The years must be unique and sorted.")
+
+    @classmethod
+    def from_files(cls, file_paths, memmap_path=None):
+        """
+        Read a list of mask files, such as the output of mask_import, into a single cube.
+        Args:
+            file_paths (list): Paths to the mask files of one reach, in any order.
+            memmap_path (str): If given, the cube is stored in this .npy file and
+                memory-mapped instead of held in RAM.
+        Returns:
+            RiverStack: The masks of every year, sorted by year.
+        """
+        file_paths = sorted(file_paths, key=lambda path: int(mask_year(path)))
+        years = [int(mask_year(path)) for path in file_paths]
+        with rasterio.open(file_paths[0]) as dataset:
+            shape = (len(file_paths), dataset.height, dataset.width)
+        if memmap_path is not None:
+            cube = np.lib.format.open_memmap(memmap_path, mode='w+', dtype=np.uint8, shape=shape)
+            np.save(memmap_path + '.years.npy', np.asarray(years))
+        else:
+            cube = np.empty(shape, dtype=np.uint8)
+        for i, path in enumerate(file_paths):
+            with rasterio.open(path) as dataset:
+                if (dataset.height, dataset.width) != shape[1:]:
+                    raise ValueError(f"{path} does not have the same shape as the other masks.")
+                cube[i] = dataset.read(1)
+        if memmap_path is not None:
+            cube.flush()
+        return cls(cube, years, file_paths)
+
+    @classmethod
+    def from_multiband(cls, file_path, years=None, memmap_path=None):
+        """
+        Read a multi-band mask file, one band per year such as exported by
+        process_images(..., multiband=True), with a single read.
+        Args:
+            file_path (str): Path to the multi-band mask file.
+            years (list): The year of each band. Defaults to the years in the band
+                descriptions, such as river_mask_1986.
+            memmap_path (str): If given, the cube is stored in this .npy file and
+                memory-mapped instead of held in RAM.
+        Returns:
+            RiverStack: The masks of every year, sorted by year.
+        """
+        with rasterio.open(file_path) as dataset:
+            years = band_years(dataset, years)
+            shape = (dataset.count, dataset.height, dataset.width)
+            order = np.argsort(years, kind='stable')
+            if memmap_path is not None:
+                cube = np.lib.format.open_memmap(memmap_path, mode='w+', dtype=np.uint8, shape=shape)
+                np.save(memmap_path + '.years.npy', np.asarray(years)[order])
+            else:
+                cube = np.empty(shape, dtype=np.uint8)
+            # Read the bands straight into the cube, already in year order
+            dataset.read([int(band) + 1 for band in order], out=cube)
+        if memmap_path is not None:
+            cube.flush()
+        return cls(cube, np.asarray(years)[order], [file_path] * len(years))
+
+    @classmethod
+    def open(cls, memmap_path):
+        """
+        Open a cube previously stored by from_files without reading it into memory.
+        Args:
+            memmap_path (str): Path of the .npy file.
+        Returns:
+            RiverStack: The memory-mapped stack.
+        """
+        cube = np.load(memmap_path, mmap_mode='r')
+        years = np.load(memmap_path + '.years.npy')
+        return cls(cube, years)
+
+    def __len__(self):
+        return len(self.years)
+
+    def __getitem__(self, index):
+        """
+        Get a River object whose mask is a view into the cube.
+        Args:
+            index (int): Position of the year in the stack.
+        Returns:
+            River: The River object of that year.
+        """
+        river = River(self.file_paths[index])
+        river.year = str(self.years[index])
+        river.mask = self.cube[index]
+        if index > 0 and self.erosion is not None:
+            river.erosion = self.erosion[index - 1]
+            river.accretion = self.accretion[index - 1]
+        return river
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def index(self, year):
+        """
+        Find the position of a year in the stack.
+        Args:
+            year (int): The year to look up.
+        Returns:
+            int: The position of the year.
+        """
+        position = int(np.searchsorted(self.years, int(year)))
+        if position == len(self.years) or self.years[position] != int(year):
+            raise KeyError(f"No mask for {year}.")
+        return position
+
+    def rivers(self):
+        """
+        Get a River object for every year, for use with the River methods.
+        Returns:
+            list: A list of River objects sorted by year.
+        """
+        return list(self)
+
+    def quantify_erosion(self, pixel_size=PIXEL_SIZE):
+        """
+        Quantify erosion and accretion between every pair of consecutive years at once.
+        Args:
+            pixel_size (float): Size of a pixel in meters.
+        Returns:
+            tuple: Erosion and accretion arrays in km2, one value per pair of years.
+        """
+        n_pairs = max(len(self) - 1, 0)
+        erosion = np.zeros(n_pairs, dtype=np.int64)
+        accretion = np.zeros(n_pairs, dtype=np.int64)
+        for row in range(0, self.cube.shape[1], _BLOCK_ROWS):
+            block = self.cube[:, row:row + _BLOCK_ROWS]
+            accretion += np.count_nonzero(block[1:] > block[:-1], axis=(1, 2))
+            erosion += np.count_nonzero(block[:-1] > block[1:], axis=(1, 2))
+        self.erosion = erosion * (pixel_size**2) / 1000000
+        self.accretion = accretion * (pixel_size**2) / 1000000
+        return self.erosion, self.accretion
+
+    def zonal_erosion(self, elevation=None, slope=None, elevation_bins=None, slope_bins=None, pixel_size=PIXEL_SIZE):
+        """
+        Quantify erosion and accretion between every pair of consecutive years by
+        elevation and slope class, in a single pass over the cube.
+        Args:
+            elevation (np.ndarray): The elevation. Defaults to River.DEM.
+            slope (np.ndarray): The slope in degrees. Defaults to River.SLOPE.
+            elevation_bins (int or list): Number of equal elevation classes, or their edges.
+            slope_bins (int or list): Number of equal slope classes, or their edges in degrees.
+            pixel_size (float): Size of a pixel in meters.
+        Returns:
+            dict: The (year pair x zone) erosion and accretion tables, see zonal_erosion.
+        """
+        from .zonal import zonal_erosion, ELEVATION_BINS, SLOPE_BINS
+        return zonal_erosion(self, elevation, slope, ELEVATION_BINS if elevation_bins is None else elevation_bins,
+                             SLOPE_BINS if slope_bins is None else slope_bins, pixel_size)
+
+
+def band_years(dataset, years=None):
+    """
+    Get the year of every band of a multi-band mask file.
+    Args:
+        dataset (rasterio.DatasetReader): The open mask file.
+        years (list): The years given by the user, one per band, if any.
+    Returns:
+        list: The year of each band, as integers.
+    """
+    if years is not None:
+        if len(years) != dataset.count:
+            raise ValueError(f"{dataset.name} has {dataset.count} bands but {len(years)} years were given.")
+        return [int(year) for year in years]
+    found = []
+    for band, description in enumerate(dataset.descriptions, start=1):
+        match = YEAR_PATTERN.search(description or '')
+        if match is None:
+            raise ValueError(f"Band {band} of {dataset.name} has no year in its description; pass the years.")
+        found.append(int(match.group(1)))
+    return found
+
+
+def load_multiband(file_path, years=None, stack=False):
+    """
+    Load a multi-band mask file, one band per year, with a single read.
+    Args:
+        file_path (str): Path to the multi-band mask file.
+        years (list): The year of each band. Defaults to the years in the band descriptions.
+        stack (bool): Return a RiverStack instead of River objects.
+    Returns:
+        list or RiverStack: A River object per year sorted by year, whose masks are
+            views into one cube, or the RiverStack itself.
+    """
+    river_stack = RiverStack.from_multiband(file_path, years)
+    if stack:
+        return river_stack
+    return river_stack.rivers()
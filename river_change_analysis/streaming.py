@@ -0,0 +1,88 @@
+# Purpose: Quantify erosion and accretion block by block for masks too large to load at once
+# Author: Ian St. Laurent
+
+import os
+from contextlib import ExitStack
+import numpy as np
+import rasterio
+from .river import PIXEL_SIZE
+from .mask import mask_year
+
+# Suffix of the change raster written next to the name of the later mask
+CHANGE_SUFFIX = '_change'
+
+
+def _change_profile(dataset):
+    """
+    Build the profile of a per-pixel change raster that matches a mask file.
+    Args:
+        dataset (rasterio.DatasetReader): The mask the change raster is aligned with.
+    Returns:
+        dict: The rasterio profile of the change raster.
+    """
+    profile = dataset.profile.copy()
+    profile.update(driver='GTiff', dtype='int8', count=1, nodata=None, compress='deflate')
+    block_height, block_width = dataset.block_shapes[0]
+    # GeoTIFF tiles must be multiples of 16, otherwise fall back to strips
+    if block_height % 16 == 0 and block_width % 16 == 0:
+        profile.update(tiled=True, blockxsize=block_width, blockysize=block_height)
+    else:
+        profile.update(tiled=False)
+        profile.pop('blockxsize', None)
+        profile.pop('blockysize', None)
+    return profile
+
+
+def stream_erosion(annual_data, pixel_size=PIXEL_SIZE, output_folder=None):
+    """
+    Quantify the erosion and accretion of the river without loading whole masks.
+    The masks are read one block at a time, following the internal tiling of the
+    first file, and every year of a block is read before the next block, so each
+    block of each file is read once and peak memory depends on the block size and
+    not on the scene size. Files tiled differently give the same result, but their
+    blocks may be decoded more than once.
+    Args:
+        annual_data (list): A list of River objects, in the order to compare them.
+            Only their file paths are used.
+        pixel_size (float): Size of a pixel in meters.
+        output_folder (str): If given, a change raster is written here for every pair
+            of years, with 1 for accretion, -1 for erosion and 0 elsewhere.
+    Returns:
+        tuple: Erosion and accretion arrays in km2, one value per pair of years.
+            The River objects also get their year, erosion and accretion set.
+    """
+    n_pairs = max(len(annual_data) - 1, 0)
+    erosion_pixels = np.zeros(n_pairs, dtype=np.int64)
+    accretion_pixels = np.zeros(n_pairs, dtype=np.int64)
+    for river in annual_data:
+        river.year = mask_year(river.file_path)
+    with ExitStack() as stack:
+        datasets = [stack.enter_context(rasterio.open(river.file_path)) for river in annual_data]
+        for river, dataset in zip(annual_data[1:], datasets[1:]):
+            if dataset.shape != datasets[0].shape:
+                raise ValueError(f"{river.file_path} does not have the same shape as {annual_data[0].file_path}.")
+        outputs = [None] * n_pairs
+        if output_folder is not None:
+            for i in range(n_pairs):
+                name = os.path.splitext(os.path.basename(annual_data[i + 1].file_path))[0] + CHANGE_SUFFIX + '.tif'
+                outputs[i] = stack.enter_context(rasterio.open(os.path.join(output_folder, name), 'w',
+                                                               **_change_profile(datasets[i + 1])))
+        if datasets:
+            for _, window in datasets[0].block_windows(1):
+                # Every block of every file is read once, and compared with the next year
+                previous = datasets[0].read(1, window=window)
+                for i in range(n_pairs):
+                    current = datasets[i + 1].read(1, window=window)
+                    accreted = current > previous
+                    eroded = previous > current
+                    accretion_pixels[i] += np.count_nonzero(accreted)
+                    erosion_pixels[i] += np.count_nonzero(eroded)
+                    if outputs[i] is not None:
+                        outputs[i].write(accreted.astype(np.int8) - eroded.astype(np.int8), 1, window=window)
+                    previous = current
+    erosion = erosion_pixels * (pixel_size**2) / 1000000
+    accretion = accretion_pixels * (pixel_size**2) / 1000000
+    for i in range(n_pairs):
+        annual_data[i + 1].erosion = erosion[i]
+        annual_data[i + 1].accretion = accretion[i]
+    return erosion, accretion
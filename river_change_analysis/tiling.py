@@ -0,0 +1,272 @@
+# Purpose: Tiled water mask and centerline processing for large reaches
+# Author: Ian St. Laurent
+
+import math
+import numpy as np
+from scipy.ndimage import distance_transform_edt
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from skimage import measure
+from skimage.morphology import thin
+from .river import close_mask, prune_skeleton, WATER_MASK_MIN_SIZE, MAX_DISTANCE_BRANCH_REMOVAL
+from .parallel import parallel_map
+
+TILE_SIZE = 1024
+# Two pixels for the dilation and two for the erosion of the 5x5 closing
+CLOSING_HALO = 4
+
+
+def _tiles(shape, tile_size):
+    """
+    Split a raster into a grid of tiles.
+    Args:
+        shape (tuple): The (row, col) shape of the raster.
+        tile_size (int): The size of a tile in pixels.
+    Returns:
+        list: The (row_start, row_stop, col_start, col_stop) bounds of each tile, row by row.
+    """
+    rows, cols = shape
+    return [(row, min(row + tile_size, rows), col, min(col + tile_size, cols))
+            for row in range(0, rows, tile_size) for col in range(0, cols, tile_size)]
+
+
+def _with_halo(bounds, halo, shape):
+    """
+    Grow tile bounds by a halo, clipped to the raster.
+    Args:
+        bounds (tuple): The tile bounds.
+        halo (int): Number of pixels added on every side.
+        shape (tuple): The (row, col) shape of the raster.
+    Returns:
+        tuple: The grown bounds, and the slices of the tile inside the grown bounds.
+    """
+    row_start, row_stop, col_start, col_stop = bounds
+    top = max(row_start - halo, 0)
+    left = max(col_start - halo, 0)
+    bottom = min(row_stop + halo, shape[0])
+    right = min(col_stop + halo, shape[1])
+    core = (slice(row_start - top, row_stop - top), slice(col_start - left, col_stop - left))
+    return (top, bottom, left, right), core
+
+
+def _close_tile(args):
+    """
+    Close a tile and label the background regions of its core.
+    Args:
+        args (tuple): The tile with its halo and the slices of the core.
+    Returns:
+        tuple: The closed core, the area of every background region and the labels
+            along the top, bottom, left and right edges of the core.
+    """
+    crop, core = args
+    closed = close_mask(crop)[core]
+    labels = measure.label(closed == 0)
+    areas = np.bincount(labels.ravel())[1:]
+    edges = (labels[0], labels[-1], labels[:, 0], labels[:, -1])
+    return closed, areas, edges
+
+
+def _fill_tile(args):
+    """
+    Fill the background regions of a closed tile that were found to be too small.
+    Args:
+        args (tuple): The closed core and a lookup of the regions to fill, by local label.
+    Returns:
+        np.ndarray: The filled core.
+    """
+    closed, fill = args
+    labels = measure.label(closed == 0)
+    closed[fill[labels]] = 1
+    return closed
+
+
+def _seam_links(first, second):
+    """
+    Find the 8-connected links between two rows of labels facing each other across a seam.
+    Args:
+        first (np.ndarray): Global labels along one side of the seam.
+        second (np.ndarray): Global labels along the other side.
+    Returns:
+        np.ndarray: An (n, 2) array of linked labels.
+    """
+    links = []
+    length = len(first)
+    for shift in (-1, 0, 1):
+        a = first[max(0, -shift):length - max(0, shift)]
+        b = second[max(0, shift):length - max(0, -shift)]
+        both = (a > 0) & (b > 0)
+        links.append(np.column_stack((a[both], b[both])))
+    return np.concatenate(links)
+
+
+def tiled_water_mask(mask, min_size=None, tile_size=TILE_SIZE, workers=None):
+    """
+    Tiled equivalent of fill_water_mask. Tiles are closed in parallel with enough halo
+    for the 5x5 closing kernel, tiles without any water are skipped, and background
+    regions that cross tile boundaries are merged before their area is compared with
+    min_size, so the result matches the untiled water mask.
+    Args:
+        mask (np.ndarray): Binary mask of the river.
+        min_size (int): Minimum size of a bar to be kept.
+        tile_size (int): The size of a tile in pixels.
+        workers (int): Number of worker processes. Defaults to all cores.
+    Returns:
+        np.ndarray: The filled water mask.
+    """
+    if min_size is None or min_size <= 0:
+        min_size = WATER_MASK_MIN_SIZE
+    mask = np.asarray(mask)
+    tiles = _tiles(mask.shape, tile_size)
+    grid_cols = len(range(0, mask.shape[1], tile_size))
+    watermask = np.zeros(mask.shape, dtype=mask.dtype)
+
+    jobs = []
+    processed = []
+    for i, bounds in enumerate(tiles):
+        (top, bottom, left, right), core = _with_halo(bounds, CLOSING_HALO, mask.shape)
+        crop = mask[top:bottom, left:right]
+        if crop.any():
+            jobs.append((crop, core))
+            processed.append(i)
+
+    # A tile without water is a single background region covering the whole tile
+    areas = []
+    edges = []
+    for bounds in tiles:
+        height, width = bounds[1] - bounds[0], bounds[3] - bounds[2]
+        areas.append(np.array([height * width]))
+        edges.append((np.ones(width, int), np.ones(width, int), np.ones(height, int), np.ones(height, int)))
+    for i, (closed, tile_areas, tile_edges) in zip(processed, parallel_map(_close_tile, jobs, workers)):
+        row_start, row_stop, col_start, col_stop = tiles[i]
+        watermask[row_start:row_stop, col_start:col_stop] = closed
+        areas[i] = tile_areas
+        edges[i] = tile_edges
+
+    # Give every region a global label, with 0 reserved for water
+    offsets = np.cumsum([0] + [len(tile_areas) for tile_areas in areas])
+    global_edges = [tuple(np.where(edge > 0, edge + offsets[i], 0) for edge in tile_edges)
+                    for i, tile_edges in enumerate(edges)]
+
+    # Link regions that touch across the seams and corners between tiles
+    links = [np.zeros((0, 2), dtype=int)]
+    for i in range(len(tiles)):
+        top, bottom, left, right = global_edges[i]
+        if (i + 1) % grid_cols:
+            links.append(_seam_links(right, global_edges[i + 1][2]))
+        if i + grid_cols < len(tiles):
+            links.append(_seam_links(bottom, global_edges[i + grid_cols][0]))
+            if (i + 1) % grid_cols:
+                links.append(np.array([[right[-1], global_edges[i + grid_cols + 1][2][0]]]))
+            if i % grid_cols:
+                links.append(np.array([[left[-1], global_edges[i + grid_cols - 1][3][0]]]))
+    links = np.concatenate(links)
+    links = links[(links[:, 0] > 0) & (links[:, 1] > 0)]
+    n_labels = offsets[-1] + 1
+    graph = coo_matrix((np.ones(len(links)), (links[:, 0], links[:, 1])), shape=(n_labels, n_labels))
+    _, regions = connected_components(graph, directed=False)
+
+    # Fill every merged region smaller than min_size
+    region_areas = np.bincount(regions, weights=np.concatenate([[0]] + areas), minlength=regions.max() + 1)
+    fill = region_areas[regions] < min_size
+    fill[0] = False
+    jobs = []
+    filled_tiles = []
+    for i, (row_start, row_stop, col_start, col_stop) in enumerate(tiles):
+        tile_fill = np.concatenate([[False], fill[offsets[i] + 1:offsets[i + 1] + 1]])
+        if tile_fill.any():
+            jobs.append((watermask[row_start:row_stop, col_start:col_stop], tile_fill))
+            filled_tiles.append(tiles[i])
+    for (row_start, row_stop, col_start, col_stop), filled in zip(filled_tiles, parallel_map(_fill_tile, jobs, workers)):
+        watermask[row_start:row_stop, col_start:col_stop] = filled
+    return watermask
+
+
+def _thin_tile(args):
+    """
+    Thin a tile of a water mask.
+    Args:
+        args (tuple): The tile with its halo and the slices of the core.
+    Returns:
+        np.ndarray: The thinned core.
+    """
+    crop, core = args
+    return thin(crop)[core]
+
+
+def centerline_halo(watermask):
+    """
+    Get the halo a tile needs for its thinned core to match the untiled thinning.
+    Thinning runs about as many iterations as the largest distance from water to the
+    bank, and each iteration looks two pixels further, so a cut at the edge of a tile
+    can not reach further than twice that distance.
+    Args:
+        watermask (np.ndarray): The filled water mask.
+    Returns:
+        int: The halo in pixels.
+    """
+    watermask = np.asarray(watermask) != 0
+    if not watermask.any():
+        return 0
+    return 2 * math.ceil(distance_transform_edt(watermask).max()) + 2
+
+
+def tiled_centerline(watermask, max_distance_branch_removal=None, tile_size=TILE_SIZE, halo=None, workers=None):
+    """
+    Tiled equivalent of process_centerline for a single water mask. Tiles are thinned
+    in parallel and stitched together, tiles without any water are skipped, and the
+    branches are pruned on the stitched skeleton so branches crossing tile boundaries
+    are handled like in the untiled centerline. When the halo is not smaller than the
+    tiles, such as for a lake or a very wide channel, the mask is thinned untiled.
+    Args:
+        watermask (np.ndarray): The filled water mask.
+        max_distance_branch_removal (int): The maximum distance to remove branches.
+        tile_size (int): The size of a tile in pixels.
+        halo (int): Number of pixels added around each tile before thinning. Defaults
+            to centerline_halo, the smallest halo for which the result matches.
+        workers (int): Number of worker processes. Defaults to all cores.
+    Returns:
+        np.ndarray: The pruned centerline.
+    """
+    if max_distance_branch_removal is None or max_distance_branch_removal <= 0:
+        max_distance_branch_removal = MAX_DISTANCE_BRANCH_REMOVAL
+    watermask = np.asarray(watermask)
+    if halo is None:
+        halo = centerline_halo(watermask)
+    if halo >= tile_size:
+        return prune_skeleton(thin(watermask), max_distance_branch_removal)
+    centerline = np.zeros(watermask.shape, dtype=bool)
+    tiles = []
+    jobs = []
+    for bounds in _tiles(watermask.shape, tile_size):
+        (top, bottom, left, right), core = _with_halo(bounds, halo, watermask.shape)
+        crop = watermask[top:bottom, left:right]
+        if crop.any():
+            tiles.append(bounds)
+            jobs.append((crop, core))
+    for (row_start, row_stop, col_start, col_stop), core in zip(tiles, parallel_map(_thin_tile, jobs, workers)):
+        centerline[row_start:row_stop, col_start:col_stop] = core
+    return prune_skeleton(centerline, max_distance_branch_removal)
+
+
+def process_tiled(annual_data, min_size=None, max_distance_branch_removal=None, tile_size=TILE_SIZE,
+                  halo=None, workers=None):
+    """
+    Compute the water mask and centerline of every River object tile by tile.
+    Args:
+        annual_data (list): A list of River objects with their masks loaded.
+        min_size (int): Minimum size of a bar to be removed.
+        max_distance_branch_removal (int): The maximum distance to remove branches.
+        tile_size (int): The size of a tile in pixels.
+        halo (int): Number of pixels added around each tile before thinning. Defaults
+            to centerline_halo of each water mask.
+        workers (int): Number of worker processes. Defaults to all cores.
+    Returns:
+        None. Modifies the River objects in place.
+    """
+    for river in annual_data:
+        # The tiled results match the untiled ones, so evicted rasters are rebuilt untiled
+        river._set_raster('watermask', tiled_water_mask(river.mask, min_size, tile_size, workers),
+                          ('water_mask_process', (min_size,)))
+        river._set_raster('centerline', tiled_centerline(river.watermask, max_distance_branch_removal, tile_size,
+                                                         halo, workers),
+                          ('process_centerline', (max_distance_branch_removal,)))
@@ -0,0 +1,177 @@
+# Purpose: Trace river centerlines into ordered, georeferenced vector lines
+# Author: Ian St. Laurent
+
+import json
+import numpy as np
+import shapely
+from shapely.geometry import LineString
+
+# Decimal places of the coordinates written to GeoJSON, centimeters for projected CRS
+GEOJSON_PRECISION = 2
+
+
+def main_channel_pixels(graph):
+    """
+    Chain the edges of the main channel of a skeleton graph into one ordered path.
+    Args:
+        graph (SkeletonGraph): The graph of the centerline.
+    Returns:
+        np.ndarray: An (n, 2) array of the (row, col) coordinates along the main channel,
+            empty if the skeleton has no two end points.
+    """
+    path = graph.main_channel()
+    if not path:
+        return np.zeros((0, 2), dtype=int)
+    first = graph.edges[path[0]]
+    node = first.start
+    if len(path) > 1 and first.start in (graph.edges[path[1]].start, graph.edges[path[1]].end):
+        node = first.end
+    pieces = []
+    for index in path:
+        edge = graph.edges[index]
+        # Edges are stored in either direction, walk each one away from the previous node
+        if edge.start == node:
+            pieces.append(edge.pixels)
+            node = edge.end
+        else:
+            pieces.append(edge.pixels[::-1])
+            node = edge.start
+    pixels = np.concatenate(pieces)
+    # Consecutive edges share the node pixel they meet at
+    keep = np.ones(len(pixels), dtype=bool)
+    keep[1:] = np.any(pixels[1:] != pixels[:-1], axis=1)
+    return pixels[keep]
+
+
+def pixel_coordinates(pixels, transform):
+    """
+    Convert (row, col) pixel indices into the map coordinates of the pixel centers.
+    Args:
+        pixels (np.ndarray): An (n, 2) array of (row, col) indices.
+        transform (Affine): The affine transform of the raster.
+    Returns:
+        np.ndarray: An (n, 2) array of (x, y) coordinates.
+    """
+    rows = pixels[:, 0] + 0.5
+    cols = pixels[:, 1] + 0.5
+    x = transform.a * cols + transform.b * rows + transform.c
+    y = transform.d * cols + transform.e * rows + transform.f
+    return np.column_stack([x, y])
+
+
+def downstream_pixels(graph, elevation=None):
+    """
+    Get the pixels of the main channel of a centerline in downstream order.
+    Args:
+        graph (SkeletonGraph): The graph of the pruned centerline.
+        elevation (np.ndarray): Elevation raster of the same shape as the mask. The path
+            starts at its higher end. Without it, the path starts at its topmost end.
+    Returns:
+        np.ndarray: An (n, 2) array of (row, col) coordinates.
+    """
+    pixels = main_channel_pixels(graph)
+    if len(pixels) < 2:
+        return pixels
+    first, last = pixels[0], pixels[-1]
+    reverse = tuple(last) < tuple(first)
+    if elevation is not None and elevation.shape == graph.shape:
+        start_height = elevation[first[0], first[1]]
+        end_height = elevation[last[0], last[1]]
+        if np.isfinite(start_height) and np.isfinite(end_height) and start_height != end_height:
+            reverse = end_height > start_height
+    if reverse:
+        pixels = pixels[::-1]
+    return pixels
+
+
+def trace_centerline(graph, transform, elevation=None):
+    """
+    Trace the main channel of a centerline into a LineString running downstream.
+    Args:
+        graph (SkeletonGraph): The graph of the pruned centerline.
+        transform (Affine): The affine transform of the mask.
+        elevation (np.ndarray): Elevation raster of the same shape as the mask. The line
+            starts at its higher end. Without it, the line starts at its topmost end.
+    Returns:
+        LineString: The ordered centerline in map coordinates, empty if there is no main channel.
+    """
+    pixels = downstream_pixels(graph, elevation)
+    if len(pixels) < 2:
+        return LineString()
+    return LineString(pixel_coordinates(pixels, transform))
+
+
+def orient(line, upstream):
+    """
+    Reverse a line if needed so it starts at the end nearest a point upstream.
+    Args:
+        line (LineString): The centerline.
+        upstream (tuple): (x, y) map coordinates of a point upstream of the reach.
+    Returns:
+        LineString: The line, starting upstream.
+    """
+    if line.is_empty:
+        return line
+    coords = np.asarray(line.coords)
+    upstream = np.asarray(upstream, dtype=float)
+    if np.hypot(*(coords[-1] - upstream)) < np.hypot(*(coords[0] - upstream)):
+        return LineString(coords[::-1])
+    return line
+
+
+def sinuosity(line):
+    """
+    Ratio of the length of a centerline to the straight distance between its ends.
+    Args:
+        line (LineString): The centerline.
+    Returns:
+        float: The sinuosity, NaN for an empty or closed line.
+    """
+    if line.is_empty:
+        return float('nan')
+    coords = line.coords
+    straight = np.hypot(coords[-1][0] - coords[0][0], coords[-1][1] - coords[0][1])
+    if straight == 0:
+        return float('nan')
+    return line.length / straight
+
+
+def downstream_distance(line, points):
+    """
+    Distance along a centerline from its start to the nearest position of each point.
+    Args:
+        line (LineString): The centerline, starting upstream.
+        points (np.ndarray): An (n, 2) array of (x, y) map coordinates.
+    Returns:
+        np.ndarray: The distance of each point in map units.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    return shapely.line_locate_point(line, shapely.points(points))
+
+
+def write_geojson(lines, file_path, properties=None, crs=None, precision=GEOJSON_PRECISION):
+    """
+    Write centerlines to a single GeoJSON file, one feature per line.
+    Args:
+        lines (list of LineString): The centerlines.
+        file_path (str): Path of the GeoJSON file.
+        properties (list of dict): Properties of each feature, such as the year.
+        crs (str): The CRS of the coordinates, such as 'EPSG:32612', stored in the
+            file since the coordinates are usually not longitude and latitude.
+        precision (int): Decimal places of the coordinates.
+    Returns:
+        str: Path of the GeoJSON file.
+    """
+    if properties is None:
+        properties = [{} for _ in lines]
+    features = []
+    for line, feature_properties in zip(lines, properties):
+        coordinates = np.round(np.asarray(line.coords), precision).tolist() if not line.is_empty else []
+        features.append({'type': 'Feature', 'geometry': {'type': 'LineString', 'coordinates': coordinates},
+                         'properties': feature_properties})
+    collection = {'type': 'FeatureCollection', 'features': features}
+    if crs is not None:
+        collection['crs'] = {'type': 'name', 'properties': {'name': str(crs)}}
+    with open(file_path, 'w') as file:
+        json.dump(collection, file)
+    return file_path
@@ -0,0 +1,96 @@
+# Purpose: Measure the channel width along the centerline with distance transforms
+# Author: Ian St. Laurent
+
+import numpy as np
+from .river import River, distance_to_pixels
+from .packed import PackedMask
+from .parallel import parallel_map
+from .instrument import stage
+from .migration import summarize
+
+# Percentile of the widths reported next to the mean, median and maximum
+WIDTH_PERCENTILE = 90
+
+
+def _width_job(args):
+    """
+    Compute the distance transform of a water mask in a worker process and sample the
+    width at the centerline pixels.
+    Args:
+        args (tuple): The packed water mask, its pixel sampling and the flat indices of
+            the centerline pixels.
+    Returns:
+        np.ndarray: The width at each centerline pixel in meters.
+    """
+    watermask, sampling, pixels = args
+    distance = distance_to_pixels(np.asarray(watermask) == 0, sampling)
+    return 2 * distance.ravel()[pixels]
+
+
+def centerline_pixels(river, profile=False):
+    """
+    Get the centerline pixels where the width is sampled.
+    Args:
+        river (River): A River object with a processed centerline.
+        profile (bool): Only take the main channel, in downstream order, instead of
+            every centerline pixel in row-major order.
+    Returns:
+        tuple: The flat pixel indices and, for a profile, the distance in meters of each
+            pixel along the channel from its upstream end.
+    """
+    centerline = np.asarray(river.centerline)
+    if not profile:
+        return np.flatnonzero(centerline), None
+    from .vector import downstream_pixels
+    pixels = downstream_pixels(river.build_graph(), River.DEM)
+    dy, dx = river.pixel_sampling(centerline.shape)
+    steps = np.diff(pixels, axis=0)
+    chainage = np.concatenate([[0.0], np.cumsum(np.hypot(steps[:, 0] * dy, steps[:, 1] * dx))])[:len(pixels)]
+    return np.ravel_multi_index((pixels[:, 0], pixels[:, 1]), centerline.shape), chainage
+
+
+def channel_width(annual_data, workers=None, profile=False):
+    """
+    Measure the channel width at the centerline of every year. The distance transform
+    of the water mask gives the distance from each water pixel to the nearest bank,
+    and the width at a centerline pixel is twice that distance.
+    Args:
+        annual_data (list): A list of River objects with processed water masks and centerlines.
+        workers (int): Number of worker processes, each computing the transforms of
+            some years. With 1, the transforms are computed in this process and kept in
+            the raster cache of the River objects for later calls.
+        profile (bool): Sample the main channel in downstream order, so every year gets
+            a width profile against the distance along the channel.
+    Returns:
+        dict: The 'years', the per-pixel 'widths' in meters of each year, their
+            'pixels' as flat indices, the summary arrays of summarize and, for
+            profiles, the 'chainage' of every pixel in meters.
+    """
+    annual_data = sorted(annual_data, key=lambda river: int(river.year))
+    sampled = [centerline_pixels(river, profile) for river in annual_data]
+    with stage('channel_width'):
+        if workers == 1 or len(annual_data) <= 1:
+            widths = []
+            for river, (pixels, _) in zip(annual_data, sampled):
+                distance = river.watermask_distance
+                if distance is None:
+                    distance = river.watermask_distance_transform()
+                widths.append(2 * distance.ravel()[pixels])
+        else:
+            jobs = []
+            for river, (pixels, _) in zip(annual_data, sampled):
+                watermask = river.watermask
+                if watermask is None:
+                    river.water_mask_process(None)
+                    watermask = river.watermask
+                if not isinstance(watermask, PackedMask):
+                    watermask = PackedMask.from_array(np.asarray(watermask))
+                jobs.append((watermask, river.pixel_sampling(watermask.shape), pixels))
+            widths = list(parallel_map(_width_job, jobs, workers))
+
+    width = summarize(widths, WIDTH_PERCENTILE)
+    width.update(years=np.array([int(river.year) for river in annual_data], dtype=int), widths=widths,
+                 pixels=[pixels for pixels, _ in sampled])
+    if profile:
+        width['chainage'] = [chainage for _, chainage in sampled]
+    return width
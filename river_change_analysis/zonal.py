@@ -0,0 +1,152 @@
+# Purpose: Break erosion and accretion down by elevation and slope class
+# Author: Ian St. Laurent
+
+import numpy as np
+from .river import River, PIXEL_SIZE
+from .packed import PackedMask
+from .instrument import stage
+
+# Number of equal elevation classes between the lowest and highest elevation
+ELEVATION_BINS = 10
+# Edges of the slope classes in degrees
+SLOPE_BINS = (0, 2, 5, 10, 20, 90)
+# Number of pixels of each year compared at a time, to bound temporary memory
+ZONAL_BLOCK_PIXELS = 2**20
+
+
+def bin_edges(values, bins):
+    """
+    Get the edges of the classes of a raster.
+    Args:
+        values (np.ndarray): The raster, NaN where it is undefined.
+        bins (int or list): A number of equal classes between the lowest and highest
+            value, or the class edges themselves.
+    Returns:
+        np.ndarray: The increasing class edges.
+    """
+    if np.ndim(bins) == 0:
+        low, high = np.nanmin(values), np.nanmax(values)
+        return np.linspace(low, high, int(bins) + 1)
+    edges = np.asarray(bins, dtype=float)
+    if edges.ndim != 1 or len(edges) < 2 or np.any(np.diff(edges) <= 0):
+        raise ValueError("The class edges must be an increasing list of at least two values.")
+    return edges
+
+
+def zone_raster(elevation, slope, elevation_edges, slope_edges):
+    """
+    Number every pixel by its elevation and slope class, zone = elevation class *
+    number of slope classes + slope class. Values outside the edges go in the first or
+    last class.
+    Args:
+        elevation (np.ndarray): The elevation, NaN outside the area of interest.
+        slope (np.ndarray): The slope in degrees, NaN where it is undefined.
+        elevation_edges (np.ndarray): Edges of the elevation classes.
+        slope_edges (np.ndarray): Edges of the slope classes.
+    Returns:
+        np.ndarray: The int32 zone of every pixel, -1 where the elevation or slope is undefined.
+    """
+    n_slope = len(slope_edges) - 1
+    elevation_class = np.searchsorted(elevation_edges[1:-1], elevation, side='right')
+    slope_class = np.searchsorted(slope_edges[1:-1], slope, side='right')
+    zones = (elevation_class * n_slope + slope_class).astype(np.int32)
+    zones[np.isnan(elevation) | np.isnan(slope)] = -1
+    return zones
+
+
+def _mask_rows(mask, start, stop):
+    """
+    Read a band of rows of a mask, unpacking only those rows of a packed mask.
+    Args:
+        mask (np.ndarray or PackedMask): The mask.
+        start (int): First row.
+        stop (int): Row after the last one.
+    Returns:
+        np.ndarray: The rows of the mask.
+    """
+    if isinstance(mask, PackedMask):
+        return np.unpackbits(mask.bits[start:stop], axis=-1, count=mask.shape[-1])
+    return np.asarray(mask[start:stop])
+
+
+def zonal_change(masks, zones, n_zones, block_pixels=ZONAL_BLOCK_PIXELS):
+    """
+    Count the eroded and accreted pixels of every consecutive pair of masks in every
+    zone. Each band of rows is compared for all pairs at once and counted with one
+    bincount per direction, so the work is linear in the number of pixels.
+    Args:
+        masks (np.ndarray or list): A (year, row, col) cube, or the masks of each year.
+        zones (np.ndarray): The zone of every pixel, -1 to skip it.
+        n_zones (int): Number of zones.
+        block_pixels (int): Number of pixels of each year compared at a time.
+    Returns:
+        tuple: Erosion and accretion pixel counts, each an (n_pairs, n_zones) array.
+    """
+    n_pairs = max(len(masks) - 1, 0)
+    erosion = np.zeros(n_pairs * n_zones, dtype=np.int64)
+    accretion = np.zeros(n_pairs * n_zones, dtype=np.int64)
+    block_rows = max(block_pixels // max(zones.shape[1], 1), 1)
+    for row in range(0, zones.shape[0], block_rows):
+        if isinstance(masks, np.ndarray):
+            block = masks[:, row:row + block_rows]
+        else:
+            block = np.stack([_mask_rows(mask, row, row + block_rows) for mask in masks])
+        block = block.reshape(len(masks), -1) != 0
+        block_zones = zones[row:row + block_rows].ravel()
+        inside = block_zones >= 0
+        block, block_zones = block[:, inside], block_zones[inside]
+        for counts, changed in ((accretion, block[1:] & ~block[:-1]), (erosion, block[:-1] & ~block[1:])):
+            # Code every changed pixel by its pair and zone, then count all codes at once
+            pair, pixel = np.nonzero(changed)
+            counts += np.bincount(pair * n_zones + block_zones[pixel], minlength=n_pairs * n_zones)
+    return erosion.reshape(n_pairs, n_zones), accretion.reshape(n_pairs, n_zones)
+
+
+def zonal_erosion(annual_data, elevation=None, slope=None, elevation_bins=ELEVATION_BINS, slope_bins=SLOPE_BINS,
+                  pixel_size=PIXEL_SIZE):
+    """
+    Quantify the erosion and accretion of every consecutive pair of years by elevation
+    and slope class.
+    Args:
+        annual_data (list or RiverStack): The River objects of a reach, or its RiverStack.
+        elevation (np.ndarray): The elevation. Defaults to River.DEM.
+        slope (np.ndarray): The slope in degrees. Defaults to River.SLOPE.
+        elevation_bins (int or list): Number of equal elevation classes, or their edges.
+        slope_bins (int or list): Number of equal slope classes, or their edges in degrees.
+        pixel_size (float): Size of a pixel in meters.
+    Returns:
+        dict: The (earlier, later) 'years' of each pair, the 'erosion' and 'accretion'
+            in km2 as (n_pairs, n_zones) arrays, the 'area' of every zone in km2 and the
+            'elevation_edges' and 'slope_edges' of the classes. Zone z is elevation class
+            z // n_slope and slope class z % n_slope.
+    """
+    elevation = River.DEM if elevation is None else elevation
+    slope = River.SLOPE if slope is None else slope
+    if elevation is None or slope is None:
+        raise ValueError("No elevation or slope, load them with River.load_dem.")
+    elevation = np.asarray(elevation, dtype=float)
+    slope = np.asarray(slope, dtype=float)
+    if hasattr(annual_data, 'cube'):
+        masks, years = annual_data.cube, [int(year) for year in annual_data.years]
+    else:
+        annual_data = sorted(annual_data, key=lambda river: int(river.year))
+        masks, years = [river.mask for river in annual_data], [int(river.year) for river in annual_data]
+    shape = tuple(masks.shape[1:] if isinstance(masks, np.ndarray) else masks[0].shape)
+    if elevation.shape != shape or slope.shape != shape:
+        raise ValueError("The elevation and slope do not have the same shape as the masks.")
+
+    elevation_edges = bin_edges(elevation, elevation_bins)
+    slope_edges = bin_edges(slope, slope_bins)
+    n_zones = (len(elevation_edges) - 1) * (len(slope_edges) - 1)
+    with stage('zonal_erosion'):
+        zones = zone_raster(elevation, slope, elevation_edges, slope_edges)
+        erosion, accretion = zonal_change(masks, zones, n_zones)
+    pixel_area = pixel_size**2 / 1000000
+    return {
+        'years': np.array(list(zip(years[:-1], years[1:])), dtype=int).reshape(-1, 2),
+        'erosion': erosion * pixel_area,
+        'accretion': accretion * pixel_area,
+        'area': np.bincount(zones[zones >= 0], minlength=n_zones) * pixel_area,
+        'elevation_edges': elevation_edges,
+        'slope_edges': slope_edges,
+    }
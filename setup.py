@@ -15,10 +15,11 @@ requirements = [
     'matplotlib',
     'rasterio',
     'numpy',
-    'shapely',
+    'shapely>=2',
     'earthengine-api==0.1.379',
     'opencv-python',
     'scipy',
+    'importlib_metadata; python_version < "3.8"',
 ]
 
 test_requirements = [ ]
@@ -26,18 +27,22 @@ test_requirements = [ ]
 setup(
     author="Ian St. Laurent",
     author_email='ianstlaurent7@gmail.com',
-    python_requires='>=3.6',
+    python_requires='>=3.7',
     classifiers=[
         'Development Status :: 2 - Pre-Alpha',
         'Intended Audience :: Developers',
         'License :: OSI Approved :: MIT License',
         'Natural Language :: English',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: 3.8',
     ],
     description="Analyzes rivers width, accretion, and erosion over time using Landsat imagery.",
+    entry_points={
+        'console_scripts': [
+            'river-change-cache=river_change_analysis.disk_cache:main',
+        ],
+    },
     install_requires=requirements,
     license="MIT license",
     long_description=readme + '\n\n' + history,
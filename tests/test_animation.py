@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""Tests for drawing and encoding centerline migration animations."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+from river_change_analysis.animation import (BACKGROUND_COLOR, CENTERLINE_COLOR, MASK_COLOR,
+                                             PREVIOUS_CENTERLINE_COLOR, build_frame, downsample, encode_animation)
+from river_change_analysis.river import River
+
+
+def river_year(year, row, shape=(41, 63), water=None):
+    """A River object with a horizontal centerline on one row of a band of water."""
+    river = River(None)
+    mask = np.zeros(shape, dtype=np.uint8)
+    start, stop = water if water is not None else (row - 3, row + 4)
+    mask[start:stop] = 1
+    centerline = np.zeros(shape, dtype=bool)
+    centerline[row, 2:-2] = True
+    river.mask = mask
+    river.centerline = centerline
+    river.year = str(year)
+    return river
+
+
+def read_video(file_path):
+    capture = cv2.VideoCapture(file_path)
+    frames = []
+    while True:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        frames.append(frame)
+    capture.release()
+    return frames
+
+
+class TestDownsample(unittest.TestCase):
+
+    def test_any_pixel_keeps_the_block(self):
+        array = np.zeros((7, 10), dtype=np.uint8)
+        array[3, 4] = 1
+        array[6, 9] = 1
+        result = downsample(array, 3)
+        # Partial blocks at the edges are padded with zeros
+        self.assertEqual(result.shape, (3, 4))
+        expected = np.zeros((3, 4), dtype=bool)
+        expected[1, 1] = expected[2, 3] = True
+        np.testing.assert_array_equal(result, expected)
+
+    def test_thin_line_is_kept(self):
+        line = np.eye(100, dtype=bool)
+        np.testing.assert_array_equal(downsample(line, 4), np.eye(25, dtype=bool))
+        np.testing.assert_array_equal(downsample(line, 1), line)
+
+
+class TestBuildFrame(unittest.TestCase):
+
+    def test_layers(self):
+        previous = river_year(1986, 15)
+        river = river_year(1987, 20)
+        frame = build_frame(river, previous, label=False)
+        self.assertEqual(frame.shape, (41, 63, 3))
+        self.assertEqual(frame.dtype, np.uint8)
+        self.assertEqual(tuple(frame[0, 0]), BACKGROUND_COLOR)
+        self.assertEqual(tuple(frame[18, 30]), MASK_COLOR)
+        self.assertEqual(tuple(frame[15, 30]), PREVIOUS_CENTERLINE_COLOR)
+        self.assertEqual(tuple(frame[20, 30]), CENTERLINE_COLOR)
+        # The current centerline is drawn over the previous one
+        self.assertEqual(tuple(build_frame(river, river, label=False)[20, 30]), CENTERLINE_COLOR)
+
+    def test_options(self):
+        river = river_year(1986, 20)
+        frame = build_frame(river, factor=4, show_mask=False, label=False)
+        self.assertEqual(frame.shape, (11, 16, 3))
+        self.assertEqual(tuple(frame[5, 8]), CENTERLINE_COLOR)
+        self.assertEqual(tuple(frame[4, 8]), BACKGROUND_COLOR)
+        labelled = build_frame(river, show_mask=False)
+        self.assertTrue(np.any(labelled[:20] != frame[0, 0]))
+
+
+class TestEncodeAnimation(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.folder, 'migration.mp4')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_frames_in_order(self):
+        # More frames than fit in the window of one worker, with water growing every year
+        rivers = [river_year(1986 + i, 20, water=(0, 4 * i + 1)) for i in range(7)]
+        self.assertEqual(encode_animation(rivers, self.file_path, label=False, workers=1), self.file_path)
+        frames = read_video(self.file_path)
+        self.assertEqual(len(frames), 7)
+        # Odd dimensions are padded to even ones for the codec
+        self.assertEqual(frames[0].shape, (42, 64, 3))
+        water = [np.mean(np.abs(frame[:, :, 0].astype(int) - MASK_COLOR[0]) < 30) for frame in frames]
+        self.assertEqual(water, sorted(water))
+        self.assertLess(water[0], water[-1])
+
+    def test_downsampled(self):
+        rivers = [river_year(1986 + i, 10 + 4 * i) for i in range(3)]
+        River.animate_centerline_migration(rivers, self.file_path, factor=3, workers=2)
+        frames = read_video(self.file_path)
+        self.assertEqual(len(frames), 3)
+        self.assertEqual(frames[0].shape, (14, 22, 3))
+
+    def test_no_writer(self):
+        rivers = [river_year(1986, 20)]
+        with self.assertRaises(ValueError):
+            encode_animation(rivers, os.path.join(self.folder, 'missing', 'migration.mp4'), workers=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""Tests for processing the masks of many River objects across worker processes."""
+
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import rasterio
+
+from river_change_analysis.batch import process_rivers
+from river_change_analysis.packed import PackedMask
+from river_change_analysis.river import River, WATER_MASK_MIN_SIZE, MAX_DISTANCE_BRANCH_REMOVAL
+
+MASK_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'binary_river_masks')
+RASTERS = ('mask', 'watermask', 'centerline')
+
+
+def bundled_files():
+    return [glob.glob(os.path.join(MASK_FOLDER, 'Athabasca_Reach_1', f'*_river_mask{year}.tif'))[0]
+            for year in (1986, 1987, 1988)]
+
+
+def process(file_paths, workers, packed=False):
+    return process_rivers([River(file_path) for file_path in file_paths], WATER_MASK_MIN_SIZE,
+                          MAX_DISTANCE_BRANCH_REMOVAL, workers=workers, packed=packed)
+
+
+def evict_and_rebuild(river):
+    """Drop the cached rasters of a River object, so they are rebuilt from their sources."""
+    River.cache.discard_owner(river._id)
+    return {name: np.asarray(getattr(river, name)) for name in RASTERS}
+
+
+class TestProcessRivers(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.files = bundled_files()
+
+    def test_worker_counts_give_identical_results(self):
+        serial = process(self.files, 1)
+        parallel = process(self.files, 3)
+        for one, other in zip(serial, parallel):
+            self.assertEqual(one.year, other.year)
+            self.assertEqual(one.transform, other.transform)
+            self.assertEqual(one.crs, other.crs)
+            self.assertEqual(one._sources, other._sources)
+            for name in RASTERS:
+                np.testing.assert_array_equal(getattr(one, name), getattr(other, name))
+
+    def test_matches_processing_in_place(self):
+        for river, file_path in zip(process(self.files, 2), self.files):
+            expected = River(file_path)
+            River.water_mask_process(expected, WATER_MASK_MIN_SIZE)
+            River.process_centerline(expected, MAX_DISTANCE_BRANCH_REMOVAL)
+            self.assertEqual(river.year, expected.year)
+            self.assertIsNotNone(river.transform)
+            self.assertEqual(river.transform, expected.transform)
+            self.assertEqual(river.crs, expected.crs)
+            for name in RASTERS:
+                np.testing.assert_array_equal(getattr(river, name), getattr(expected, name))
+
+    def test_packed(self):
+        for river in process(self.files, 2, packed=True):
+            self.assertIsInstance(river.mask, PackedMask)
+            self.assertIsInstance(river.watermask, PackedMask)
+            self.assertEqual(river._sources['mask'], ('load_mask', (True,)))
+            expected = {name: np.asarray(getattr(river, name)) for name in RASTERS}
+            rebuilt = evict_and_rebuild(river)
+            self.assertIsInstance(river.mask, PackedMask)
+            for name in RASTERS:
+                np.testing.assert_array_equal(rebuilt[name], expected[name])
+
+
+class TestNonBinaryMask(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        with rasterio.open(bundled_files()[0]) as dataset:
+            profile = dataset.profile
+            mask = dataset.read(1)
+        # Water pixels labelled 1 or 2, as in classified masks
+        mask = mask * np.where(np.arange(mask.shape[1]) % 2, 1, 2).astype(mask.dtype)
+        self.mask = mask
+        self.file_path = os.path.join(self.folder, 'Reach_1_river_mask2000.tif')
+        with rasterio.open(self.file_path, 'w', **profile) as dataset:
+            dataset.write(mask, 1)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_stays_unpacked(self):
+        river, = process([self.file_path], 1, packed=True)
+        self.assertNotIsInstance(river.mask, PackedMask)
+        self.assertNotIsInstance(river.watermask, PackedMask)
+        self.assertEqual(river._sources['mask'], ('load_mask', (False,)))
+        np.testing.assert_array_equal(river.mask, self.mask)
+        watermask = np.array(river.watermask)
+        rebuilt = evict_and_rebuild(river)
+        np.testing.assert_array_equal(rebuilt['mask'], self.mask)
+        np.testing.assert_array_equal(rebuilt['watermask'], watermask)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+"""Tests for the memory-budgeted raster cache and the lazy rasters of River objects."""
+
+import glob
+import os
+import pickle
+import unittest
+
+import numpy as np
+
+from river_change_analysis.cache import RasterCache
+from river_change_analysis.packed import PackedMask
+from river_change_analysis.river import River, WATER_MASK_MIN_SIZE, MAX_DISTANCE_BRANCH_REMOVAL
+
+# Cache key that is not owned by any River object
+FILLER = (None, 'filler')
+MASK_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'binary_river_masks')
+
+
+def processed_river(file_path, packed=False):
+    river = River(file_path)
+    river.load_mask(packed)
+    River.water_mask_process(river, WATER_MASK_MIN_SIZE)
+    River.process_centerline(river, MAX_DISTANCE_BRANCH_REMOVAL)
+    return river
+
+
+def snapshot(river):
+    """Copy the rasters of a River object while they are all cached."""
+    return {name: np.array(getattr(river, name)) for name in ('mask', 'watermask', 'centerline')}
+
+
+class TestRasterCache(unittest.TestCase):
+
+    def test_least_recently_used_is_evicted(self):
+        cache = RasterCache(max_bytes=250)
+        for name in 'abc':
+            cache.put((0, name), np.zeros(100, dtype=np.uint8))
+        self.assertNotIn((0, 'a'), cache)
+        self.assertEqual(cache.nbytes, 200)
+        # Reading 'b' makes 'c' the oldest
+        cache.get((0, 'b'))
+        cache.put((0, 'd'), np.zeros(100, dtype=np.uint8))
+        self.assertEqual(sorted(key[1] for key in cache._entries), ['b', 'd'])
+
+    def test_newest_array_is_kept_over_budget(self):
+        cache = RasterCache(max_bytes=10)
+        cache.put((0, 'a'), np.zeros(100, dtype=np.uint8))
+        cache.put((0, 'b'), np.zeros(100, dtype=np.uint8))
+        self.assertEqual(len(cache), 1)
+        self.assertIn((0, 'b'), cache)
+        cache.max_bytes = 0
+        self.assertEqual(len(cache), 1)
+
+    def test_discard_owner(self):
+        cache = RasterCache()
+        cache.put((0, 'a'), np.zeros(10))
+        cache.put((1, 'a'), np.zeros(10))
+        cache.discard_owner(0)
+        self.assertEqual(list(cache._entries), [(1, 'a')])
+        self.assertEqual(cache.nbytes, 80)
+
+
+class TestRiverEviction(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.file_path = glob.glob(os.path.join(MASK_FOLDER, 'Athabasca_Reach_1', '*_river_mask1986.tif'))[0]
+
+    def setUp(self):
+        self.max_bytes = River.cache.max_bytes
+
+    def tearDown(self):
+        River.cache.discard(FILLER)
+        River.cache.max_bytes = self.max_bytes
+
+    def evict(self):
+        # The newest array is always kept, so a filler array pushes out every raster
+        River.cache.max_bytes = 1
+        River.cache.put(FILLER, np.zeros(1, dtype=np.uint8))
+        self.assertEqual(len(River.cache), 1)
+
+    def test_evicted_rasters_are_rebuilt(self):
+        river = processed_river(self.file_path)
+        expected = snapshot(river)
+        for name in ('centerline', 'watermask', 'mask'):
+            self.evict()
+            self.assertNotIn((river._id, name), River.cache)
+            np.testing.assert_array_equal(getattr(river, name), expected[name])
+        self.assertIsNotNone(river.transform)
+
+    def test_distance_transforms_are_rebuilt(self):
+        river = processed_river(self.file_path)
+        expected = river.centerline_distance_transform().copy()
+        self.evict()
+        np.testing.assert_array_equal(river.centerline_distance, expected)
+
+    def test_packed_rasters_are_rebuilt(self):
+        river = processed_river(self.file_path, packed=True)
+        expected = {name: getattr(river, name).bits.copy() for name in ('mask', 'watermask')}
+        unpacked = snapshot(processed_river(self.file_path))
+        for name in ('watermask', 'mask'):
+            self.evict()
+            value = getattr(river, name)
+            self.assertIsInstance(value, PackedMask)
+            np.testing.assert_array_equal(value.bits, expected[name])
+            np.testing.assert_array_equal(np.asarray(value), unpacked[name])
+        self.evict()
+        np.testing.assert_array_equal(river.centerline, unpacked['centerline'])
+
+    def test_pinned_rasters_survive_eviction(self):
+        river = processed_river(self.file_path)
+        watermask = np.array(river.watermask)
+        # Assigned by hand, so it has no source to rebuild it from
+        river.watermask = watermask
+        self.assertNotIn('watermask', river._sources)
+        self.assertNotIn((river._id, 'watermask'), River.cache)
+        self.evict()
+        self.assertIs(river.watermask, watermask)
+        # The centerline still has a source and is rebuilt from the pinned water mask
+        centerline = np.array(river.centerline)
+        self.evict()
+        np.testing.assert_array_equal(river.centerline, centerline)
+
+    def test_assigning_drops_derived_rasters(self):
+        river = processed_river(self.file_path)
+        river.centerline_distance_transform()
+        river.centerline = np.array(river.centerline)
+        self.assertIsNone(river.centerline_distance)
+        self.assertNotIn('centerline_distance', river._sources)
+        river.watermask = None
+        self.assertIsNone(river.watermask)
+        self.assertNotIn('watermask', river._sources)
+
+    def test_unloaded_mask_is_read_on_access(self):
+        river = River(self.file_path)
+        self.assertEqual(river._sources['mask'], ('load_mask', (False,)))
+        self.assertNotIn((river._id, 'mask'), River.cache)
+        self.assertEqual(river.mask.ndim, 2)
+        self.assertEqual(river.year, '1986')
+
+    def test_pickle(self):
+        river = processed_river(self.file_path)
+        river.width = 'kept'
+        expected = snapshot(river)
+        pinned = np.array(river.centerline)
+        river.centerline = pinned
+        copy = pickle.loads(pickle.dumps(river))
+        self.assertNotEqual(copy._id, river._id)
+        self.assertEqual(copy.width, 'kept')
+        self.assertEqual(copy.transform, river.transform)
+        self.assertEqual(copy.crs, river.crs)
+        np.testing.assert_array_equal(copy.centerline, pinned)
+        for name in ('mask', 'watermask'):
+            # Sent along with the River object, without reading the file again
+            self.assertIn((copy._id, name), River.cache)
+            np.testing.assert_array_equal(getattr(copy, name), expected[name])
+        self.evict()
+        np.testing.assert_array_equal(copy.watermask, expected['watermask'])
+        np.testing.assert_array_equal(copy.mask, expected['mask'])
+
+    def test_pickle_after_eviction(self):
+        river = processed_river(self.file_path)
+        expected = snapshot(river)
+        self.evict()
+        copy = pickle.loads(pickle.dumps(river))
+        for name in ('mask', 'watermask', 'centerline'):
+            np.testing.assert_array_equal(getattr(copy, name), expected[name])
+
+    def test_released_with_the_river(self):
+        river = processed_river(self.file_path)
+        river_id = river._id
+        del river
+        self.assertFalse(any(key[0] == river_id for key in River.cache._entries))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""Tests for the vectorized centerline end point detection and branch pruning."""
+
+import glob
+import os
+import unittest
+
+import numpy as np
+from skimage.morphology import thin
+
+from river_change_analysis.river import River, fill_water_mask, prune_skeleton, WATER_MASK_MIN_SIZE
+
+MASK_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'binary_river_masks')
+
+
+def find_end_points_loop(centerline):
+    """Reference: scan every pixel and count its neighbors, as before the vectorization."""
+    padded = np.pad(centerline, 1, mode='constant', constant_values=0)
+    end_points = []
+    for y in range(1, padded.shape[0] - 1):
+        for x in range(1, padded.shape[1] - 1):
+            if padded[y, x] and np.sum(padded[y - 1:y + 2, x - 1:x + 2]) - 1 == 1:
+                end_points.append((y - 1, x - 1))
+    return end_points
+
+
+def prune_loop(centerline, max_distance):
+    """Reference: remove every end point of the whole raster, max_distance times."""
+    centerline = centerline.astype(bool).copy()
+    for _ in range(max_distance):
+        end_points = find_end_points_loop(centerline)
+        if not end_points:
+            break
+        for end_point in end_points:
+            centerline[end_point] = False
+    return centerline
+
+
+def bundled_skeleton(reach, year):
+    """Thin the water mask of a bundled mask, before any pruning."""
+    file_path, = glob.glob(os.path.join(MASK_FOLDER, f'Athabasca_Reach_{reach}', f'*_river_mask{year}.tif'))
+    river = River(file_path)
+    return thin(fill_water_mask(np.asarray(river.mask), WATER_MASK_MIN_SIZE))
+
+
+class TestPruneSkeleton(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.skeletons = [bundled_skeleton(1, 1986), bundled_skeleton(2, 2005)]
+
+    def test_end_points_match_loop(self):
+        for skeleton in self.skeletons:
+            river = River(None)
+            river.centerline = skeleton
+            self.assertEqual(river._find_end_points(), find_end_points_loop(skeleton))
+
+    def test_prune_matches_loop(self):
+        for skeleton in self.skeletons:
+            for max_distance in (1, 7, 40):
+                np.testing.assert_array_equal(prune_skeleton(skeleton, max_distance), prune_loop(skeleton, max_distance))
+
+    def test_prune_matches_loop_on_random_skeletons(self):
+        rng = np.random.default_rng(0)
+        for _ in range(5):
+            skeleton = thin(rng.random((60, 80)) < 0.45)
+            np.testing.assert_array_equal(prune_skeleton(skeleton, 5), prune_loop(skeleton, 5))
+
+    def test_prune_keeps_input(self):
+        skeleton = self.skeletons[0].copy()
+        prune_skeleton(skeleton, 10)
+        np.testing.assert_array_equal(skeleton, self.skeletons[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""Tests for the persistent on-disk cache of derived River rasters."""
+
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from river_change_analysis import disk_cache
+from river_change_analysis.disk_cache import DiskCache
+
+
+class TestDiskCache(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache = DiskCache(os.path.join(self.folder, 'cache'))
+        self.mask_path = os.path.join(self.folder, 'mask.tif')
+        with open(self.mask_path, 'wb') as file:
+            file.write(b'mask 1986')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def entry_paths(self):
+        return sorted(path for _, _, path in self.cache._entries())
+
+    def test_round_trip(self):
+        key = self.cache.key(self.mask_path, 'watermask', min_size=1000)
+        self.assertIsNone(self.cache.get(key))
+        array = np.arange(12, dtype=np.uint8).reshape(3, 4)
+        self.cache.put(key, array)
+        np.testing.assert_array_equal(self.cache.get(key), array)
+        self.assertEqual(self.cache.nbytes, os.path.getsize(self.entry_paths()[0]))
+
+    def test_key_depends_on_file_name_and_parameters(self):
+        key = self.cache.key(self.mask_path, 'watermask', min_size=1000)
+        self.assertEqual(self.cache.key(self.mask_path, 'watermask', min_size=1000), key)
+        self.assertNotEqual(self.cache.key(self.mask_path, 'watermask', min_size=500), key)
+        self.assertNotEqual(self.cache.key(self.mask_path, 'centerline', min_size=1000), key)
+
+    def test_key_changes_with_file_content(self):
+        key = self.cache.key(self.mask_path, 'watermask', min_size=1000)
+        with open(self.mask_path, 'wb') as file:
+            file.write(b'mask 1987!')
+        self.assertNotEqual(self.cache.key(self.mask_path, 'watermask', min_size=1000), key)
+
+    def test_key_changes_with_format_and_dependencies(self):
+        key = self.cache.key(self.mask_path, 'watermask', min_size=1000)
+        with mock.patch.object(disk_cache, 'CACHE_FORMAT_VERSION', disk_cache.CACHE_FORMAT_VERSION + 1):
+            self.assertNotEqual(self.cache.key(self.mask_path, 'watermask', min_size=1000), key)
+        versions = dict(disk_cache.dependency_versions(), numpy='0.0')
+        with mock.patch.object(disk_cache, 'dependency_versions', return_value=versions):
+            self.assertNotEqual(self.cache.key(self.mask_path, 'watermask', min_size=1000), key)
+        self.assertEqual(self.cache.key(self.mask_path, 'watermask', min_size=1000), key)
+
+    def test_least_recently_used_are_evicted(self):
+        rng = np.random.default_rng(0)
+        arrays = {f'{i:064x}': rng.integers(0, 255, 4096, dtype=np.uint8) for i in range(4)}
+        for key, array in arrays.items():
+            self.cache.put(key, array)
+        size = max(os.path.getsize(path) for path in self.entry_paths())
+        # Give every entry a distinct last use, oldest first, then use the oldest again
+        now = time.time()
+        for i, key in enumerate(arrays):
+            os.utime(self.cache._path(key), (now - 100 + i, now - 100 + i))
+        first = next(iter(arrays))
+        self.cache.get(first)
+        self.cache.max_bytes = 3 * size + size // 2
+        self.cache.put(f'{9:064x}', arrays[first])
+        remaining = {os.path.basename(path)[:-4] for path in self.entry_paths()}
+        self.assertIn(first, remaining)
+        self.assertNotIn(f'{1:064x}', remaining)
+        self.assertLessEqual(self.cache.nbytes, self.cache.max_bytes * disk_cache.EVICTION_TARGET)
+        self.assertEqual(self.cache._nbytes, self.cache.nbytes)
+
+    def test_read_only_cache_still_serves(self):
+        key = self.cache.key(self.mask_path, 'watermask', min_size=1000)
+        self.cache.put(key, np.ones(5, dtype=np.uint8))
+        with mock.patch.object(disk_cache.os, 'utime', side_effect=PermissionError):
+            np.testing.assert_array_equal(self.cache.get(key), np.ones(5, dtype=np.uint8))
+
+    def test_corrupt_entry_is_a_miss(self):
+        key = f'{1:064x}'
+        os.makedirs(os.path.dirname(self.cache._path(key)))
+        with open(self.cache._path(key), 'wb') as file:
+            file.write(b'not an npz')
+        self.assertIsNone(self.cache.get(key))
+
+    def test_command_line(self):
+        for i in range(3):
+            self.cache.put(f'{i:064x}', np.zeros(100, dtype=np.uint8))
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            disk_cache.main([self.cache.folder, '--max-bytes', '0'])
+        self.assertIn('Removed 3 cached arrays', output.getvalue())
+        self.assertIn('Cache size: 0 bytes', output.getvalue())
+        self.cache.put(f'{5:064x}', np.zeros(100, dtype=np.uint8))
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            disk_cache.main([self.cache.folder, '--clear'])
+        self.assertIn('Removed 1 cached arrays', output.getvalue())
+        self.assertEqual(self.entry_paths(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
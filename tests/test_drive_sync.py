@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+"""Tests for the Google Drive mask downloader, run against a local stand-in Drive service."""
+
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+import unittest
+
+from river_change_analysis.google_drive_extraction import DriveSync, PARTIAL_SUFFIX
+
+
+class FakeRequest:
+    def __init__(self, function):
+        self.function = function
+        self.headers = {}
+
+    def execute(self):
+        return self.function(self.headers)
+
+
+class FakeFiles:
+    def __init__(self, drive):
+        self.drive = drive
+
+    def list(self, q, pageSize, pageToken=None, fields=None):
+        def execute(headers):
+            pattern = re.search(r"name contains '(.*?)'", q).group(1)
+            names = sorted(file_id for file_id in self.drive.files if pattern in self.drive.name(file_id))
+            start = int(pageToken or 0)
+            page = names[start:start + self.drive.page_size]
+            results = {'files': [self.drive.item(name) for name in page]}
+            if start + self.drive.page_size < len(names):
+                results['nextPageToken'] = str(start + self.drive.page_size)
+            return results
+        return FakeRequest(execute)
+
+    def get_media(self, fileId):
+        def execute(headers):
+            with self.drive.lock:
+                self.drive.ranges.append((fileId, headers.get('Range')))
+                if self.drive.interruptions.get(fileId, 0) > 0:
+                    self.drive.interruptions[fileId] -= 1
+                    raise ConnectionError('Connection reset by peer')
+            start, end = map(int, re.match(r'bytes=(\d+)-(\d+)', headers['Range']).groups())
+            return self.drive.files[fileId][start:end + 1]
+        return FakeRequest(execute)
+
+
+class FakeDrive:
+    """Serves files from memory with the parts of the Drive v3 API used by DriveSync."""
+
+    def __init__(self, files, page_size=2):
+        self.files = files
+        self.page_size = page_size
+        self.ranges = []
+        self.interruptions = {}
+        # Files whose name differs from their id, and their modification times
+        self.names = {}
+        self.modified = {}
+        self.lock = threading.Lock()
+
+    def name(self, file_id):
+        return self.names.get(file_id, file_id)
+
+    def item(self, file_id):
+        content = self.files[file_id]
+        return {'id': file_id, 'name': self.name(file_id), 'size': str(len(content)),
+                'md5Checksum': hashlib.md5(content).hexdigest(),
+                'modifiedTime': self.modified.get(file_id, '2024-01-01T00:00:00.000Z')}
+
+    def service(self):
+        # A new service object per thread, like googleapiclient.discovery.build
+        return FakeService(self)
+
+
+class FakeService:
+    def __init__(self, drive):
+        self.drive = drive
+
+    def files(self):
+        return FakeFiles(self.drive)
+
+
+class TestDriveSync(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.drive = FakeDrive({f'Reach_1_river_mask{year}.tif': os.urandom(1000 + year) for year in range(1986, 1993)})
+        self.drive.files['Reach_2_river_mask1986.tif'] = b'other reach'
+        self.sync = DriveSync(self.drive.service, self.folder, workers=3, chunk_size=256)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def local(self, name):
+        with open(os.path.join(self.folder, name), 'rb') as file:
+            return file.read()
+
+    def test_listing_follows_every_page(self):
+        items = self.sync.list_files('Reach_1_')
+        self.assertEqual(len(items), 7)
+        self.assertTrue(all('md5Checksum' in item and 'size' in item for item in items))
+
+    def test_sync_downloads_every_file(self):
+        report = self.sync.sync('Reach_1_')
+        self.assertEqual(len(report['downloaded']), 7)
+        self.assertEqual(report['failed'], {})
+        for year in range(1986, 1993):
+            name = f'Reach_1_river_mask{year}.tif'
+            self.assertEqual(self.local(name), self.drive.files[name])
+        self.assertFalse([name for name in os.listdir(self.folder) if name.endswith(PARTIAL_SUFFIX)])
+
+    def test_second_sync_skips_unchanged_files(self):
+        self.sync.sync('Reach_1_')
+        self.drive.ranges.clear()
+        name = 'Reach_1_river_mask1990.tif'
+        self.drive.files[name] = b'changed on drive'
+        report = self.sync.sync('Reach_1_')
+        self.assertEqual(len(report['skipped']), 6)
+        self.assertEqual({file_id for file_id, _ in self.drive.ranges}, {name})
+        self.assertEqual(self.local(name), b'changed on drive')
+
+    def test_partial_download_is_resumed(self):
+        name = 'Reach_1_river_mask1986.tif'
+        with open(os.path.join(self.folder, name + PARTIAL_SUFFIX), 'wb') as file:
+            file.write(self.drive.files[name][:600])
+        self.sync.sync('Reach_1_river_mask1986')
+        self.assertEqual(self.drive.ranges[0], (name, 'bytes=600-855'))
+        self.assertEqual(self.local(name), self.drive.files[name])
+
+    def test_interrupted_download_is_retried(self):
+        name = 'Reach_1_river_mask1987.tif'
+        self.drive.interruptions[name] = 2
+        report = self.sync.sync('Reach_1_river_mask1987')
+        self.assertEqual(report['failed'], {})
+        self.assertEqual(self.local(name), self.drive.files[name])
+
+    def test_stale_partial_file_is_replaced(self):
+        name = 'Reach_1_river_mask1988.tif'
+        with open(os.path.join(self.folder, name + PARTIAL_SUFFIX), 'wb') as file:
+            file.write(b'x' * 500)
+        report = self.sync.sync('Reach_1_river_mask1988')
+        self.assertEqual(report['failed'], {})
+        self.assertEqual(self.local(name), self.drive.files[name])
+
+    def test_failed_download_is_reported(self):
+        name = 'Reach_1_river_mask1989.tif'
+        self.drive.interruptions[name] = 10
+        report = self.sync.sync('Reach_1_')
+        self.assertIn(name, report['failed'])
+        self.assertEqual(len(report['downloaded']), 6)
+
+    def test_duplicate_names_keep_latest_file(self):
+        name = 'Reach_1_river_mask1986.tif'
+        exports = (('old-export', '2023-05-01T10:00:00.000Z'), ('new-export', '2025-05-01T10:00:00.000Z'))
+        for file_id, modified in exports:
+            self.drive.files[file_id] = os.urandom(700)
+            self.drive.names[file_id] = name
+            self.drive.modified[file_id] = modified
+        items = self.sync.list_files('Reach_1_river_mask1986')
+        self.assertEqual([item['id'] for item in items], ['new-export'])
+        report = self.sync.sync('Reach_1_river_mask1986', items=[self.drive.item(file_id) for file_id in
+                                                                 (name, 'old-export', 'new-export')])
+        self.assertEqual(report['downloaded'], [os.path.join(self.folder, name)])
+        self.assertEqual({file_id for file_id, _ in self.drive.ranges}, {'new-export'})
+        self.assertEqual(self.local(name), self.drive.files['new-export'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+"""Tests for the Earth Engine export manager, run against a stand-in ee module."""
+
+import types
+import unittest
+
+from river_change_analysis.exports import ExportManager, COMPLETED, FAILED, PENDING, READY
+
+
+class FakeGeometry:
+    def __init__(self, coordinates):
+        self.coordinates = coordinates
+        self.calls = 0
+
+    def getInfo(self):
+        self.calls += 1
+        return {'type': 'Polygon', 'coordinates': self.coordinates}
+
+
+class FakeTask:
+    def __init__(self, server, kwargs):
+        self.server = server
+        self.kwargs = kwargs
+        self.polls = 0
+
+    def start(self):
+        self.server.started.append(self.kwargs['fileNamePrefix'])
+
+    def status(self):
+        self.polls += 1
+        name = self.kwargs['fileNamePrefix']
+        if self.server.status_errors.get(name, 0) > 0:
+            self.server.status_errors[name] -= 1
+            raise ConnectionError('HTTP 503: Service unavailable')
+        failures = self.server.failures.get(name, 0)
+        if self.polls <= self.server.running_polls:
+            return {'state': 'RUNNING'}
+        if failures > 0:
+            self.server.failures[name] = failures - 1
+            return {'state': 'FAILED', 'error_message': 'Computation timed out.'}
+        return {'state': 'COMPLETED'}
+
+
+class FakeEarthEngine:
+    """Records the exports and plays back the states of the Earth Engine task manager."""
+
+    def __init__(self, failures=None, rejected=0, running_polls=1, status_errors=None):
+        self.started = []
+        self.status_errors = dict(status_errors or {})
+        self.running_polls = running_polls
+        self.submitted = []
+        self.failures = dict(failures or {})
+        self.rejected = rejected
+        self.batch = types.SimpleNamespace(Export=types.SimpleNamespace(image=types.SimpleNamespace(
+            toDrive=self.to_drive)))
+
+    def to_drive(self, **kwargs):
+        if self.rejected > 0:
+            self.rejected -= 1
+            raise RuntimeError('Too many tasks already in the queue.')
+        self.submitted.append(kwargs)
+        return FakeTask(self, kwargs)
+
+
+def manager_for(fake, **kwargs):
+    return ExportManager('masks', poll_interval=0, ee_module=fake, progress=lambda manager, job: None,
+                         sleep=lambda seconds: None, **kwargs)
+
+
+class TestExportManager(unittest.TestCase):
+
+    def test_region_is_resolved_once(self):
+        fake = FakeEarthEngine()
+        roi = FakeGeometry([[0, 0], [1, 0], [1, 1]])
+        manager = manager_for(fake)
+        for year in range(1986, 2022):
+            manager.add('image', f'reach_river_mask{year}', roi)
+        manager.run()
+        self.assertEqual(roi.calls, 1)
+        self.assertEqual(len(fake.submitted), 36)
+        self.assertTrue(all(kwargs['region'] == roi.coordinates for kwargs in fake.submitted))
+
+    def test_every_export_completes(self):
+        fake = FakeEarthEngine()
+        manager = manager_for(fake)
+        for year in range(2000, 2005):
+            manager.add('image', f'reach_river_mask{year}', FakeGeometry([]), folder_name='other')
+        jobs = manager.run()
+        self.assertEqual([job.state for job in jobs], [COMPLETED] * 5)
+        self.assertEqual(fake.submitted[0]['folder'], 'other')
+        self.assertEqual(fake.submitted[0]['fileFormat'], 'GeoTIFF')
+
+    def test_concurrency_limit(self):
+        fake = FakeEarthEngine()
+        active = []
+
+        def progress(manager, job):
+            active.append(sum(1 for other in manager.jobs if other.active))
+
+        manager = ExportManager('masks', max_active=3, poll_interval=0, ee_module=fake, progress=progress,
+                                sleep=lambda seconds: None)
+        roi = FakeGeometry([])
+        for year in range(2000, 2010):
+            manager.add('image', f'mask{year}', roi)
+        manager.run()
+        self.assertLessEqual(max(active), 3)
+        self.assertEqual(manager.counts(), {COMPLETED: 10})
+
+    def test_failed_exports_are_retried(self):
+        fake = FakeEarthEngine(failures={'mask2001': 2})
+        manager = manager_for(fake, retries=3)
+        roi = FakeGeometry([])
+        manager.add('image', 'mask2000', roi)
+        job = manager.add('image', 'mask2001', roi)
+        manager.run()
+        self.assertEqual(job.state, COMPLETED)
+        self.assertEqual(job.attempts, 3)
+        self.assertEqual(fake.started.count('mask2001'), 3)
+
+    def test_exports_fail_after_the_retries(self):
+        fake = FakeEarthEngine(failures={'mask2000': 10})
+        manager = manager_for(fake, retries=1)
+        job = manager.add('image', 'mask2000', FakeGeometry([]))
+        manager.run()
+        self.assertEqual(job.state, FAILED)
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(job.error, 'Computation timed out.')
+
+    def test_rejected_submissions_are_retried(self):
+        fake = FakeEarthEngine(rejected=2)
+        manager = manager_for(fake, retries=2)
+        job = manager.add('image', 'mask2000', FakeGeometry([]))
+        manager.run()
+        self.assertEqual(job.state, COMPLETED)
+        self.assertEqual(job.attempts, 3)
+
+    def test_backoff_between_polls(self):
+        fake = FakeEarthEngine(running_polls=5)
+        delays = []
+        manager = ExportManager('masks', poll_interval=1, max_poll_interval=4, ee_module=fake,
+                                progress=lambda manager, job: None, sleep=delays.append)
+        manager.add('image', 'mask2000', FakeGeometry([]))
+        manager.run()
+        # Quick checks after the submission and the first state change, then doubling
+        self.assertEqual(delays, [1, 1, 2, 4, 4, 4])
+
+    def test_status_errors_do_not_abandon_other_exports(self):
+        fake = FakeEarthEngine(status_errors={'mask2000': 2})
+        manager = manager_for(fake, retries=3)
+        roi = FakeGeometry([])
+        first = manager.add('image', 'mask2000', roi)
+        second = manager.add('image', 'mask2001', roi)
+        manager.run()
+        self.assertEqual((first.state, second.state), (COMPLETED, COMPLETED))
+        # The task is checked again, not exported a second time
+        self.assertEqual(fake.started.count('mask2000'), 1)
+
+    def test_exports_fail_after_repeated_status_errors(self):
+        fake = FakeEarthEngine(status_errors={'mask2000': 10})
+        manager = manager_for(fake, retries=2)
+        roi = FakeGeometry([])
+        failed = manager.add('image', 'mask2000', roi)
+        other = manager.add('image', 'mask2001', roi)
+        manager.run()
+        self.assertEqual(failed.state, FAILED)
+        self.assertIn('503', failed.error)
+        self.assertEqual(other.state, COMPLETED)
+
+    def test_start_submits_without_waiting(self):
+        fake = FakeEarthEngine()
+        manager = manager_for(fake, max_active=2)
+        roi = FakeGeometry([])
+        jobs = [manager.add('image', f'mask{year}', roi) for year in range(2000, 2005)]
+        manager.start()
+        self.assertEqual(fake.started, ['mask2000', 'mask2001'])
+        self.assertTrue(all(job.state == READY and job.task.polls == 0 for job in jobs[:2]))
+        self.assertTrue(all(job.state == PENDING and job.task is None for job in jobs[2:]))
+        # Starting again does not go over the limit while the first exports are active
+        manager.start()
+        self.assertEqual(len(fake.started), 2)
+        manager.run()
+        self.assertEqual(sorted(fake.started), [f'mask{year}' for year in range(2000, 2005)])
+        self.assertTrue(all(job.state == COMPLETED for job in jobs))
+
+
+if __name__ == '__main__':
+    unittest.main()
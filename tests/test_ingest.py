@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+"""Tests for decoding downloaded masks in memory and streaming them into River objects."""
+
+import glob
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+import rasterio
+
+from river_change_analysis.google_drive_extraction import DriveSync
+from river_change_analysis.ingest import decode_mask, stream_from_drive, stream_rivers
+from river_change_analysis.packed import PackedMask
+from river_change_analysis.river import River
+from tests.test_drive_sync import FakeDrive
+
+MASK_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'binary_river_masks')
+YEARS = (1986, 1987, 1988, 1989)
+
+
+def bundled_masks():
+    """The bytes of some bundled masks, by file name."""
+    masks = {}
+    for year in YEARS:
+        file_path, = glob.glob(os.path.join(MASK_FOLDER, 'Athabasca_Reach_1', f'*_river_mask{year}.tif'))
+        with open(file_path, 'rb') as file:
+            masks[os.path.basename(file_path)] = file.read()
+    return masks
+
+
+def read_mask(name):
+    file_path = os.path.join(MASK_FOLDER, 'Athabasca_Reach_1', name)
+    with rasterio.open(file_path) as dataset:
+        return dataset.read(1), dataset.transform, dataset.crs
+
+
+class TestDecodeMask(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.masks = bundled_masks()
+        cls.name = sorted(cls.masks)[0]
+        cls.expected, cls.transform, cls.crs = read_mask(cls.name)
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_in_memory(self):
+        river = decode_mask(self.masks[self.name], self.name)
+        self.assertIsNone(river.file_path)
+        self.assertEqual(river.file_name, self.name)
+        self.assertEqual(river.year, '1986')
+        self.assertEqual(river.transform, self.transform)
+        self.assertEqual(river.crs, self.crs)
+        # Without a file, the mask is kept with the River object
+        self.assertIn('mask', river._pinned)
+        np.testing.assert_array_equal(river.mask, self.expected)
+
+    def test_write_through(self):
+        river = decode_mask(self.masks[self.name], self.name, write_through=self.folder, packed=True)
+        self.assertEqual(os.listdir(self.folder), [self.name])
+        with open(river.file_path, 'rb') as file:
+            self.assertEqual(file.read(), self.masks[self.name])
+        self.assertEqual(river._sources['mask'], ('load_mask', (True,)))
+        self.assertIsInstance(river.mask, PackedMask)
+        np.testing.assert_array_equal(np.asarray(river.mask), self.expected)
+        # An evicted mask is reloaded from the saved file
+        River.cache.discard_owner(river._id)
+        self.assertIsInstance(river.mask, PackedMask)
+        np.testing.assert_array_equal(np.asarray(river.mask), self.expected)
+
+
+class TestStreamRivers(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.masks = bundled_masks()
+
+    def test_every_mask_is_yielded_and_processed(self):
+        lock = threading.Lock()
+        in_flight = [0, 0]
+        processed = []
+
+        def fetch(item):
+            with lock:
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight[1], in_flight[0])
+            return self.masks[item['name']]
+
+        def process(river):
+            river.watermask = np.asarray(river.mask) > 0
+            with lock:
+                processed.append(threading.current_thread())
+                in_flight[0] -= 1
+
+        items = [{'name': name} for name in self.masks]
+        rivers = list(stream_rivers(items, fetch, process=process, workers=2))
+        self.assertEqual(sorted(river.year for river in rivers), [str(year) for year in YEARS])
+        self.assertTrue(all(river.watermask is not None for river in rivers))
+        # Processing runs in the worker threads, never more than twice as many as workers at once
+        self.assertNotIn(threading.current_thread(), processed)
+        self.assertLessEqual(in_flight[1], 4)
+        for river in rivers:
+            np.testing.assert_array_equal(river.mask, read_mask(river.file_name)[0])
+
+    def test_custom_names(self):
+        names = sorted(self.masks)
+        rivers = list(stream_rivers(range(len(names)), lambda i: self.masks[names[i]], name=names.__getitem__,
+                                    workers=1))
+        self.assertEqual([river.file_name for river in rivers], names)
+
+    def test_errors_are_raised(self):
+        def fetch(item):
+            raise ConnectionError('Connection reset by peer')
+        with self.assertRaises(ConnectionError):
+            list(stream_rivers([{'name': 'Reach_1_river_mask2000.tif'}], fetch))
+
+
+class TestStreamFromDrive(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.drive = FakeDrive(bundled_masks(), page_size=3)
+        self.sync = DriveSync(self.drive.service, self.folder, workers=2, chunk_size=1 << 16)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_in_memory(self):
+        rivers = list(stream_from_drive(self.sync, 'river_mask'))
+        self.assertEqual(len(rivers), len(YEARS))
+        self.assertEqual(os.listdir(self.folder), [])
+        for river in rivers:
+            np.testing.assert_array_equal(river.mask, read_mask(river.file_name)[0])
+
+    def test_write_through_skips_current_files(self):
+        first = {river.file_name: np.array(river.mask)
+                 for river in stream_from_drive(self.sync, 'river_mask', write_through=True)}
+        self.assertEqual(sorted(os.listdir(self.folder)), sorted(self.drive.files))
+        self.drive.ranges.clear()
+        second = list(stream_from_drive(self.sync, 'river_mask', write_through=True))
+        # Every mask is already saved and unchanged, so nothing is downloaded again
+        self.assertEqual(self.drive.ranges, [])
+        for river in second:
+            np.testing.assert_array_equal(river.mask, first[river.file_name])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+"""Tests for the opt-in timing and memory instrumentation of the workflow stages."""
+
+import threading
+import tracemalloc
+import unittest
+
+import numpy as np
+
+from river_change_analysis import instrument
+from river_change_analysis.instrument import stage
+from river_change_analysis.river import River
+
+
+class FakeRiver:
+    def __init__(self, year=None, file_path='Reach_1_river_mask1986.tif'):
+        self.year = year
+        self.file_path = file_path
+
+
+class TestInstrument(unittest.TestCase):
+
+    def setUp(self):
+        self.received = []
+        instrument.clear()
+
+    def tearDown(self):
+        instrument.disable()
+        instrument.clear()
+        if self.received.append in instrument._callbacks:
+            instrument.remove_callback(self.received.append)
+
+    def test_disabled_stages_do_nothing(self):
+        instrument.add_callback(self.received.append)
+        self.assertFalse(instrument.is_enabled())
+        with stage('close_mask', FakeRiver('1986')) as record:
+            record.array('closed', np.zeros(10))
+        # Every disabled stage shares the same no-op context manager
+        self.assertIs(stage('other'), stage('close_mask'))
+        self.assertEqual(instrument.records(), [])
+        self.assertEqual(self.received, [])
+
+    def test_nested_stages_inherit_the_river(self):
+        instrument.enable()
+        river = FakeRiver('1986')
+        with stage('process_centerline', river) as outer:
+            with stage('thin') as inner:
+                inner.array('centerline', np.zeros((10, 10), dtype=bool))
+            with stage('prune', year='2001'):
+                pass
+        thin, prune, process = instrument.records()
+        self.assertIs(process, outer)
+        self.assertEqual([record.stage for record in (thin, prune, process)], ['thin', 'prune', 'process_centerline'])
+        self.assertEqual((thin.parent, thin.year, thin.file_path), ('process_centerline', '1986', river.file_path))
+        self.assertEqual(prune.year, '2001')
+        self.assertIsNone(process.parent)
+        self.assertEqual(thin.arrays, {'centerline': 100})
+        self.assertGreaterEqual(process.wall_seconds, thin.wall_seconds + prune.wall_seconds)
+        self.assertIsNone(process.peak_bytes)
+
+    def test_year_known_after_the_stage(self):
+        instrument.enable()
+        river = FakeRiver()
+        with stage('load_mask', river):
+            river.year = '1987'
+        self.assertEqual(instrument.records('load_mask')[0].year, '1987')
+
+    def test_errors_are_recorded(self):
+        instrument.enable()
+        with self.assertRaises(ValueError):
+            with stage('load_mask', FakeRiver('1986')):
+                raise ValueError('bad mask')
+        record, = instrument.records()
+        self.assertEqual(record.error, 'ValueError')
+        self.assertEqual(record.to_dict()['error'], 'ValueError')
+        # The stage stack is left empty for the next stage
+        with stage('close_mask'):
+            pass
+        self.assertIsNone(instrument.records('close_mask')[0].parent)
+
+    def test_callbacks(self):
+        instrument.enable(keep_records=False, callback=self.received.append)
+        with stage('close_mask', FakeRiver('1986')):
+            pass
+        self.assertEqual([record.stage for record in self.received], ['close_mask'])
+        self.assertEqual(instrument.records(), [])
+        instrument.remove_callback(self.received.append)
+        with stage('close_mask'):
+            pass
+        self.assertEqual(len(self.received), 1)
+
+    def test_records_filter(self):
+        instrument.enable()
+        for year in ('1986', '1987'):
+            for name in ('close_mask', 'thin'):
+                with stage(name, year=year):
+                    pass
+        self.assertEqual(len(instrument.records()), 4)
+        self.assertEqual([record.year for record in instrument.records('thin')], ['1986', '1987'])
+        self.assertEqual([record.stage for record in instrument.records(year=1987)], ['close_mask', 'thin'])
+        instrument.clear()
+        self.assertEqual(instrument.records(), [])
+
+    def test_threads_have_their_own_stages(self):
+        instrument.enable()
+        with stage('outer', FakeRiver('1986')):
+            worker = threading.Thread(target=self._run_stage, args=('in_thread',))
+            worker.start()
+            worker.join()
+        record, = instrument.records('in_thread')
+        self.assertIsNone(record.parent)
+        self.assertIsNone(record.year)
+
+    def _run_stage(self, name):
+        with stage(name):
+            pass
+
+    def test_memory(self):
+        was_tracing = tracemalloc.is_tracing()
+        instrument.enable(memory=True)
+        with stage('outer'):
+            with stage('allocate'):
+                block = np.ones(4 * 1024 * 1024, dtype=np.uint8)
+                del block
+        allocate, outer = instrument.records()
+        self.assertGreaterEqual(allocate.peak_bytes, 4 * 1024 * 1024)
+        self.assertGreaterEqual(outer.peak_bytes, allocate.peak_bytes)
+        instrument.disable()
+        # Tracing is only stopped if enable started it
+        self.assertEqual(tracemalloc.is_tracing(), was_tracing)
+
+    def test_river_stages(self):
+        instrument.enable()
+        river = River(None)
+        mask = np.zeros((30, 30), dtype=np.uint8)
+        mask[10:20] = 1
+        river.mask = mask
+        river.year = '1990'
+        River.water_mask_process(river, 10)
+        record, = instrument.records('water_mask_process')
+        self.assertEqual(record.year, '1990')
+        self.assertEqual(record.arrays, {'watermask': river.watermask.nbytes})
+
+
+if __name__ == '__main__':
+    unittest.main()
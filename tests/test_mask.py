@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""Tests for mask file name parsing and the indexed mask catalog."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import rasterio
+from rasterio.transform import Affine
+
+from river_change_analysis.mask import (CATALOG_FILE_NAME, MaskCatalog, is_derived, mask_import, mask_year,
+                                        parse_mask_name)
+
+
+def write_mask(file_path, shape=(20, 30), origin=(-113.0, 57.0), count=1):
+    transform = Affine(0.00027, 0, origin[0], 0, -0.00027, origin[1])
+    with rasterio.open(file_path, 'w', driver='GTiff', height=shape[0], width=shape[1], count=count, dtype='uint8',
+                       crs='EPSG:4326', transform=transform) as dataset:
+        dataset.write(np.ones((count,) + shape, dtype=np.uint8))
+
+
+class TestParseMaskName(unittest.TestCase):
+
+    def test_names(self):
+        cases = {
+            'Athabasca_River_Reach_1_river_mask1986.tif': ('Athabasca_River_Reach_1', 1986),
+            '/data/Reach_2_river_mask_2001-0000000000-0000000000.tif': ('Reach_2', 2001),
+            'Reach-3 mask 2019.tiff': ('Reach-3', 2019),
+            'Peace_2000_river_mask2015.tif': ('Peace_2000', 2015),
+        }
+        for name, expected in cases.items():
+            self.assertEqual(parse_mask_name(name), expected)
+
+    def test_no_year(self):
+        self.assertIsNone(parse_mask_name('Reach_1_river_mask.tif'))
+        self.assertIsNone(parse_mask_name('Reach_1_river_mask12345.tif'))
+
+    def test_mask_year(self):
+        self.assertEqual(mask_year('Reach_1_river_mask_1999-0000000000-0000000000.tif'), '1999')
+        # Names without a year keep the old fixed position parsing
+        self.assertEqual(mask_year('mask_abcd.tif'), 'abcd')
+
+
+class TestMaskCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.folder, 'reach_2'))
+        for year in (2002, 2000, 2001):
+            write_mask(os.path.join(self.folder, f'Reach_1_river_mask{year}.tif'))
+        for year in (2000, 2001):
+            write_mask(os.path.join(self.folder, 'reach_2', f'Reach_2_river_mask_{year}-0000000000-0000000000.tif'))
+        write_mask(os.path.join(self.folder, 'notes.tif'))
+        # Outputs of the package next to the masks
+        write_mask(os.path.join(self.folder, 'Reach_1_river_mask2001_change.tif'))
+        write_mask(os.path.join(self.folder, 'Reach_1_river_mask2002_slope.tif'))
+        write_mask(os.path.join(self.folder, 'Reach_1_river_masks2000_2002.tif'), count=3)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_scan(self):
+        catalog = MaskCatalog.scan(self.folder)
+        self.assertEqual(len(catalog), 5)
+        self.assertEqual(catalog.reaches(), ['Reach_1', 'Reach_2'])
+        self.assertEqual(catalog.years('Reach_1'), [2000, 2001, 2002])
+        self.assertEqual(catalog.select('Reach_1', 2001)[0]['width'], 30)
+        self.assertEqual(catalog.paths('Reach_1'), mask_import(self.folder, 'Reach_1_river_mask2'))
+        self.assertEqual([river.year for river in catalog.rivers('Reach_2')], ['2000', '2001'])
+        catalog.validate('Reach_1')
+
+    def test_derived_rasters_are_skipped(self):
+        catalog = MaskCatalog.scan(self.folder)
+        names = [os.path.basename(path) for path in catalog.paths('Reach_1')]
+        self.assertEqual(names, [f'Reach_1_river_mask{year}.tif' for year in (2000, 2001, 2002)])
+        catalog.validate('Reach_1')
+        self.assertTrue(is_derived('Athabasca_River_Reach_1_river_mask1987_change.tif'))
+        self.assertFalse(is_derived('Athabasca_River_Reach_1_river_mask1987.tif'))
+
+    def test_index_is_reused(self):
+        MaskCatalog.scan(self.folder)
+        self.assertTrue(os.path.exists(os.path.join(self.folder, CATALOG_FILE_NAME)))
+        header = MaskCatalog._read_header
+        MaskCatalog._read_header = staticmethod(lambda file_path: self.fail(f"{file_path} was read again"))
+        try:
+            catalog = MaskCatalog.scan(self.folder)
+        finally:
+            MaskCatalog._read_header = header
+        self.assertEqual(catalog.years('Reach_2'), [2000, 2001])
+
+    def test_changed_file_is_read_again(self):
+        MaskCatalog.scan(self.folder)
+        write_mask(os.path.join(self.folder, 'Reach_1_river_mask2001.tif'), shape=(21, 30))
+        self.assertEqual(MaskCatalog.scan(self.folder).select('Reach_1', 2001, 2001)[0]['height'], 21)
+
+    def test_validate(self):
+        write_mask(os.path.join(self.folder, 'Reach_1_river_mask2003.tif'), origin=(-112.0, 57.0))
+        with self.assertRaises(ValueError):
+            MaskCatalog.scan(self.folder).validate('Reach_1')
+        with self.assertRaises(ValueError):
+            MaskCatalog.scan(self.folder).validate('Reach_3')
+
+
+if __name__ == '__main__':
+    unittest.main()
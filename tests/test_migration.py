@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""Tests for the centerline migration measured with distance transforms."""
+
+import glob
+import os
+import unittest
+
+import numpy as np
+
+from river_change_analysis.migration import centerline_migration
+from river_change_analysis.river import River
+
+MASK_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'binary_river_masks')
+
+
+def processed_rivers(reach, years):
+    rivers = []
+    for year in years:
+        river = River(glob.glob(os.path.join(MASK_FOLDER, f'Athabasca_Reach_{reach}', f'*_river_mask{year}.tif'))[0])
+        river.load_mask()
+        rivers.append(river)
+    River.process_centerline(rivers, None)
+    return rivers
+
+
+def nearest_distances(earlier, later, sampling):
+    """Reference: distance from every later centerline pixel to every earlier one, keeping the nearest."""
+    earlier_rows, earlier_cols = np.nonzero(earlier)
+    later_rows, later_cols = np.nonzero(later)
+    dy = (later_rows[:, None] - earlier_rows[None, :]) * sampling[0]
+    dx = (later_cols[:, None] - earlier_cols[None, :]) * sampling[1]
+    return np.hypot(dy, dx).min(axis=1)
+
+
+class TestCenterlineMigration(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.rivers = processed_rivers(1, (1986, 1988, 1987, 1990))
+        cls.by_year = {int(river.year): river for river in cls.rivers}
+
+    def assert_matches_reference(self, migration):
+        for i, (earlier, later) in enumerate(migration['years']):
+            earlier, later = self.by_year[earlier], self.by_year[later]
+            centerline = np.asarray(later.centerline)
+            np.testing.assert_array_equal(migration['pixels'][i], np.flatnonzero(centerline))
+            expected = nearest_distances(np.asarray(earlier.centerline), centerline,
+                                         earlier.pixel_sampling(centerline.shape))
+            np.testing.assert_allclose(migration['distances'][i], expected, rtol=1e-5)
+            self.assertAlmostEqual(migration['mean'][i], expected.mean(), delta=1e-5 * expected.mean())
+            self.assertAlmostEqual(migration['max'][i], expected.max(), delta=1e-5 * expected.max())
+
+    def test_consecutive_pairs_match_reference(self):
+        migration = centerline_migration(self.rivers, workers=1)
+        np.testing.assert_array_equal(migration['years'], [[1986, 1987], [1987, 1988], [1988, 1990]])
+        self.assert_matches_reference(migration)
+        means = [distances.mean() for distances in migration['distances']]
+        np.testing.assert_allclose(migration['mean'], means, rtol=1e-6)
+        np.testing.assert_allclose(migration['rate'], np.array(means) / [1, 1, 2], rtol=1e-6)
+        np.testing.assert_array_equal(migration['count'], [len(values) for values in migration['distances']])
+
+    def test_chosen_pairs_match_reference(self):
+        migration = centerline_migration(self.rivers, pairs=[(1986, 1990), (1986, 1988), (1987, 1990)], workers=1)
+        np.testing.assert_array_equal(migration['years'], [[1986, 1990], [1986, 1988], [1987, 1990]])
+        self.assert_matches_reference(migration)
+
+    def test_workers_match_single_process(self):
+        single = centerline_migration(self.rivers, workers=1)
+        pooled = centerline_migration(self.rivers, workers=2)
+        for key in ('count', 'mean', 'median', 'p90', 'max', 'rate'):
+            np.testing.assert_array_equal(pooled[key], single[key])
+        for pooled_distances, single_distances in zip(pooled['distances'], single['distances']):
+            np.testing.assert_array_equal(pooled_distances, single_distances)
+
+    def test_maps(self):
+        migration = centerline_migration(self.rivers, workers=1, maps=True)
+        for raster, distances, pixels in zip(migration['maps'], migration['distances'], migration['pixels']):
+            np.testing.assert_array_equal(raster.ravel()[pixels], distances)
+            self.assertEqual(np.count_nonzero(~np.isnan(raster)), len(pixels))
+
+    def test_quantify_migration_sets_mean(self):
+        rivers = processed_rivers(2, (2000, 2001))
+        migration = River.quantify_migration(rivers, workers=1)
+        self.assertEqual(rivers[1].migration, float(migration['mean'][0]))
+        self.assertIsNone(rivers[0].migration)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""Tests for the composited rendering of River plots."""
+
+import os
+import shutil
+import tempfile
+import types
+import unittest
+
+import numpy as np
+
+import matplotlib.pyplot as plt
+
+from river_change_analysis.render import composite_layers, line_width_for, render_centerline, suffixed_path
+from river_change_analysis.river import River
+
+
+def blend_each_layer(layers, colors, alpha, background):
+    """Reference: draw every layer on its own over an opaque background, like one imshow per layer."""
+    image = np.broadcast_to(np.asarray(background, dtype=np.float64), layers[0].shape + (3,)).copy()
+    for layer, color in zip(layers, colors):
+        opacity = color[3] * alpha
+        image[layer] = color[:3] * opacity + image[layer] * (1 - opacity)
+    return image
+
+
+def over_background(image, background):
+    """Draw a straight alpha RGBA image over an opaque background, as imshow does."""
+    alpha = image[..., 3:]
+    return image[..., :3] * alpha + np.asarray(background) * (1 - alpha)
+
+
+class TestComposite(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.layers = [rng.random((40, 60)) < 0.4 for _ in range(4)]
+        self.colors = np.array([[1, 0, 0, 1], [0, 1, 0, 0.5], [0, 0, 1, 0.8], [1, 1, 0, 0.3]])
+
+    def test_matches_drawing_each_layer(self):
+        for alpha in (1.0, 0.9, 0.6):
+            for background in ((0, 0, 0), (1, 1, 1), (0.2, 0.5, 0.7)):
+                image = composite_layers(self.layers, self.colors, alpha=alpha)
+                np.testing.assert_allclose(over_background(image, background),
+                                           blend_each_layer(self.layers, self.colors, alpha, background), atol=1e-5)
+
+    def test_opaque_layer_keeps_its_color(self):
+        image = composite_layers([self.layers[0]], [self.colors[0]], alpha=1.0)
+        np.testing.assert_array_equal(image[self.layers[0]], np.tile([1, 0, 0, 1], (self.layers[0].sum(), 1)))
+        self.assertEqual(image[~self.layers[0]].max(), 0)
+
+
+class TestLineWidth(unittest.TestCase):
+
+    def test_small_raster_keeps_one_pixel(self):
+        self.assertEqual(line_width_for((500, 800), (15, 10), 100), 1)
+
+    def test_large_raster_is_widened(self):
+        self.assertGreaterEqual(line_width_for((6000, 12000), (15, 10), 100), 11)
+
+    def test_default_width_keeps_centerline_visible(self):
+        folder = tempfile.mkdtemp()
+        try:
+            centerline = np.zeros((3000, 4500), dtype=bool)
+            centerline[1500, :] = True
+            rivers = [types.SimpleNamespace(centerline=centerline, year=str(year)) for year in (2000, 2001)]
+            image = render_centerline(rivers, os.path.join(folder, 'centerline.png'), step=1)
+            width = line_width_for(centerline.shape, (15, 10), 100)
+            self.assertEqual(int((image[:, 2000, 3] > 0).sum()), width)
+        finally:
+            shutil.rmtree(folder)
+
+
+class TestSavedPlots(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        self.rivers = []
+        for year in (2000, 2001, 2002):
+            river = River(None)
+            river.mask = (rng.random((60, 90)) < 0.3).astype(np.uint8)
+            river.year = str(year)
+            river.erosion, river.accretion = rng.random(2)
+            self.rivers.append(river)
+        self.dem, self.slope = River.DEM, River.SLOPE
+        River.DEM = rng.random((60, 90)) * 100
+        River.SLOPE = rng.random((60, 90)) * 10
+
+    def tearDown(self):
+        River.DEM, River.SLOPE = self.dem, self.slope
+        shutil.rmtree(self.folder)
+
+    def assert_saved(self, *file_paths):
+        for file_path in file_paths:
+            image = plt.imread(file_path)
+            # Figures are saved at 100 dpi, never the 15000 pixel wide figures of before
+            self.assertLess(image.shape[1], 2500)
+        self.assertEqual(plt.get_fignums(), [])
+
+    def test_plot_dem(self):
+        file_path = os.path.join(self.folder, 'dem.png')
+        River.plot_dem(file_path)
+        self.assert_saved(file_path, suffixed_path(file_path, '_slope'))
+
+    def test_plot_erosion(self):
+        file_path = os.path.join(self.folder, 'erosion.png')
+        River.plot_erosion(self.rivers, file_path)
+        self.assert_saved(file_path, suffixed_path(file_path, '_accretion'), suffixed_path(file_path, '_dem'))
+
+    def test_plot_river_migration(self):
+        file_path = os.path.join(self.folder, 'migration.png')
+        self.rivers[1].plot_river_migration(self.rivers[0], file_path)
+        self.assert_saved(file_path)
+
+    def test_plot_discharge_erosion(self):
+        file_path = os.path.join(self.folder, 'discharge.png')
+        River.plot_discharge_erosion(self.rivers, [100, 200, 150], file_path)
+        self.assert_saved(file_path)
+
+    def test_suffixed_path(self):
+        self.assertEqual(suffixed_path('/out/Reach_1.png', '_filled'), '/out/Reach_1_filled.png')
+        self.assertIsNone(suffixed_path(None, '_filled'))
+
+
+if __name__ == '__main__':
+    unittest.main()
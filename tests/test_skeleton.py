@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""Tests for the graph representation of centerline skeletons."""
+
+import glob
+import os
+import unittest
+
+import numpy as np
+from skimage.morphology import thin
+
+from river_change_analysis.river import River, fill_water_mask, WATER_MASK_MIN_SIZE
+from river_change_analysis.skeleton import END, JUNCTION, SkeletonGraph
+
+MASK_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'binary_river_masks')
+
+
+def tee(spur_length, shape=(30, 60), row=15, col=30):
+    """A horizontal channel across the raster with a vertical spur below it."""
+    skeleton = np.zeros(shape, dtype=bool)
+    skeleton[row, 2:shape[1] - 2] = True
+    skeleton[row + 1:row + 1 + spur_length, col] = True
+    return skeleton
+
+
+class TestSkeletonGraph(unittest.TestCase):
+
+    def test_round_trip(self):
+        rng = np.random.default_rng(0)
+        skeletons = [thin(rng.random((80, 100)) < 0.5) for _ in range(3)]
+        file_path = glob.glob(os.path.join(MASK_FOLDER, 'Athabasca_Reach_1', '*_river_mask1986.tif'))[0]
+        skeletons.append(thin(fill_water_mask(np.asarray(River(file_path).mask), WATER_MASK_MIN_SIZE)))
+        for skeleton in skeletons:
+            graph = SkeletonGraph.from_raster(skeleton)
+            np.testing.assert_array_equal(graph.to_raster(), skeleton)
+            for edge in graph.edges:
+                # Every edge is a chain of touching pixels
+                self.assertTrue(np.all(np.abs(np.diff(edge.pixels, axis=0)).max(axis=1) == 1))
+
+    def test_tee(self):
+        graph = SkeletonGraph.from_raster(tee(8))
+        self.assertEqual(sorted(graph.node_kinds), [END, END, END, JUNCTION])
+        self.assertEqual(len(graph.edges), 3)
+        # The four pixels around the junction form its node, and edges start at its edge
+        self.assertEqual(max(len(pixels) for pixels in graph.node_pixels), 4)
+        self.assertEqual(sorted(edge.length for edge in graph.edges), [7, 26, 27])
+        self.assertAlmostEqual(graph.length(), 60)
+
+    def test_main_channel(self):
+        skeleton = tee(8)
+        graph = SkeletonGraph.from_raster(skeleton)
+        main = graph.main_channel()
+        self.assertAlmostEqual(graph.length(main), 53)
+        expected = np.zeros_like(skeleton)
+        expected[15, 2:58] = True
+        # Only the edges are drawn, without the node pixels between them
+        expected[15, 30] = False
+        np.testing.assert_array_equal(graph.to_raster(main), expected)
+        self.assertEqual(len(graph.side_channels()), 1)
+
+    def test_prune_short_spur(self):
+        for spur_length, pruned in ((8, True), (12, False)):
+            skeleton = tee(spur_length)
+            graph = SkeletonGraph.from_raster(skeleton).prune(10)
+            expected = skeleton.copy()
+            if pruned:
+                expected[17:, :] = False
+            np.testing.assert_array_equal(graph.to_raster(), expected)
+
+    def test_prune_repeats_until_no_short_branch(self):
+        # A short stem ending in a fork of two short spurs
+        skeleton = tee(5)
+        skeleton[21, 24:37] = True
+        graph = SkeletonGraph.from_raster(skeleton).prune(8)
+        expected = np.zeros_like(skeleton)
+        expected[15, 2:58] = True
+        expected[16, 30] = True
+        np.testing.assert_array_equal(graph.to_raster(), expected)
+        self.assertEqual(len(graph.edges), 2)
+
+    def test_branch_through_two_edge_node(self):
+        # A corner of three pixels is a node joining only two edges, which does not split the branch
+        skeleton = tee(6)
+        skeleton[21, 30:40] = True
+        skeleton[22, 31] = True
+        graph = SkeletonGraph.from_raster(skeleton)
+        self.assertEqual(sorted(graph.degree), [1, 1, 1, 2, 3])
+        branch, = [(edges, length) for edges, _, length in graph.terminal_branches() if len(edges) == 2]
+        self.assertEqual(branch[1], 11)
+        # Each edge of the branch is shorter than min_length, the branch is not
+        np.testing.assert_array_equal(graph.prune(10).to_raster(), graph.to_raster())
+
+    def test_loops(self):
+        ring = np.zeros((20, 20), dtype=bool)
+        ring[5, 5:15] = ring[14, 5:15] = ring[5:15, 5] = ring[5:15, 14] = True
+        ring = thin(ring)
+        graph = SkeletonGraph.from_raster(ring)
+        self.assertEqual(len(graph.node_pixels), 1)
+        self.assertEqual(len(graph.edges), 1)
+        self.assertEqual(graph.edges[0].start, graph.edges[0].end)
+        np.testing.assert_array_equal(graph.to_raster(), ring)
+        # A loop has no end point, so pruning keeps it
+        np.testing.assert_array_equal(graph.prune(100).to_raster(), ring)
+
+    def test_channel_around_an_island(self):
+        skeleton = np.zeros((30, 60), dtype=bool)
+        skeleton[15, 2:20] = skeleton[15, 40:58] = True
+        skeleton[8, 20:41] = skeleton[22, 20:41] = True
+        skeleton[8:23, 20] = skeleton[8:23, 40] = True
+        skeleton = thin(skeleton)
+        graph = SkeletonGraph.from_raster(skeleton)
+        main = graph.main_channel()
+        self.assertEqual(len(graph.side_channels()), len(graph.edges) - len(main))
+        raster = graph.to_raster(main)
+        self.assertTrue(raster[15, 2] and raster[15, 57])
+        # Only one side of the island is on the main channel
+        self.assertNotEqual(raster[8, 30], raster[22, 30])
+        np.testing.assert_array_equal(graph.prune(10).to_raster(), skeleton)
+
+
+if __name__ == '__main__':
+    unittest.main()
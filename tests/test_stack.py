@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""Tests for loading multi-band mask files into a RiverStack."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import rasterio
+from rasterio.transform import Affine
+
+from river_change_analysis.stack import RiverStack, load_multiband
+
+# Bands in the order of the export, not sorted by year
+BAND_YEARS = (1988, 1986, 1987)
+
+
+def write_multiband(file_path, descriptions, shape=(20, 30)):
+    """Write a mask per band whose pixels are all ones in a column set by the band index."""
+    cube = np.zeros((len(descriptions),) + shape, dtype=np.uint8)
+    for band in range(len(descriptions)):
+        cube[band, :, band] = 1
+    transform = Affine(30, 0, 500000, 0, -30, 6000000)
+    with rasterio.open(file_path, 'w', driver='GTiff', height=shape[0], width=shape[1], count=len(descriptions),
+                       dtype='uint8', crs='EPSG:32612', transform=transform) as dataset:
+        dataset.write(cube)
+        for band, description in enumerate(descriptions, start=1):
+            if description is not None:
+                dataset.set_band_description(band, description)
+    return cube
+
+
+class TestLoadMultiband(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.folder, 'Reach_1_river_masks1986_1988.tif')
+        self.cube = write_multiband(self.file_path, [f'river_mask_{year}' for year in BAND_YEARS])
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_bands_are_sorted_by_year(self):
+        rivers = load_multiband(self.file_path)
+        self.assertEqual([river.year for river in rivers], ['1986', '1987', '1988'])
+        for river in rivers:
+            band = BAND_YEARS.index(int(river.year))
+            np.testing.assert_array_equal(river.mask, self.cube[band])
+            self.assertEqual(river.file_path, self.file_path)
+
+    def test_stack(self):
+        river_stack = load_multiband(self.file_path, stack=True)
+        self.assertIsInstance(river_stack, RiverStack)
+        np.testing.assert_array_equal(river_stack.years, [1986, 1987, 1988])
+        np.testing.assert_array_equal(river_stack.cube, self.cube[[1, 2, 0]])
+        self.assertEqual(river_stack.index(1987), 1)
+        # Every year has its water in another column, so 20 pixels are lost and 20 gained
+        erosion, accretion = river_stack.quantify_erosion(pixel_size=1000)
+        np.testing.assert_array_equal(erosion, [20, 20])
+        np.testing.assert_array_equal(accretion, [20, 20])
+
+    def test_years_given(self):
+        rivers = load_multiband(self.file_path, years=[2003, 2001, 2002])
+        self.assertEqual([river.year for river in rivers], ['2001', '2002', '2003'])
+        np.testing.assert_array_equal(rivers[0].mask, self.cube[1])
+        with self.assertRaises(ValueError):
+            load_multiband(self.file_path, years=[2001, 2002])
+
+    def test_memmap(self):
+        memmap_path = os.path.join(self.folder, 'cube.npy')
+        RiverStack.from_multiband(self.file_path, memmap_path=memmap_path)
+        river_stack = RiverStack.open(memmap_path)
+        np.testing.assert_array_equal(river_stack.years, [1986, 1987, 1988])
+        np.testing.assert_array_equal(river_stack.cube, self.cube[[1, 2, 0]])
+
+    def test_missing_description(self):
+        write_multiband(self.file_path, ['river_mask_1986', None])
+        with self.assertRaises(ValueError):
+            load_multiband(self.file_path)
+        self.assertEqual([river.year for river in load_multiband(self.file_path, years=[1990, 1991])],
+                         ['1990', '1991'])
+
+    def test_duplicate_years(self):
+        write_multiband(self.file_path, ['river_mask_1986', 'river_mask_1986'])
+        with self.assertRaises(ValueError):
+            load_multiband(self.file_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+"""Tests for the streamed, packed and stacked erosion counts."""
+
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import rasterio
+
+from river_change_analysis.river import River
+from river_change_analysis.stack import RiverStack
+from river_change_analysis.streaming import stream_erosion
+
+MASK_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'binary_river_masks')
+
+
+def bundled_files(reach, first_year, last_year):
+    files = sorted(glob.glob(os.path.join(MASK_FOLDER, f'Athabasca_Reach_{reach}', '*_river_mask*.tif')))
+    return [path for path in files if first_year <= int(path[-8:-4]) <= last_year]
+
+
+def reference_erosion(files):
+    rivers = [River(path) for path in files]
+    River.quantify_erosion(rivers)
+    return (np.array([river.erosion for river in rivers[1:]]), np.array([river.accretion for river in rivers[1:]]))
+
+
+class TestStreamErosion(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.files = bundled_files(1, 1986, 1991)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_matches_quantify_erosion(self):
+        erosion, accretion = reference_erosion(self.files)
+        streamed = stream_erosion([River(path) for path in self.files])
+        np.testing.assert_array_equal(streamed[0], erosion)
+        np.testing.assert_array_equal(streamed[1], accretion)
+
+    def test_reads_one_block_at_a_time(self):
+        reads = []
+        open_dataset = rasterio.open
+
+        class RecordingDataset:
+            def __init__(self, dataset):
+                self.dataset = dataset
+
+            def __getattr__(self, name):
+                return getattr(self.dataset, name)
+
+            def __enter__(self):
+                self.dataset.__enter__()
+                return self
+
+            def __exit__(self, *args):
+                return self.dataset.__exit__(*args)
+
+            def read(self, *args, **kwargs):
+                array = self.dataset.read(*args, **kwargs)
+                reads.append((self.dataset.name, kwargs['window'].row_off, kwargs['window'].col_off, array.shape))
+                return array
+
+        with mock.patch('river_change_analysis.streaming.rasterio.open',
+                        lambda *args, **kwargs: RecordingDataset(open_dataset(*args, **kwargs))):
+            stream_erosion([River(path) for path in self.files])
+        with rasterio.open(self.files[0]) as dataset:
+            block_height, block_width = dataset.block_shapes[0]
+            n_blocks = len(list(dataset.block_windows(1)))
+        self.assertGreater(n_blocks, 1)
+        self.assertLessEqual(max(rows * cols for _, _, _, (rows, cols) in reads), block_height * block_width)
+        # Every block of every file is read exactly once
+        self.assertEqual(len(reads), n_blocks * len(self.files))
+        self.assertEqual(len(set((name, row, col) for name, row, col, _ in reads)), len(reads))
+
+    def test_sets_river_attributes(self):
+        erosion, accretion = reference_erosion(self.files)
+        rivers = [River(path) for path in self.files]
+        stream_erosion(rivers)
+        self.assertEqual([river.year for river in rivers], [path[-8:-4] for path in self.files])
+        self.assertEqual([river.erosion for river in rivers[1:]], list(erosion))
+        self.assertEqual([river.accretion for river in rivers[1:]], list(accretion))
+
+    def test_mixed_block_layouts(self):
+        # Rewrite every other year in strips of 48 rows, a height unrelated to the 256 row tiles
+        files = []
+        for i, path in enumerate(self.files):
+            if i % 2:
+                with rasterio.open(path) as dataset:
+                    profile = dataset.profile
+                    mask = dataset.read(1)
+                profile.update(tiled=False, blockysize=48)
+                profile.pop('blockxsize', None)
+                path = os.path.join(self.folder, os.path.basename(path))
+                with rasterio.open(path, 'w', **profile) as dataset:
+                    dataset.write(mask, 1)
+            files.append(path)
+        erosion, accretion = reference_erosion(self.files)
+        streamed = stream_erosion([River(path) for path in files])
+        np.testing.assert_array_equal(streamed[0], erosion)
+        np.testing.assert_array_equal(streamed[1], accretion)
+
+    def test_change_rasters(self):
+        stream_erosion([River(path) for path in self.files], output_folder=self.folder)
+        for previous_path, current_path in zip(self.files[:-1], self.files[1:]):
+            previous = np.asarray(River(previous_path).mask).astype(np.int8)
+            current = np.asarray(River(current_path).mask).astype(np.int8)
+            name = os.path.splitext(os.path.basename(current_path))[0] + '_change.tif'
+            with rasterio.open(os.path.join(self.folder, name)) as dataset:
+                np.testing.assert_array_equal(dataset.read(1), np.sign(current - previous))
+
+    def test_shape_mismatch(self):
+        files = bundled_files(1, 1986, 1986) + bundled_files(2, 1987, 1987)
+        with self.assertRaises(ValueError):
+            stream_erosion([River(path) for path in files])
+
+
+class TestPackedErosion(unittest.TestCase):
+
+    def test_packed_matches_unpacked(self):
+        files = bundled_files(2, 1986, 1992)
+        erosion, accretion = reference_erosion(files)
+        rivers = [River(path) for path in files]
+        for river in rivers:
+            river.load_mask(packed=True)
+        River.quantify_erosion(rivers)
+        np.testing.assert_array_equal([river.erosion for river in rivers[1:]], erosion)
+        np.testing.assert_array_equal([river.accretion for river in rivers[1:]], accretion)
+
+    def test_stack_matches_rivers(self):
+        files = bundled_files(2, 1986, 1992)
+        erosion, accretion = reference_erosion(files)
+        stacked = RiverStack.from_files(files).quantify_erosion()
+        np.testing.assert_array_equal(stacked[0], erosion)
+        np.testing.assert_array_equal(stacked[1], accretion)
+
+
+if __name__ == '__main__':
+    unittest.main()
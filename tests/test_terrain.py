@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+"""Tests for the slope computed from the bundled elevation rasters."""
+
+import os
+import unittest
+
+import numpy as np
+import rasterio
+
+from river_change_analysis.terrain import compute_slope
+
+MASK_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'binary_river_masks')
+# The tolerance documented in compute_slope
+MEAN_DIFFERENCE = 0.12
+P99_DIFFERENCE = 1.8
+
+
+def slope_difference(reach):
+    """Absolute difference between compute_slope and the exported ee.Terrain.slope of a bundled reach."""
+    base = os.path.join(MASK_FOLDER, f'Athabasca_Reach_{reach}', f'Athabasca_River_Reach_{reach}_')
+    with rasterio.open(base + 'elevation.tif') as dataset:
+        slope = compute_slope(dataset.read(1), dataset.transform, dataset.crs)
+    with rasterio.open(base + 'slope.tif') as dataset:
+        expected = dataset.read(1).astype(np.float32)
+    defined = np.isfinite(slope) & np.isfinite(expected)
+    return np.abs(slope - expected)[defined]
+
+
+class TestComputeSlope(unittest.TestCase):
+
+    def test_matches_earth_engine_slope(self):
+        differences = []
+        for reach in (1, 2):
+            difference = slope_difference(reach)
+            self.assertGreater(len(difference), 10000)
+            self.assertLess(difference.mean(), MEAN_DIFFERENCE + 0.005)
+            self.assertLess(np.percentile(difference, 99), P99_DIFFERENCE)
+            differences.append(difference)
+        pooled = np.concatenate(differences)
+        self.assertAlmostEqual(pooled.mean(), MEAN_DIFFERENCE, delta=0.005)
+        self.assertAlmostEqual(np.percentile(pooled, 99), P99_DIFFERENCE, delta=0.1)
+
+    def test_edges_and_missing_elevation_are_undefined(self):
+        elevation = np.arange(48, dtype=np.int16).reshape(6, 8) + 100
+        elevation[3, 4] = 0
+        transform = rasterio.transform.Affine(30, 0, 500000, 0, -30, 6000000)
+        slope = compute_slope(elevation, transform, rasterio.crs.CRS.from_epsg(32612))
+        self.assertTrue(np.isnan(slope[0]).all() and np.isnan(slope[:, -1]).all())
+        self.assertTrue(np.isnan(slope[2:5, 3:6][[0, 1, 1, 2], [1, 0, 2, 1]]).all())
+        # A plane rising 1 m per column and 8 m per row of 30 m
+        self.assertAlmostEqual(float(slope[1, 1]), np.degrees(np.arctan(np.hypot(1, 8) / 30)), places=4)
+
+
+if __name__ == '__main__':
+    unittest.main()
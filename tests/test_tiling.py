@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""Tests for the tiled water mask and centerline processing."""
+
+import glob
+import os
+import unittest
+
+import numpy as np
+from scipy.ndimage import gaussian_filter
+from skimage.morphology import thin
+
+from river_change_analysis.river import River, WATER_MASK_MIN_SIZE, MAX_DISTANCE_BRANCH_REMOVAL, prune_skeleton
+from river_change_analysis.tiling import centerline_halo, process_tiled, tiled_centerline, tiled_water_mask
+
+MASK_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'binary_river_masks')
+# Tile sizes that do not divide either side of the bundled masks
+TILE_SIZES = (97, 300, 257)
+
+
+def untiled(file_path, min_size=WATER_MASK_MIN_SIZE, max_distance=MAX_DISTANCE_BRANCH_REMOVAL):
+    river = River(file_path)
+    River.water_mask_process(river, min_size)
+    River.process_centerline(river, max_distance)
+    return river
+
+
+class TestTiling(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.files = [glob.glob(os.path.join(MASK_FOLDER, 'Athabasca_Reach_1', '*_river_mask1986.tif'))[0],
+                     glob.glob(os.path.join(MASK_FOLDER, 'Athabasca_Reach_2', '*_river_mask2010.tif'))[0]]
+        cls.rivers = [untiled(file_path) for file_path in cls.files]
+
+    def test_water_mask_matches_untiled(self):
+        for river in self.rivers:
+            mask = np.asarray(river.mask)
+            for tile_size in TILE_SIZES:
+                np.testing.assert_array_equal(tiled_water_mask(mask, WATER_MASK_MIN_SIZE, tile_size, workers=1),
+                                              np.asarray(river.watermask))
+
+    def test_small_holes_crossing_tiles(self):
+        # Holes of 64 pixels, filled with min_size 100 unless a tile seam splits their area
+        mask = np.ones((50, 70), dtype=np.uint8)
+        mask[10:18, 10:18] = 0
+        mask[30:38, 41:49] = 0
+        mask[:, 60:] = 0
+        filled = mask.copy()
+        filled[10:18, 10:18] = 1
+        filled[30:38, 41:49] = 1
+        for tile_size in (7, 13, 14, 33):
+            np.testing.assert_array_equal(tiled_water_mask(mask, 100, tile_size, workers=1), filled)
+
+    def test_centerline_matches_untiled(self):
+        for river in self.rivers:
+            watermask = np.asarray(river.watermask)
+            for tile_size in TILE_SIZES:
+                np.testing.assert_array_equal(
+                    tiled_centerline(watermask, MAX_DISTANCE_BRANCH_REMOVAL, tile_size, workers=1),
+                    np.asarray(river.centerline))
+
+    def test_wide_water_matches_untiled(self):
+        # Blobs of water far wider than the bundled channels
+        for seed in (0, 2):
+            watermask = (gaussian_filter(np.random.default_rng(seed).random((400, 400)), 24) > 0.5).astype(np.uint8)
+            halo = centerline_halo(watermask)
+            expected = prune_skeleton(thin(watermask), MAX_DISTANCE_BRANCH_REMOVAL)
+            # A fixed 64 pixel halo is too small for these masks
+            self.assertFalse(np.array_equal(
+                tiled_centerline(watermask, MAX_DISTANCE_BRANCH_REMOVAL, 97, halo=64, workers=1), expected))
+            for tile_size in (halo + 1, 97):
+                np.testing.assert_array_equal(
+                    tiled_centerline(watermask, MAX_DISTANCE_BRANCH_REMOVAL, tile_size, workers=1), expected)
+
+    def test_wide_channel_matches_untiled(self):
+        watermask = np.zeros((240, 500), dtype=np.uint8)
+        watermask[60:180, :] = 1
+        watermask[100:110, 200:230] = 0
+        self.assertGreater(centerline_halo(watermask), 100)
+        np.testing.assert_array_equal(tiled_centerline(watermask, 20, 150, workers=1),
+                                      prune_skeleton(thin(watermask), 20))
+
+    def test_process_tiled_matches_untiled(self):
+        rivers = [River(file_path) for file_path in self.files]
+        process_tiled(rivers, WATER_MASK_MIN_SIZE, MAX_DISTANCE_BRANCH_REMOVAL, tile_size=300, workers=2)
+        for river, expected in zip(rivers, self.rivers):
+            np.testing.assert_array_equal(np.asarray(river.watermask), np.asarray(expected.watermask))
+            np.testing.assert_array_equal(np.asarray(river.centerline), np.asarray(expected.centerline))
+
+
+if __name__ == '__main__':
+    unittest.main()
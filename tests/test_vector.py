@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""Tests for tracing centerlines into ordered, georeferenced lines and writing them to GeoJSON."""
+
+import json
+import math
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from rasterio.crs import CRS
+from rasterio.transform import Affine
+from shapely.geometry import LineString
+
+from river_change_analysis.river import River
+from river_change_analysis.skeleton import SkeletonGraph
+from river_change_analysis.vector import orient, trace_centerline, write_geojson
+
+TRANSFORM = Affine(30, 0, 500000, 0, -30, 6000000)
+
+
+def bend():
+    """A channel running down from row 2 then diagonally to the bottom right, without junctions."""
+    skeleton = np.zeros((40, 30), dtype=bool)
+    skeleton[2:21, 5] = True
+    for step in range(1, 11):
+        skeleton[20 + step, 5 + step] = True
+    return skeleton
+
+
+def center(row, col):
+    return (500000 + (col + 0.5) * 30, 6000000 - (row + 0.5) * 30)
+
+
+class TestTraceCenterline(unittest.TestCase):
+
+    def test_bend(self):
+        line = trace_centerline(SkeletonGraph.from_raster(bend()), TRANSFORM)
+        # Without elevation the line starts at its topmost end
+        self.assertEqual(line.coords[0], center(2, 5))
+        self.assertEqual(line.coords[-1], center(30, 15))
+        self.assertEqual(len(line.coords), 29)
+        self.assertAlmostEqual(line.length, 30 * (18 + 10 * math.sqrt(2)))
+
+    def test_side_channels_are_left_out(self):
+        skeleton = bend()
+        skeleton[10, 6:12] = True
+        line = trace_centerline(SkeletonGraph.from_raster(skeleton), TRANSFORM)
+        self.assertEqual((line.coords[0], line.coords[-1]), (center(2, 5), center(30, 15)))
+        self.assertNotIn(center(10, 11), list(line.coords))
+
+    def test_elevation(self):
+        graph = SkeletonGraph.from_raster(bend())
+        # Higher at the bottom, so the river flows up the raster
+        elevation = np.repeat(np.arange(40, dtype=float)[:, None], 30, axis=1)
+        line = trace_centerline(graph, TRANSFORM, elevation)
+        self.assertEqual(line.coords[0], center(30, 15))
+        # Unusable elevations fall back to the topmost end
+        for unusable in (elevation[:20], np.full((40, 30), np.nan), np.zeros((40, 30))):
+            self.assertEqual(trace_centerline(graph, TRANSFORM, unusable).coords[0], center(2, 5))
+
+    def test_empty(self):
+        for skeleton in (np.zeros((10, 10), dtype=bool), np.eye(10, dtype=bool)[:1]):
+            self.assertTrue(trace_centerline(SkeletonGraph.from_raster(skeleton), TRANSFORM).is_empty)
+
+
+class TestOrient(unittest.TestCase):
+
+    def test_orient(self):
+        line = LineString([(0, 0), (10, 0), (10, 10)])
+        self.assertIs(orient(line, (-5, 1)), line)
+        self.assertEqual(list(orient(line, (12, 14)).coords), [(10, 10), (10, 0), (0, 0)])
+        self.assertTrue(orient(LineString(), (0, 0)).is_empty)
+
+
+class TestWriteGeojson(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.folder, 'centerlines.geojson')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_write(self):
+        lines = [LineString([(500000.123456, 6000000.987654), (500030.5, 5999970.25)]), LineString()]
+        properties = [{'year': '1986'}, {'year': '1987'}]
+        self.assertEqual(write_geojson(lines, self.file_path, properties, 'EPSG:32612'), self.file_path)
+        with open(self.file_path) as file:
+            collection = json.load(file)
+        self.assertEqual(collection['type'], 'FeatureCollection')
+        self.assertEqual(collection['crs']['properties']['name'], 'EPSG:32612')
+        first, second = collection['features']
+        self.assertEqual(first['geometry']['coordinates'], [[500000.12, 6000000.99], [500030.5, 5999970.25]])
+        self.assertEqual(first['properties'], {'year': '1986'})
+        self.assertEqual(second['geometry'], {'type': 'LineString', 'coordinates': []})
+
+    def test_defaults(self):
+        write_geojson([LineString([(0.1234, 0), (1, 1)])], self.file_path, precision=3)
+        with open(self.file_path) as file:
+            collection = json.load(file)
+        self.assertNotIn('crs', collection)
+        self.assertEqual(collection['features'][0]['properties'], {})
+        self.assertEqual(collection['features'][0]['geometry']['coordinates'][0], [0.123, 0])
+
+    def test_export_centerlines(self):
+        rivers = []
+        for year, offset in (('1986', 0), ('1987', 1)):
+            river = River(None)
+            river.centerline = np.roll(bend(), offset, axis=1)
+            river.transform = TRANSFORM
+            river.crs = CRS.from_epsg(32612)
+            river.year = year
+            rivers.append(river)
+        River.export_centerlines(rivers, self.file_path, upstream=center(35, 20))
+        with open(self.file_path) as file:
+            collection = json.load(file)
+        self.assertEqual(collection['crs']['properties']['name'], 'EPSG:32612')
+        for feature, offset in zip(collection['features'], (0, 1)):
+            # Oriented to start at the end nearest the upstream point
+            self.assertEqual(tuple(feature['geometry']['coordinates'][0]), center(30, 15 + offset))
+            self.assertAlmostEqual(feature['properties']['length'], 30 * (18 + 10 * math.sqrt(2)))
+            self.assertGreater(feature['properties']['sinuosity'], 1)
+        self.assertEqual([feature['properties']['year'] for feature in collection['features']], ['1986', '1987'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+"""Tests for the water mask hole filling."""
+
+import glob
+import os
+import unittest
+
+import numpy as np
+from skimage import measure
+
+from river_change_analysis.river import River, close_mask, fill_water_mask
+
+MASK_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'binary_river_masks')
+
+
+def fill_each_region(mask, min_size):
+    """Reference: fill every small background region one at a time, as before the area lookup."""
+    watermask = close_mask(mask)
+    labels = measure.label(watermask == 0)
+    for region in measure.regionprops(labels):
+        if region.area < min_size:
+            watermask[labels == region.label] = 1
+    return watermask
+
+
+class TestFillWaterMask(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        files = sorted(glob.glob(os.path.join(MASK_FOLDER, 'Athabasca_Reach_*', '*_river_mask199[05].tif')))
+        cls.masks = [np.asarray(River(file_path).mask) for file_path in files]
+
+    def test_matches_region_loop(self):
+        for mask in self.masks:
+            for min_size in (1, 50, 1000, 20000):
+                np.testing.assert_array_equal(fill_water_mask(mask, min_size), fill_each_region(mask, min_size))
+
+    def test_matches_region_loop_on_random_mask(self):
+        rng = np.random.default_rng(1)
+        mask = (rng.random((120, 90)) < 0.6).astype(np.uint8)
+        np.testing.assert_array_equal(fill_water_mask(mask, 30), fill_each_region(mask, 30))
+
+    def test_default_min_size(self):
+        mask = self.masks[0]
+        np.testing.assert_array_equal(fill_water_mask(mask, None), fill_water_mask(mask, 1000))
+
+    def test_keeps_input(self):
+        mask = self.masks[0].copy()
+        fill_water_mask(mask, 1000)
+        np.testing.assert_array_equal(mask, self.masks[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""Tests for the channel width sampled along the centerline."""
+
+import glob
+import os
+import unittest
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from river_change_analysis.river import River
+from river_change_analysis.width import channel_width
+
+MASK_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'binary_river_masks')
+
+
+def processed_rivers(reach, years):
+    rivers = []
+    for year in years:
+        river = River(glob.glob(os.path.join(MASK_FOLDER, f'Athabasca_Reach_{reach}', f'*_river_mask{year}.tif'))[0])
+        river.load_mask()
+        rivers.append(river)
+    River.process_centerline(rivers, None)
+    return rivers
+
+
+def nearest_bank_widths(watermask, pixels, sampling):
+    """Reference: twice the distance from each sampled pixel to the nearest pixel outside the water."""
+    bank_rows, bank_cols = np.nonzero(watermask == 0)
+    rows, cols = np.unravel_index(pixels, watermask.shape)
+    tree = cKDTree(np.column_stack((bank_rows * sampling[0], bank_cols * sampling[1])))
+    distances, _ = tree.query(np.column_stack((rows * sampling[0], cols * sampling[1])))
+    return 2 * distances
+
+
+class TestChannelWidth(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.rivers = processed_rivers(1, (1995, 1993, 1994))
+
+    def test_matches_reference(self):
+        width = channel_width(self.rivers, workers=1)
+        np.testing.assert_array_equal(width['years'], [1993, 1994, 1995])
+        rivers = sorted(self.rivers, key=lambda river: int(river.year))
+        for i, river in enumerate(rivers):
+            watermask = np.asarray(river.watermask)
+            np.testing.assert_array_equal(width['pixels'][i], np.flatnonzero(np.asarray(river.centerline)))
+            expected = nearest_bank_widths(watermask, width['pixels'][i], river.pixel_sampling(watermask.shape))
+            np.testing.assert_allclose(width['widths'][i], expected, rtol=1e-5)
+            self.assertAlmostEqual(width['mean'][i], expected.mean(), delta=1e-5 * expected.mean())
+            self.assertAlmostEqual(width['max'][i], expected.max(), delta=1e-5 * expected.max())
+
+    def test_workers_match_single_process(self):
+        single = channel_width(self.rivers, workers=1)
+        pooled = channel_width(self.rivers, workers=2)
+        for key in ('count', 'mean', 'median', 'p90', 'max'):
+            np.testing.assert_array_equal(pooled[key], single[key])
+        for pooled_widths, single_widths in zip(pooled['widths'], single['widths']):
+            np.testing.assert_array_equal(pooled_widths, single_widths)
+
+    def test_profile(self):
+        width = channel_width(self.rivers, workers=1, profile=True)
+        rivers = sorted(self.rivers, key=lambda river: int(river.year))
+        for river, pixels, chainage, widths in zip(rivers, width['pixels'], width['chainage'], width['widths']):
+            self.assertEqual(len(pixels), len(chainage))
+            self.assertEqual(chainage[0], 0)
+            self.assertTrue(np.all(np.diff(chainage) > 0))
+            # Every profile pixel is on the centerline and gets the width of that pixel
+            self.assertTrue(np.asarray(river.centerline).ravel()[pixels].all())
+            np.testing.assert_array_equal(widths, 2 * river.watermask_distance.ravel()[pixels])
+
+    def test_quantify_width_sets_mean(self):
+        width = River.quantify_width(self.rivers, workers=1)
+        rivers = sorted(self.rivers, key=lambda river: int(river.year))
+        self.assertEqual([river.width for river in rivers], [float(mean) for mean in width['mean']])
+
+
+if __name__ == '__main__':
+    unittest.main()
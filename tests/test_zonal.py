@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""Tests for the erosion and accretion tables by elevation and slope class."""
+
+import glob
+import os
+import unittest
+
+import numpy as np
+
+from river_change_analysis.river import River
+from river_change_analysis.stack import RiverStack
+from river_change_analysis.zonal import bin_edges, zonal_change, zonal_erosion, zone_raster
+
+MASK_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'binary_river_masks')
+
+
+class TestZonalErosion(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        files = sorted(glob.glob(os.path.join(MASK_FOLDER, 'Athabasca_Reach_2', '*_river_mask199[0-5].tif')))
+        cls.files = files
+        cls.stack = RiverStack.from_files(files)
+        rng = np.random.default_rng(2)
+        shape = cls.stack.cube.shape[1:]
+        rows, cols = np.indices(shape)
+        cls.elevation = 300 + 0.05 * cols - 0.1 * rows + rng.normal(0, 2, shape)
+        cls.slope = rng.uniform(0, 30, shape)
+
+    def test_all_zones_sum_to_quantify_erosion(self):
+        erosion, accretion = self.stack.quantify_erosion()
+        zonal = self.stack.zonal_erosion(self.elevation, self.slope)
+        np.testing.assert_allclose(zonal['erosion'].sum(axis=1), erosion, rtol=1e-12)
+        np.testing.assert_allclose(zonal['accretion'].sum(axis=1), accretion, rtol=1e-12)
+        np.testing.assert_allclose(zonal['area'].sum(), self.elevation.size * 30**2 / 1000000)
+        np.testing.assert_array_equal(zonal['years'], np.column_stack((self.stack.years[:-1], self.stack.years[1:])))
+
+    def test_matches_zone_by_zone_counts(self):
+        elevation = self.elevation.copy()
+        elevation[:20, :300] = np.nan
+        slope = self.slope.copy()
+        slope[100:, 1000:] = np.nan
+        elevation_edges = bin_edges(elevation, 4)
+        slope_edges = bin_edges(slope, (0, 5, 15, 90))
+        zones = zone_raster(elevation, slope, elevation_edges, slope_edges)
+        cube = self.stack.cube.astype(bool)
+        erosion, accretion = zonal_change(self.stack.cube, zones, 12, block_pixels=5000)
+        for zone in range(12):
+            inside = zones == zone
+            for pair in range(len(cube) - 1):
+                previous, current = cube[pair][inside], cube[pair + 1][inside]
+                self.assertEqual(erosion[pair, zone], np.count_nonzero(previous & ~current))
+                self.assertEqual(accretion[pair, zone], np.count_nonzero(current & ~previous))
+        # Pixels without an elevation or slope are not counted
+        valid = zones >= 0
+        self.assertEqual(erosion.sum(), np.count_nonzero(cube[:-1, valid] & ~cube[1:, valid]))
+        np.testing.assert_array_equal(zones[np.isnan(elevation) | np.isnan(slope)], -1)
+
+    def test_rivers_match_stack(self):
+        rivers = [River(file_path) for file_path in self.files]
+        for river in rivers[::2]:
+            river.load_mask(packed=True)
+        for river in rivers[1::2]:
+            river.load_mask()
+        from_rivers = zonal_erosion(rivers[::-1], self.elevation, self.slope, elevation_bins=3)
+        from_stack = zonal_erosion(self.stack, self.elevation, self.slope, elevation_bins=3)
+        for key in ('years', 'erosion', 'accretion', 'area', 'elevation_edges', 'slope_edges'):
+            np.testing.assert_array_equal(from_rivers[key], from_stack[key])
+
+    def test_per_pair_erosion_of_rivers(self):
+        rivers = [River(file_path) for file_path in self.files]
+        River.quantify_erosion(rivers)
+        zonal = zonal_erosion(rivers, self.elevation, self.slope)
+        np.testing.assert_allclose(zonal['erosion'].sum(axis=1), [river.erosion for river in rivers[1:]], rtol=1e-12)
+        np.testing.assert_allclose(zonal['accretion'].sum(axis=1), [river.accretion for river in rivers[1:]],
+                                   rtol=1e-12)
+
+    def test_invalid_inputs(self):
+        with self.assertRaises(ValueError):
+            bin_edges(self.slope, (0, 10, 5))
+        with self.assertRaises(ValueError):
+            zonal_erosion(self.stack, self.elevation[1:], self.slope[1:])
+
+
+if __name__ == '__main__':
+    unittest.main()